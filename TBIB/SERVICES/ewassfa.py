@@ -3,23 +3,24 @@ E-Wassfa Service - Ordonnances électroniques sécurisées.
 
 Fonctionnalités :
 - Génération de tokens uniques (8 caractères)
-- Signature HMAC-SHA256 (anti-falsification)
-- Génération de QR Codes pour pharmaciens
+- Signature HMAC-SHA256 (anti-falsification), clés versionnées (rotation)
+- Génération de QR Codes pour pharmaciens (SVG / PNG, mis en cache)
 - Validation d'ordonnances (expiry, usage)
+- Délivrance atomique + journal des délivrances
 
 Conformité : Loi 18-07 (Souveraineté des données médicales)
 """
 
 import secrets
 import hmac
-import hashlib
 import json
 from datetime import datetime, timedelta
-import qrcode
-import io
 import base64
-from flask import current_app
-from models import Prescription
+from sqlalchemy import String, case, func, insert, literal, select, update
+from extensions import db
+from models import Prescription, PrescriptionDispensation
+from utils import signing
+from utils.qr_cache import qr_cache
 
 
 class EWassfaService:
@@ -55,26 +56,63 @@ class EWassfaService:
     # ========================================================================
 
     @staticmethod
-    def create_hmac_signature(doctor_id, patient_id, medications, timestamp):
+    def signed_header(doctor_id, patient_id, timestamp, key_id):
+        """En-tête canonique signé avant le texte des médicaments."""
+        return f"{doctor_id}|{patient_id}|{timestamp}|{key_id}\n"
+
+    @staticmethod
+    def sign_prescription(doctor_id, patient_id, medications, timestamp):
+        """
+        Signe avec la clé active du trousseau : HMAC(en-tête + médicaments en UTF-8).
+
+        Returns:
+            (signature, key_id, en-tête) : les trois sont stockés sur l'ordonnance
+        """
+        key_id = signing.active_key_id()
+        header = EWassfaService.signed_header(doctor_id, patient_id, timestamp, key_id)
+        mac = signing.mac(key_id)
+        mac.update(header.encode())
+        mac.update((medications or '').encode())
+        return mac.hexdigest(), key_id, header
+
+    @staticmethod
+    def verify_signature(prescription):
         """
-        Crée une signature HMAC-SHA256 pour l'ordonnance.
+        Signature de l'ordonnance intacte ? Comparaison en temps constant.
 
-        ⚠️  SÉCURITÉ CRITIQUE : Ne JAMAIS modifier cette fonction sans audit.
+        Ordonnances signées via le trousseau : l'en-tête stocké est rejoué tel
+        quel (pas de timestamp recalculé depuis created_at, pas de JSON) et doit
+        correspondre au médecin, au patient et à la clé de la ligne.
         """
+        expected = prescription.security_hash or ''
+        if prescription.key_id is None:
+            return hmac.compare_digest(EWassfaService._legacy_signature(prescription), expected)
+
+        header = prescription.signed_header or ''
+        parts = header.rstrip('\n').split('|')
+        if len(parts) != 4 or parts[0] != str(prescription.doctor_id) \
+                or parts[1] != str(prescription.patient_id) or parts[3] != prescription.key_id:
+            return False
+        try:
+            mac = signing.mac(prescription.key_id)
+        except signing.UnknownSigningKey:
+            return False
+        mac.update(header.encode())
+        mac.update((prescription.medications or '').encode())
+        return hmac.compare_digest(mac.hexdigest(), expected)
+
+    @staticmethod
+    def _legacy_signature(prescription):
+        # Ordonnances antérieures au trousseau : payload JSON, timestamp repris de created_at
         payload = {
-            'doctor_id': doctor_id,
-            'patient_id': patient_id,
-            'medications': medications,
-            'timestamp': timestamp
+            'doctor_id': prescription.doctor_id,
+            'patient_id': prescription.patient_id,
+            'medications': prescription.medications,
+            'timestamp': int(prescription.created_at.timestamp())
         }
-        payload_str = json.dumps(payload, sort_keys=True)
-        signature = hmac.new(
-            current_app.config['SECRET_KEY'].encode(),
-            payload_str.encode(),
-            hashlib.sha256
-        ).hexdigest()
-
-        return signature
+        mac = signing.legacy_mac()
+        mac.update(json.dumps(payload, sort_keys=True).encode())
+        return mac.hexdigest()
 
     # ========================================================================
     # QR CODE GENERATION (SCAN PHARMACIEN)
@@ -82,17 +120,14 @@ class EWassfaService:
 
     @staticmethod
     def generate_qr_code(verify_url):
-        """Génère un QR Code encodé en base64."""
-        qr = qrcode.QRCode(version=1, box_size=10, border=2)
-        qr.add_data(verify_url)
-        qr.make(fit=True)
+        """Génère un QR Code PNG encodé en base64 (servi depuis le cache QR)."""
+        png, _ = qr_cache.get(verify_url, 'png')
+        return base64.b64encode(png).decode()
 
-        img = qr.make_image(fill_color="black", back_color="white")
-        buf = io.BytesIO()
-        img.save(buf, format='PNG')
-        qr_code_base64 = base64.b64encode(buf.getvalue()).decode()
-
-        return qr_code_base64
+    @staticmethod
+    def render_qr(verify_url, fmt='svg'):
+        """QR Code brut (SVG par défaut, ou PNG) et son ETag, depuis le cache QR."""
+        return qr_cache.get(verify_url, fmt)
 
     # ========================================================================
     # VALIDATION (EXPIRY + USAGE)
@@ -116,3 +151,88 @@ class EWassfaService:
             'is_valid': is_valid,
             'error_message': error_message
         }
+
+    # ========================================================================
+    # DÉLIVRANCE (INCRÉMENT ATOMIQUE + JOURNAL)
+    # ========================================================================
+
+    @staticmethod
+    def dispense(token, pharmacy_ref=None, now=None):
+        """
+        Enregistre une délivrance. Ne commit pas.
+
+        Un seul UPDATE conditionnel (usage_count < max_usage, non expirée, non
+        servie) incrémente le compteur : deux terminaux qui scannent la même
+        ordonnance ne perdent pas d'incrément et ne dépassent jamais max_usage.
+        Le statut passe à 'dispensed' à la dernière utilisation autorisée.
+        En PostgreSQL, UPDATE et ligne de journal partent en une requête (CTE).
+
+        Returns:
+            (numéro d'utilisation, None) si délivrée, sinon
+            (None, 'not_found' | 'dispensed' | 'expired')
+        """
+        now = now or datetime.utcnow()
+        table = Prescription.__table__
+        ledger = PrescriptionDispensation.__table__
+        new_count = func.coalesce(table.c.usage_count, 0) + 1
+
+        used = update(table).where(
+            table.c.token == token,
+            table.c.status != 'dispensed',
+            func.coalesce(table.c.usage_count, 0) < table.c.max_usage,
+            table.c.expiry_date > now
+        ).values(
+            usage_count=new_count,
+            last_verified_at=now,
+            status=case((new_count >= table.c.max_usage, 'dispensed'), else_=table.c.status)
+        )
+        columns = ['prescription_id', 'usage_number', 'dispensed_at', 'pharmacy_ref']
+
+        dialect = db.session.get_bind().dialect
+        if dialect.name == 'postgresql':
+            used = used.returning(table.c.id, table.c.usage_count).cte('used')
+            usage_number = db.session.execute(
+                insert(ledger).from_select(columns, select(
+                    used.c.id, used.c.usage_count, literal(now), literal(pharmacy_ref, String)
+                )).returning(ledger.c.usage_number)
+            ).scalar()
+        else:
+            row = EWassfaService._apply_usage(used, token)
+            usage_number = None
+            if row is not None:
+                prescription_id, usage_number = row
+                db.session.execute(insert(ledger).values(
+                    prescription_id=prescription_id, usage_number=usage_number,
+                    dispensed_at=now, pharmacy_ref=pharmacy_ref
+                ))
+
+        if usage_number is not None:
+            return usage_number, None
+        return None, EWassfaService._refusal_reason(token, now)
+
+    @staticmethod
+    def _apply_usage(statement, token):
+        table = Prescription.__table__
+        if db.session.get_bind().dialect.update_returning:
+            return db.session.execute(statement.returning(table.c.id, table.c.usage_count)).first()
+
+        # Sans RETURNING : l'UPDATE tient déjà le verrou, la relecture est sûre
+        if db.session.execute(statement).rowcount == 0:
+            return None
+        return db.session.execute(
+            select(table.c.id, table.c.usage_count).where(table.c.token == token)
+        ).first()
+
+    @staticmethod
+    def _refusal_reason(token, now):
+        """Pourquoi l'UPDATE n'a touché aucune ligne (chemin d'échec seulement)."""
+        row = db.session.execute(
+            select(Prescription.status, Prescription.usage_count, Prescription.max_usage,
+                   Prescription.expiry_date).where(Prescription.token == token)
+        ).first()
+        if row is None:
+            return 'not_found'
+        status, usage_count, max_usage, expiry_date = row
+        if status == 'dispensed' or (usage_count or 0) >= max_usage:
+            return 'dispensed'
+        return 'expired'
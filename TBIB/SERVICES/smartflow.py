@@ -9,10 +9,9 @@ Fonctionnalités :
 """
 
 from models import Appointment, User
-from extensions import db
 from datetime import datetime, date, timedelta
-from sqlalchemy import func
 from utils.smart_engine import QueueOptimizer
+from utils.queue_counter import next_queue_number
 
 
 class SmartFlowService:
@@ -158,9 +157,4 @@ class SmartFlowService:
         Returns:
             int: Prochain numéro (ex: 5)
         """
-        max_queue = db.session.query(func.max(Appointment.queue_number)).filter(
-            Appointment.doctor_id == doctor_id,
-            Appointment.appointment_date == appointment_date
-        ).scalar() or 0
-
-        return max_queue + 1
+        return next_queue_number(doctor_id, appointment_date)
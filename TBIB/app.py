@@ -1,6 +1,11 @@
 import os
 import logging
 from logging.handlers import RotatingFileHandler
+
+# TBIB_PROFILE_STARTUP=1 : temps d'import par module et d'initialisation par extension
+from utils.startup_profile import startup_profile
+startup_profile.start()
+
 from flask import Flask, session, render_template, request, jsonify
 from extensions import db, migrate, login_manager, babel, csrf
 from dotenv import load_dotenv
@@ -27,6 +32,7 @@ def configure_logging(app):
         app.logger.info('TBIB startup')
 
 def create_app():
+    startup_profile.start()
     app = Flask(__name__)
 
     # Ensure instance folder exists
@@ -45,6 +51,30 @@ def create_app():
     app.config['SQLALCHEMY_TRACK_MODIFICATIONS'] = False
     app.config['SQLALCHEMY_ENGINE_OPTIONS'] = {'pool_pre_ping': True}
 
+    # Cache partagé des files d'attente (ex: redis://localhost:6379/0) ;
+    # sans valeur, cache en mémoire propre à chaque worker
+    app.config['QUEUE_CACHE_URL'] = os.environ.get('QUEUE_CACHE_URL')
+
+    # Trousseau de signature E-Wassfa (rotation) : "k1:secret1,k2:secret2" ;
+    # vide = une seule clé dérivée de SECRET_KEY
+    from utils.signing import parse_keys
+    app.config['EWASSFA_SIGNING_KEYS'] = parse_keys(os.environ.get('EWASSFA_SIGNING_KEYS'))
+    app.config['EWASSFA_ACTIVE_KEY_ID'] = os.environ.get('EWASSFA_ACTIVE_KEY_ID')
+
+    # Ticket live en SSE : un flux occupe un thread jusqu'à LIVE_STREAM_MAX_SECONDS.
+    # Non défini = seulement si le serveur WSGI est multithread (gthread, serveur de dev) ;
+    # 'true' pour un worker asynchrone (gevent), 'false' pour imposer le polling
+    live_stream = os.environ.get('LIVE_STREAM_ENABLED')
+    app.config['LIVE_STREAM_ENABLED'] = None if live_stream is None else live_stream.lower() in ('true', '1', 't')
+
+    # Adresse publique du site (ex: https://tbib.dz), encodée dans les QR des ordonnances
+    # à la place de l'en-tête Host de la requête
+    app.config['PUBLIC_BASE_URL'] = os.environ.get('PUBLIC_BASE_URL')
+
+    # QR codes E-Wassfa déjà rendus : en mémoire (LRU), et sur disque si défini
+    # (seulement avec PUBLIC_BASE_URL ou SERVER_NAME, voir utils/qr_cache)
+    app.config['QR_CACHE_DIR'] = os.environ.get('QR_CACHE_DIR')
+
     # Gestion du mode DEBUG
     app.config['DEBUG'] = os.environ.get('DEBUG', 'False').lower() in ('true', '1', 't')
 
@@ -57,18 +87,62 @@ def create_app():
     # Désactive CSRF pour les routes API publiques (scan QR pharmacie)
     # Sécurité assurée par HMAC (pharmacy_routes.py) + API Key + expiration DB
     # Note: Flask-WTF requires endpoint names, not URL patterns.
-    app.config['WTF_CSRF_EXEMPT_LIST'] = ['pharmacy_routes.verify_prescription', 'pharmacy_routes.dispense_prescription', 'prescription_routes.verify_prescription']
+    app.config['WTF_CSRF_EXEMPT_LIST'] = ['pharmacy_routes.verify_prescription', 'pharmacy_routes.dispense_prescription', 'pharmacy_routes.verify_prescriptions_batch', 'prescription_routes.verify_prescription']
     # Manually exempt views because installed Flask-WTF ignores the config list.
     # We use module paths (e.g. 'prescription_routes.verify_prescription') because csrf.exempt(str) expects 'module.function'.
     for view_location in app.config['WTF_CSRF_EXEMPT_LIST']:
         csrf.exempt(view_location)
 
-    db.init_app(app)
-    migrate.init_app(app, db)
-    login_manager.init_app(app)
-    babel.init_app(app, locale_selector=get_locale)
-    csrf.init_app(app) # Enable CSRF protection
-    login_manager.login_view = 'main.login'
+    with startup_profile.step('extensions'):
+        db.init_app(app)
+        migrate.init_app(app, db)
+        login_manager.init_app(app)
+        babel.init_app(app, locale_selector=get_locale)
+        csrf.init_app(app) # Enable CSRF protection
+        login_manager.login_view = 'main.login'
+
+    with startup_profile.step('queue_events'):
+        from utils.queue_events import queue_events
+        queue_events.init_app(app)
+
+    with startup_profile.step('doctor_search'):
+        from utils import doctor_search
+        doctor_search.init_app(app)
+
+    with startup_profile.step('facet_cache'):
+        from utils.facets import facet_cache
+        facet_cache.init_app(app)
+
+    with startup_profile.step('patient_roster'):
+        from utils import patient_roster
+        patient_roster.init_app(app)
+
+    with startup_profile.step('qr_cache'):
+        from utils.qr_cache import qr_cache
+        qr_cache.init_app(app)
+
+    with startup_profile.step('prescription_sweeper'):
+        from utils import prescription_sweeper
+        prescription_sweeper.init_app(app)
+
+    with startup_profile.step('rollups'):
+        from utils import rollups
+        rollups.init_app(app)
+
+    # Libellés de l'interface : catalogues compilés chargés par langue, t() dans les gabarits
+    with startup_profile.step('i18n'):
+        from utils import i18n
+        i18n.init_app(app)
+
+    # Fichiers statiques empreintés et précompressés (flask assets-build)
+    with startup_profile.step('assets'):
+        from utils.assets import assets
+        assets.init_app(app)
+
+    # Cache HTTP par route (no-store par défaut) et URLs statiques versionnées
+    with startup_profile.step('http_cache'):
+        from utils import http_cache
+        http_cache.init_app(app)
 
     configure_logging(app)
 
@@ -83,39 +157,34 @@ def create_app():
         if 'lang' not in session:
             session['lang'] = 'fr'
 
-    @app.after_request
-    def add_cache_control(response):
-        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
-        response.headers['Pragma'] = 'no-cache'
-        response.headers['Expires'] = '0'
-        return response
-
     @app.errorhandler(404)
     def not_found_error(error):
-        from routes import get_t
         app.logger.error(f'Page not found: {request.url}')
         if request.path.startswith('/api/'):
             return jsonify({'error': 'Resource not found'}), 404
-        return render_template('404.html', t=get_t(), lang=session.get('lang', 'fr')), 404
+        return render_template('404.html', lang=session.get('lang', 'fr')), 404
 
     @app.errorhandler(500)
     def internal_error(error):
-        from routes import get_t
         db.session.rollback()
         app.logger.error(f'Server Error: {error}', exc_info=True)
         if request.path.startswith('/api/'):
             return jsonify({'error': 'Internal Server Error'}), 500
-        return render_template('500.html', t=get_t(), lang=session.get('lang', 'fr')), 500
+        return render_template('500.html', lang=session.get('lang', 'fr')), 500
 
-    from routes import main_bp
-    app.register_blueprint(main_bp)
+    with startup_profile.step('blueprint main'):
+        from routes import main_bp
+        app.register_blueprint(main_bp)
 
-    from prescription_routes import prescription_bp
-    app.register_blueprint(prescription_bp)
+    with startup_profile.step('blueprint prescription'):
+        from prescription_routes import prescription_bp
+        app.register_blueprint(prescription_bp)
 
-    from pharmacy_routes import pharmacy_bp
-    app.register_blueprint(pharmacy_bp)
+    with startup_profile.step('blueprint pharmacy'):
+        from pharmacy_routes import pharmacy_bp
+        app.register_blueprint(pharmacy_bp)
 
+    startup_profile.finish(app)
     return app
 
 if __name__ == '__main__':
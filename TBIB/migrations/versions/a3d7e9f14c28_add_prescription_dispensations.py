@@ -0,0 +1,33 @@
+"""add prescription dispensations
+
+Revision ID: a3d7e9f14c28
+Revises: f2b8c5e1a947
+Create Date: 2026-10-17 17:58:42.116830
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a3d7e9f14c28'
+down_revision = 'f2b8c5e1a947'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('prescription_dispensations',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('prescription_id', sa.Integer(), nullable=False),
+    sa.Column('usage_number', sa.Integer(), nullable=False),
+    sa.Column('dispensed_at', sa.DateTime(), nullable=False),
+    sa.Column('pharmacy_ref', sa.String(length=64), nullable=True),
+    sa.ForeignKeyConstraint(['prescription_id'], ['prescriptions.id'], ),
+    sa.PrimaryKeyConstraint('id'),
+    sa.UniqueConstraint('prescription_id', 'usage_number', name='uq_dispensation_usage')
+    )
+
+
+def downgrade():
+    op.drop_table('prescription_dispensations')
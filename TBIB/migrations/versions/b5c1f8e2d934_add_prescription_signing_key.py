@@ -0,0 +1,29 @@
+"""add prescription signing key
+
+Revision ID: b5c1f8e2d934
+Revises: a3d7e9f14c28
+Create Date: 2026-10-17 18:40:13.502617
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b5c1f8e2d934'
+down_revision = 'a3d7e9f14c28'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    # Ordonnances existantes : key_id NULL = signature JSON historique (SECRET_KEY)
+    with op.batch_alter_table('prescriptions', schema=None) as batch_op:
+        batch_op.add_column(sa.Column('key_id', sa.String(length=16), nullable=True))
+        batch_op.add_column(sa.Column('signed_header', sa.String(length=128), nullable=True))
+
+
+def downgrade():
+    with op.batch_alter_table('prescriptions', schema=None) as batch_op:
+        batch_op.drop_column('signed_header')
+        batch_op.drop_column('key_id')
@@ -0,0 +1,58 @@
+"""add hot path indexes
+
+Revision ID: b7d2c41e9a05
+Revises: e5a6d0dfdd39
+Create Date: 2026-10-17 10:12:44.118203
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'b7d2c41e9a05'
+down_revision = 'e5a6d0dfdd39'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.create_index('ix_appointments_doctor_date_status', ['doctor_id', 'appointment_date', 'status', 'appointment_time'], unique=False)
+        batch_op.create_index('ix_appointments_doctor_date_time', ['doctor_id', 'appointment_date', 'appointment_time'], unique=False)
+        batch_op.create_index('ix_appointments_doctor_date_queue', ['doctor_id', 'appointment_date', 'queue_number'], unique=False)
+        batch_op.create_index(batch_op.f('ix_appointments_patient_id'), ['patient_id'], unique=False)
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_users_phone'), ['phone'], unique=False)
+
+    with op.batch_alter_table('doctor_profiles', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_doctor_profiles_city'), ['city'], unique=False)
+        batch_op.create_index(batch_op.f('ix_doctor_profiles_specialty'), ['specialty'], unique=False)
+
+    with op.batch_alter_table('doctor_availability', schema=None) as batch_op:
+        batch_op.create_index('ix_doctor_availability_doctor_day', ['doctor_id', 'day_of_week'], unique=False)
+
+    with op.batch_alter_table('doctor_absences', schema=None) as batch_op:
+        batch_op.create_index('ix_doctor_absences_doctor_dates', ['doctor_id', 'start_date', 'end_date'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('doctor_absences', schema=None) as batch_op:
+        batch_op.drop_index('ix_doctor_absences_doctor_dates')
+
+    with op.batch_alter_table('doctor_availability', schema=None) as batch_op:
+        batch_op.drop_index('ix_doctor_availability_doctor_day')
+
+    with op.batch_alter_table('doctor_profiles', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_doctor_profiles_specialty'))
+        batch_op.drop_index(batch_op.f('ix_doctor_profiles_city'))
+
+    with op.batch_alter_table('users', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_users_phone'))
+
+    with op.batch_alter_table('appointments', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_appointments_patient_id'))
+        batch_op.drop_index('ix_appointments_doctor_date_queue')
+        batch_op.drop_index('ix_appointments_doctor_date_time')
+        batch_op.drop_index('ix_appointments_doctor_date_status')
@@ -0,0 +1,30 @@
+"""add queue counters
+
+Revision ID: c81f3a6d2b47
+Revises: b7d2c41e9a05
+Create Date: 2026-10-17 11:02:19.534871
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c81f3a6d2b47'
+down_revision = 'b7d2c41e9a05'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('queue_counters',
+    sa.Column('doctor_id', sa.Integer(), nullable=False),
+    sa.Column('date', sa.Date(), nullable=False),
+    sa.Column('next_value', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['doctor_id'], ['doctor_profiles.id'], ),
+    sa.PrimaryKeyConstraint('doctor_id', 'date')
+    )
+
+
+def downgrade():
+    op.drop_table('queue_counters')
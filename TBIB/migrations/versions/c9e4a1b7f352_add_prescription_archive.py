@@ -0,0 +1,54 @@
+"""add prescription archive and active index
+
+Revision ID: c9e4a1b7f352
+Revises: b5c1f8e2d934
+Create Date: 2026-10-17 19:22:37.840915
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'c9e4a1b7f352'
+down_revision = 'b5c1f8e2d934'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_index('ix_prescriptions_active_expiry', 'prescriptions', ['expiry_date'], unique=False,
+                    postgresql_where=sa.text("status = 'pending'"), sqlite_where=sa.text("status = 'pending'"))
+
+    op.create_table('prescriptions_archive',
+    sa.Column('id', sa.Integer(), nullable=False),
+    sa.Column('token', sa.String(length=64), nullable=False),
+    sa.Column('appointment_id', sa.Integer(), nullable=False),
+    sa.Column('doctor_id', sa.Integer(), nullable=False),
+    sa.Column('patient_id', sa.Integer(), nullable=False),
+    sa.Column('medications', sa.Text(), nullable=True),
+    sa.Column('notes', sa.Text(), nullable=True),
+    sa.Column('status', sa.String(length=20), nullable=False),
+    sa.Column('security_hash', sa.String(length=64), nullable=True),
+    sa.Column('key_id', sa.String(length=16), nullable=True),
+    sa.Column('signed_header', sa.String(length=128), nullable=True),
+    sa.Column('prescription_type', sa.String(length=20), nullable=True),
+    sa.Column('usage_count', sa.Integer(), nullable=True),
+    sa.Column('max_usage', sa.Integer(), nullable=True),
+    sa.Column('expiry_date', sa.DateTime(), nullable=False),
+    sa.Column('created_at', sa.DateTime(), nullable=True),
+    sa.Column('last_verified_at', sa.DateTime(), nullable=True),
+    sa.Column('archived_at', sa.DateTime(), nullable=False),
+    sa.PrimaryKeyConstraint('id')
+    )
+    with op.batch_alter_table('prescriptions_archive', schema=None) as batch_op:
+        batch_op.create_index(batch_op.f('ix_prescriptions_archive_token'), ['token'], unique=False)
+        batch_op.create_index(batch_op.f('ix_prescriptions_archive_patient_id'), ['patient_id'], unique=False)
+
+
+def downgrade():
+    with op.batch_alter_table('prescriptions_archive', schema=None) as batch_op:
+        batch_op.drop_index(batch_op.f('ix_prescriptions_archive_patient_id'))
+        batch_op.drop_index(batch_op.f('ix_prescriptions_archive_token'))
+    op.drop_table('prescriptions_archive')
+    op.drop_index('ix_prescriptions_active_expiry', table_name='prescriptions')
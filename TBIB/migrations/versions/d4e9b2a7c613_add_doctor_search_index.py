@@ -0,0 +1,63 @@
+"""add doctor search index
+
+Revision ID: d4e9b2a7c613
+Revises: c81f3a6d2b47
+Create Date: 2026-10-17 14:27:51.209364
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd4e9b2a7c613'
+down_revision = 'c81f3a6d2b47'
+branch_labels = None
+depends_on = None
+
+TRGM_COLUMNS = ('name', 'specialty', 'city', 'document')
+
+
+def upgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'postgresql':
+        op.execute('CREATE EXTENSION IF NOT EXISTS pg_trgm')
+
+    op.create_table('doctor_search_index',
+    sa.Column('doctor_id', sa.Integer(), nullable=False),
+    sa.Column('name', sa.String(length=255), nullable=False),
+    sa.Column('specialty', sa.String(length=255), nullable=False),
+    sa.Column('city', sa.String(length=255), nullable=False),
+    sa.Column('document', sa.Text(), nullable=False),
+    sa.ForeignKeyConstraint(['doctor_id'], ['doctor_profiles.id'], ),
+    sa.PrimaryKeyConstraint('doctor_id')
+    )
+
+    if bind.dialect.name == 'postgresql':
+        for column in TRGM_COLUMNS:
+            op.create_index(f'ix_doctor_search_{column}_trgm', 'doctor_search_index', [column],
+                            postgresql_using='gin', postgresql_ops={column: 'gin_trgm_ops'})
+    elif bind.dialect.name == 'sqlite':
+        from models import DOCTOR_SEARCH_FTS_DDL
+        for statement in DOCTOR_SEARCH_FTS_DDL:
+            op.execute(statement)
+
+    # Indexation des médecins existants (les suivants le sont par les événements ORM)
+    from utils.doctor_search import build_row
+    rows = bind.execute(sa.text(
+        "SELECT p.id, u.name, p.specialty, p.city, p.expertises, p.languages "
+        "FROM doctor_profiles p JOIN users u ON u.id = p.user_id"
+    )).all()
+    if rows:
+        index = sa.table('doctor_search_index', *(sa.column(c) for c in ('doctor_id',) + TRGM_COLUMNS))
+        op.bulk_insert(index, [build_row(*row) for row in rows])
+
+
+def downgrade():
+    bind = op.get_bind()
+    if bind.dialect.name == 'sqlite':
+        op.execute('DROP TABLE IF EXISTS doctor_search_fts')
+    elif bind.dialect.name == 'postgresql':
+        for column in TRGM_COLUMNS:
+            op.drop_index(f'ix_doctor_search_{column}_trgm', table_name='doctor_search_index')
+    op.drop_table('doctor_search_index')
@@ -0,0 +1,68 @@
+"""add ministry dashboard rollups
+
+Revision ID: d7a2f5c8e161
+Revises: c9e4a1b7f352
+Create Date: 2026-10-17 20:41:12.507394
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'd7a2f5c8e161'
+down_revision = 'c9e4a1b7f352'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('rollup_doctors_by_city',
+    sa.Column('city', sa.String(length=100), nullable=False),
+    sa.Column('doctor_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('city')
+    )
+    op.create_table('rollup_daily_appointments',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('specialty', sa.String(length=100), nullable=False),
+    sa.Column('appointment_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'specialty')
+    )
+    op.create_table('rollup_daily_epidemiology',
+    sa.Column('day', sa.Date(), nullable=False),
+    sa.Column('pathology_tag', sa.String(length=100), nullable=False),
+    sa.Column('age_group', sa.String(length=50), nullable=False),
+    sa.Column('gender', sa.String(length=20), nullable=False),
+    sa.Column('wilaya', sa.String(length=100), nullable=False),
+    sa.Column('case_count', sa.Integer(), nullable=False),
+    sa.PrimaryKeyConstraint('day', 'pathology_tag', 'age_group', 'gender', 'wilaya')
+    )
+
+    # Données existantes (les suivantes sont tenues à jour par les événements ORM).
+    # SQL figé ici : la migration ne doit pas dépendre des modèles de l'application
+    op.execute("""
+        INSERT INTO rollup_doctors_by_city (city, doctor_count)
+        SELECT city, COUNT(id) FROM doctor_profiles GROUP BY city
+    """)
+    op.execute("""
+        INSERT INTO rollup_daily_appointments (day, specialty, appointment_count)
+        SELECT a.appointment_date, COALESCE(d.specialty, ''), COUNT(a.id)
+        FROM appointments a JOIN doctor_profiles d ON d.id = a.doctor_id
+        WHERE a.appointment_date IS NOT NULL
+        GROUP BY a.appointment_date, COALESCE(d.specialty, '')
+    """)
+    # SQLite : CAST(... AS DATE) rend un nombre ; date() rend 'AAAA-MM-JJ'
+    day = 'date(timestamp)' if op.get_bind().dialect.name == 'sqlite' else 'CAST(timestamp AS DATE)'
+    op.execute(f"""
+        INSERT INTO rollup_daily_epidemiology (day, pathology_tag, age_group, gender, wilaya, case_count)
+        SELECT {day}, pathology_tag, age_group, gender, wilaya, COUNT(id)
+        FROM epidemiology_data
+        WHERE timestamp IS NOT NULL
+        GROUP BY {day}, pathology_tag, age_group, gender, wilaya
+    """)
+
+
+def downgrade():
+    op.drop_table('rollup_daily_epidemiology')
+    op.drop_table('rollup_daily_appointments')
+    op.drop_table('rollup_doctors_by_city')
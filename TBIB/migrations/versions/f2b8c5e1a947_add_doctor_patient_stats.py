@@ -0,0 +1,51 @@
+"""add doctor patient stats
+
+Revision ID: f2b8c5e1a947
+Revises: d4e9b2a7c613
+Create Date: 2026-10-17 16:48:05.731260
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'f2b8c5e1a947'
+down_revision = 'd4e9b2a7c613'
+branch_labels = None
+depends_on = None
+
+
+def upgrade():
+    op.create_table('doctor_patient_stats',
+    sa.Column('doctor_id', sa.Integer(), nullable=False),
+    sa.Column('patient_id', sa.Integer(), nullable=False),
+    sa.Column('first_visit', sa.Date(), nullable=True),
+    sa.Column('last_visit', sa.Date(), nullable=True),
+    sa.Column('visit_count', sa.Integer(), nullable=False),
+    sa.Column('no_show_count', sa.Integer(), nullable=False),
+    sa.ForeignKeyConstraint(['doctor_id'], ['doctor_profiles.id'], ),
+    sa.ForeignKeyConstraint(['patient_id'], ['users.id'], ),
+    sa.PrimaryKeyConstraint('doctor_id', 'patient_id')
+    )
+    op.create_index('ix_doctor_patient_stats_roster', 'doctor_patient_stats',
+                    ['doctor_id', 'last_visit', 'patient_id'], unique=False)
+
+    # Relations existantes (les suivantes sont tenues à jour par les événements ORM).
+    # SQL figé ici : la migration ne doit pas dépendre des modèles de l'application
+    op.execute("""
+        INSERT INTO doctor_patient_stats
+            (doctor_id, patient_id, first_visit, last_visit, visit_count, no_show_count)
+        SELECT doctor_id, patient_id,
+               MIN(CASE WHEN status = 'completed' THEN appointment_date END),
+               MAX(CASE WHEN status = 'completed' THEN appointment_date END),
+               COUNT(CASE WHEN status = 'completed' THEN 1 END),
+               COUNT(CASE WHEN status = 'no_show' THEN 1 END)
+        FROM appointments
+        GROUP BY doctor_id, patient_id
+    """)
+
+
+def downgrade():
+    op.drop_index('ix_doctor_patient_stats_roster', table_name='doctor_patient_stats')
+    op.drop_table('doctor_patient_stats')
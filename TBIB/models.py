@@ -2,6 +2,7 @@ import enum
 from flask_login import UserMixin
 from werkzeug.security import generate_password_hash, check_password_hash
 from datetime import datetime, date, time
+from sqlalchemy import DDL, event
 
 from extensions import db
 
@@ -37,7 +38,7 @@ class User(UserMixin, db.Model):
     password_hash = db.Column(db.String(256), nullable=False)
     role = db.Column(db.String(20), nullable=False)  # patient, doctor, secretary
     name = db.Column(db.String(100), nullable=False)
-    phone = db.Column(db.String(20))
+    phone = db.Column(db.String(20), index=True)
     birth_date = db.Column(db.Date, nullable=True)
     gender = db.Column(db.String(20), nullable=True)
     address = db.Column(db.String(255), nullable=True)
@@ -71,8 +72,8 @@ class DoctorProfile(db.Model):
 
     id = db.Column(db.Integer, primary_key=True)
     user_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
-    specialty = db.Column(db.String(100), nullable=False)
-    city = db.Column(db.String(100), nullable=False)
+    specialty = db.Column(db.String(100), nullable=False, index=True)
+    city = db.Column(db.String(100), nullable=False, index=True)
     address = db.Column(db.String(255))
     bio = db.Column(db.Text)
     profile_picture = db.Column(db.String(500), nullable=True)
@@ -88,8 +89,53 @@ class DoctorProfile(db.Model):
 
     appointments = db.relationship('Appointment', backref='doctor_profile', foreign_keys='Appointment.doctor_id', lazy='dynamic')
 
+class DoctorSearchIndex(db.Model):
+    """Champs de recherche d'un médecin, normalisés (sans accents, arabe translittéré)."""
+    __tablename__ = 'doctor_search_index'
+    # PostgreSQL : index trigrammes (pg_trgm) pour les recherches ILIKE '%x%'
+    __table_args__ = tuple(
+        db.Index(f'ix_doctor_search_{column}_trgm', column, postgresql_using='gin',
+                 postgresql_ops={column: 'gin_trgm_ops'}).ddl_if(dialect='postgresql')
+        for column in ('name', 'specialty', 'city', 'document')
+    )
+
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_profiles.id'), primary_key=True)
+    name = db.Column(db.String(255), nullable=False, default='')
+    specialty = db.Column(db.String(255), nullable=False, default='')
+    city = db.Column(db.String(255), nullable=False, default='')
+    document = db.Column(db.Text, nullable=False, default='')  # Expertises + langues
+
+
+# SQLite : table FTS5 (tokenizer trigram) adossée à doctor_search_index, tenue à jour par triggers
+DOCTOR_SEARCH_FTS_DDL = [
+    "CREATE VIRTUAL TABLE IF NOT EXISTS doctor_search_fts USING fts5("
+    "name, specialty, city, document, content='doctor_search_index', content_rowid='doctor_id', "
+    "tokenize='trigram')",
+    "CREATE TRIGGER IF NOT EXISTS doctor_search_ai AFTER INSERT ON doctor_search_index BEGIN "
+    "INSERT INTO doctor_search_fts(rowid, name, specialty, city, document) "
+    "VALUES (new.doctor_id, new.name, new.specialty, new.city, new.document); END",
+    "CREATE TRIGGER IF NOT EXISTS doctor_search_ad AFTER DELETE ON doctor_search_index BEGIN "
+    "INSERT INTO doctor_search_fts(doctor_search_fts, rowid, name, specialty, city, document) "
+    "VALUES ('delete', old.doctor_id, old.name, old.specialty, old.city, old.document); END",
+    "CREATE TRIGGER IF NOT EXISTS doctor_search_au AFTER UPDATE ON doctor_search_index BEGIN "
+    "INSERT INTO doctor_search_fts(doctor_search_fts, rowid, name, specialty, city, document) "
+    "VALUES ('delete', old.doctor_id, old.name, old.specialty, old.city, old.document); "
+    "INSERT INTO doctor_search_fts(rowid, name, specialty, city, document) "
+    "VALUES (new.doctor_id, new.name, new.specialty, new.city, new.document); END",
+]
+
+event.listen(DoctorSearchIndex.__table__, 'before_create',
+             DDL("CREATE EXTENSION IF NOT EXISTS pg_trgm").execute_if(dialect='postgresql'))
+for statement in DOCTOR_SEARCH_FTS_DDL:
+    event.listen(DoctorSearchIndex.__table__, 'after_create', DDL(statement).execute_if(dialect='sqlite'))
+event.listen(DoctorSearchIndex.__table__, 'before_drop',
+             DDL("DROP TABLE IF EXISTS doctor_search_fts").execute_if(dialect='sqlite'))
+
 class DoctorAvailability(db.Model):
     __tablename__ = 'doctor_availability'
+    __table_args__ = (
+        db.Index('ix_doctor_availability_doctor_day', 'doctor_id', 'day_of_week'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_profiles.id'), nullable=False)
@@ -133,10 +179,16 @@ class Appointment(db.Model):
     __table_args__ = (
         db.Index('ix_unique_scheduled_slot', 'doctor_id', 'appointment_date', 'appointment_time',
                  unique=True, postgresql_where=db.text("status = 'confirmed' AND appointment_time IS NOT NULL")),
+        # Chemin critique : file du jour d'un médecin, filtrée par statut
+        db.Index('ix_appointments_doctor_date_status', 'doctor_id', 'appointment_date', 'status', 'appointment_time'),
+        # Agenda du jour trié par heure (l'index unique ci-dessus est partiel en PostgreSQL)
+        db.Index('ix_appointments_doctor_date_time', 'doctor_id', 'appointment_date', 'appointment_time'),
+        # Numéros de queue : patient en cours, max(queue_number), patients devant
+        db.Index('ix_appointments_doctor_date_queue', 'doctor_id', 'appointment_date', 'queue_number'),
     )
 
     id = db.Column(db.Integer, primary_key=True)
-    patient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False)
+    patient_id = db.Column(db.Integer, db.ForeignKey('users.id'), nullable=False, index=True)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_profiles.id'), nullable=False)
     status = db.Column(db.String(20), default='confirmed')
     queue_number = db.Column(db.Integer, nullable=True)
@@ -173,6 +225,32 @@ class Appointment(db.Model):
     price_paid = db.Column(db.Float, nullable=True)        # Montant perçu
     payment_method = db.Column(db.String(20), nullable=True)  # Espèces, Chifa, CIB, Gratuité
 
+class QueueCounter(db.Model):
+    """Prochain numéro de passage d'un médecin pour un jour (incrément atomique)."""
+    __tablename__ = 'queue_counters'
+
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_profiles.id'), primary_key=True)
+    date = db.Column(db.Date, primary_key=True)
+    next_value = db.Column(db.Integer, nullable=False, default=1)
+
+
+class DoctorPatientStats(db.Model):
+    """Relation médecin-patient agrégée (consultations terminées, absences), tenue à jour par utils/patient_roster."""
+    __tablename__ = 'doctor_patient_stats'
+    __table_args__ = (
+        # Liste des patients : plage (doctor_id, last_visit, patient_id) lue dans l'ordre de l'index
+        db.Index('ix_doctor_patient_stats_roster', 'doctor_id', 'last_visit', 'patient_id'),
+    )
+
+    doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_profiles.id'), primary_key=True)
+    patient_id = db.Column(db.Integer, db.ForeignKey('users.id'), primary_key=True)
+    first_visit = db.Column(db.Date)
+    last_visit = db.Column(db.Date)
+    visit_count = db.Column(db.Integer, nullable=False, default=0)
+    no_show_count = db.Column(db.Integer, nullable=False, default=0)
+
+    patient = db.relationship('User', foreign_keys=[patient_id])
+
 class ConsultationType(db.Model):
     __tablename__ = 'consultation_types'
 
@@ -191,6 +269,9 @@ class ConsultationType(db.Model):
 
 class DoctorAbsence(db.Model):
     __tablename__ = 'doctor_absences'
+    __table_args__ = (
+        db.Index('ix_doctor_absences_doctor_dates', 'doctor_id', 'start_date', 'end_date'),
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     doctor_id = db.Column(db.Integer, db.ForeignKey('doctor_profiles.id'), nullable=False)
@@ -254,6 +335,36 @@ class EpidemiologyData(db.Model):
     timestamp = db.Column(db.DateTime, default=datetime.utcnow)
 
 
+# Agrégats du tableau de bord ministère, tenus à jour par utils/rollups
+class RollupDoctorsByCity(db.Model):
+    """Nombre de médecins par ville (état courant)."""
+    __tablename__ = 'rollup_doctors_by_city'
+
+    city = db.Column(db.String(100), primary_key=True)
+    doctor_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class RollupDailyAppointments(db.Model):
+    """Rendez-vous par jour et par spécialité du médecin."""
+    __tablename__ = 'rollup_daily_appointments'
+
+    day = db.Column(db.Date, primary_key=True)
+    specialty = db.Column(db.String(100), primary_key=True)
+    appointment_count = db.Column(db.Integer, nullable=False, default=0)
+
+
+class RollupDailyEpidemiology(db.Model):
+    """Cas EpidemiologyData par jour, pathologie, tranche d'âge, sexe et wilaya."""
+    __tablename__ = 'rollup_daily_epidemiology'
+
+    day = db.Column(db.Date, primary_key=True)
+    pathology_tag = db.Column(db.String(100), primary_key=True)
+    age_group = db.Column(db.String(50), primary_key=True)
+    gender = db.Column(db.String(20), primary_key=True)
+    wilaya = db.Column(db.String(100), primary_key=True)
+    case_count = db.Column(db.Integer, nullable=False, default=0)
+
+
 class Referral(db.Model):
     """Réseau d'Adressage - Orienter un patient vers un confrère."""
     __tablename__ = 'referrals'
@@ -276,7 +387,12 @@ class Referral(db.Model):
 
 class Prescription(db.Model):
     __tablename__ = 'prescriptions'
-    __table_args__ = {'extend_existing': True}
+    __table_args__ = (
+        # Ordonnances encore utilisables : le balayage d'expiration ne lit que celles-ci
+        db.Index('ix_prescriptions_active_expiry', 'expiry_date',
+                 postgresql_where=db.text("status = 'pending'"), sqlite_where=db.text("status = 'pending'")),
+        {'extend_existing': True},
+    )
 
     id = db.Column(db.Integer, primary_key=True)
     token = db.Column(db.String(64), unique=True, nullable=False, index=True)
@@ -291,8 +407,12 @@ class Prescription(db.Model):
     notes = db.Column(db.Text, nullable=True)
 
     # Sécurité
+    # pending -> dispensed (max_usage atteint) ou expired (utils/prescription_sweeper)
     status = db.Column(db.String(20), default='pending', nullable=False, server_default='pending')
     security_hash = db.Column(db.String(64), nullable=True)
+    # Clé du trousseau (utils/signing) et en-tête signé tel quel ; NULL = signature JSON historique
+    key_id = db.Column(db.String(16), nullable=True)
+    signed_header = db.Column(db.String(128), nullable=True)
     prescription_type = db.Column(db.String(20), default='ACUTE')  # ACUTE ou CHRONIC
     usage_count = db.Column(db.Integer, default=0)
     max_usage = db.Column(db.Integer, default=1)
@@ -309,3 +429,44 @@ class Prescription(db.Model):
 
     def __repr__(self):
         return f'<Prescription {self.token}>'
+
+
+class PrescriptionArchive(db.Model):
+    """Ordonnances expirées depuis longtemps, sorties de la table prescriptions (voir utils/prescription_sweeper)."""
+    __tablename__ = 'prescriptions_archive'
+
+    id = db.Column(db.Integer, primary_key=True)  # Même id que dans prescriptions
+    token = db.Column(db.String(64), nullable=False, index=True)
+    appointment_id = db.Column(db.Integer, nullable=False)
+    doctor_id = db.Column(db.Integer, nullable=False)
+    patient_id = db.Column(db.Integer, nullable=False, index=True)
+    medications = db.Column(db.Text, nullable=True)
+    notes = db.Column(db.Text, nullable=True)
+    status = db.Column(db.String(20), nullable=False)
+    security_hash = db.Column(db.String(64), nullable=True)
+    key_id = db.Column(db.String(16), nullable=True)
+    signed_header = db.Column(db.String(128), nullable=True)
+    prescription_type = db.Column(db.String(20))
+    usage_count = db.Column(db.Integer)
+    max_usage = db.Column(db.Integer)
+    expiry_date = db.Column(db.DateTime, nullable=False)
+    created_at = db.Column(db.DateTime)
+    last_verified_at = db.Column(db.DateTime, nullable=True)
+    archived_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+
+
+class PrescriptionDispensation(db.Model):
+    """Journal des délivrances (append-only) : une ligne par utilisation d'une ordonnance."""
+    __tablename__ = 'prescription_dispensations'
+    __table_args__ = (
+        # Deux délivrances ne peuvent pas porter le même numéro d'utilisation
+        db.UniqueConstraint('prescription_id', 'usage_number', name='uq_dispensation_usage'),
+    )
+
+    id = db.Column(db.Integer, primary_key=True)
+    prescription_id = db.Column(db.Integer, db.ForeignKey('prescriptions.id'), nullable=False)
+    usage_number = db.Column(db.Integer, nullable=False)  # usage_count après cette délivrance
+    dispensed_at = db.Column(db.DateTime, nullable=False, default=datetime.utcnow)
+    pharmacy_ref = db.Column(db.String(64), nullable=True)  # En-tête X-Pharmacy-Id, si fourni
+
+    prescription = db.relationship('Prescription', backref=db.backref('dispensations', lazy='dynamic'))
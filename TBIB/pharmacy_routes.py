@@ -1,57 +1,42 @@
 from flask import Blueprint, jsonify, request, current_app
 import hmac
-import hashlib
-import json
 import os
 from datetime import datetime
+from sqlalchemy.orm import joinedload
 from extensions import db
-from models import Prescription
+from models import Prescription, PrescriptionArchive
+from SERVICES.ewassfa import EWassfaService
+from utils.http_cache import blueprint_policy
 
 pharmacy_bp = Blueprint('pharmacy', __name__, url_prefix='/pharmacy')
+# Vérifications et délivrances : jamais conservées par le navigateur ni un proxy
+blueprint_policy(pharmacy_bp, 'no-store')
 
-@pharmacy_bp.route('/verify/<token>', methods=['GET'])
-def verify_prescription(token):
-    prescription = Prescription.query.filter_by(token=token).first()
+# Nombre maximum de tokens par appel de vérification groupée
+MAX_BATCH_TOKENS = 500
 
-    if not prescription:
-        return jsonify({"valid": False, "reason": "Ordonnance introuvable"}), 404
+# Refus de EWassfaService.dispense -> (message, code HTTP)
+DISPENSE_ERRORS = {
+    'not_found': ("Ordonnance introuvable", 404),
+    'dispensed': ("Déjà servie", 400),
+    'expired': ("Ordonnance périmée", 400),
+}
+
+ARCHIVED_RESULT = {"valid": False, "status": "expired", "reason": "Ordonnance périmée"}
+
+
+def _verification(prescription, now):
+    """Résultat de vérification d'une ordonnance : (corps JSON, code HTTP de /verify/<token>)."""
+    if not EWassfaService.verify_signature(prescription):
+        return {"valid": False, "status": "tampered", "reason": "Signature invalide / Ordonnance modifiée"}, 200
 
-    # Vérifier signature
-    payload = {
-        'doctor_id': prescription.doctor_id,
-        'patient_id': prescription.patient_id,
-        'medications': prescription.medications,
-        # We need the original timestamp used for signing.
-        # It was stored in created_at, but we need to convert to int timestamp.
-        # Warning: ensure created_at in DB matches the one used for signing.
-        # prescription.created_at is a DateTime.
-        'timestamp': int(prescription.created_at.timestamp())
-    }
-
-    payload_str = json.dumps(payload, sort_keys=True)
-    signature = hmac.new(
-        current_app.config['SECRET_KEY'].encode(),
-        payload_str.encode(),
-        hashlib.sha256
-    ).hexdigest()
-
-    if signature != prescription.security_hash:
-        return jsonify({"valid": False, "status": "tampered", "reason": "Signature invalide / Ordonnance modifiée"}), 200 # Using 200 as per prompt logic inference, or maybe 400? Prompt said "Retourner un JSON clair".
-        # Prompt examples used 400 for errors. I will use 200 with valid:False for tampering as it's a verification result.
-        # Wait, prompt said: if dispensed -> 400. if expired -> 400.
-        # So I'll default to 200 unless it's a "known bad state" that implies "Bad Request"?
-        # Actually, tampering is critical. I'll return 200 with valid=False so the client app can display "INVALID".
-        # 400 usually implies client error.
-
-    # Vérifier statut
     if prescription.status == 'dispensed':
-        return jsonify({"valid": False, "status": "dispensed", "reason": "Déjà servie"}), 400
+        return {"valid": False, "status": "dispensed", "reason": "Déjà servie"}, 400
 
-    # Vérifier expiration
-    if prescription.expiry_date and datetime.utcnow() > prescription.expiry_date:
-        return jsonify({"valid": False, "status": "expired", "reason": "Ordonnance périmée"}), 400
+    if prescription.expiry_date and now > prescription.expiry_date:
+        return {"valid": False, "status": "expired", "reason": "Ordonnance périmée"}, 400
 
-    return jsonify({
+    return {
         "valid": True,
         "status": "pending",
         "prescription_details": {
@@ -59,40 +44,90 @@ def verify_prescription(token):
             "medications": prescription.medications,
             "expiry": prescription.expiry_date.isoformat()
         }
-    }), 200
+    }, 200
 
-@pharmacy_bp.route('/dispense/<token>', methods=['POST'])
-def dispense_prescription(token):
-    # Vérifier API Key dans header
+
+def _pharmacy_key_valid():
     api_key = request.headers.get('X-Pharmacy-Key')
     expected_key = os.environ.get('PHARMACY_API_KEY')
+    # Sans PHARMACY_API_KEY configurée, tout est refusé
+    return bool(api_key and expected_key) and hmac.compare_digest(api_key.encode(), expected_key.encode())
+
+@pharmacy_bp.route('/verify/<token>', methods=['GET'])
+def verify_prescription(token):
+    prescription = Prescription.query.filter_by(token=token).first()
+
+    if not prescription:
+        # Expirée depuis longtemps : déplacée par le balayage (utils/prescription_sweeper)
+        if db.session.query(PrescriptionArchive.id).filter_by(token=token).first():
+            return jsonify(ARCHIVED_RESULT), 400
+        return jsonify({"valid": False, "reason": "Ordonnance introuvable"}), 404
+
+    body, status_code = _verification(prescription, datetime.utcnow())
+    return jsonify(body), status_code
 
-    if not expected_key:
-        # Fallback for dev if not set (though instructions said verify strictly)
-        # But if env var is missing, logic fails secure (deny all).
-        # Unless I set a default in config.
-        # Prompt Task 4: "if api_key != os.environ.get('PHARMACY_API_KEY'): return 401"
-        pass
 
-    if not api_key or api_key != expected_key:
+@pharmacy_bp.route('/verify', methods=['POST'])
+def verify_prescriptions_batch():
+    """
+    Vérification groupée (rapprochement des scans du jour, patients chroniques).
+
+    Corps JSON : {"tokens": [...]} (MAX_BATCH_TOKENS au plus). Une requête IN
+    pour toutes les ordonnances, une sur l'archive pour les introuvables, HMAC
+    préparés une fois par clé (utils/signing) ; résultats dans l'ordre reçu.
+    """
+    if not _pharmacy_key_valid():
         return jsonify({"error": "Non autorisé"}), 401
 
-    prescription = Prescription.query.filter_by(token=token).first()
+    data = request.get_json(silent=True) or {}
+    tokens = data.get('tokens')
+    if not isinstance(tokens, list) or not all(isinstance(token, str) for token in tokens):
+        return jsonify({"error": "Liste de tokens attendue"}), 400
+    if len(tokens) > MAX_BATCH_TOKENS:
+        return jsonify({"error": f"Maximum {MAX_BATCH_TOKENS} tokens par appel"}), 400
+
+    unique_tokens = list(dict.fromkeys(tokens))
+    prescriptions = Prescription.query.options(joinedload(Prescription.doctor)).filter(
+        Prescription.token.in_(unique_tokens)
+    ).all() if unique_tokens else []
+    by_token = {prescription.token: prescription for prescription in prescriptions}
+    missing = [token for token in unique_tokens if token not in by_token]
+    archived = set(db.session.execute(
+        db.select(PrescriptionArchive.token).where(PrescriptionArchive.token.in_(missing))
+    ).scalars()) if missing else set()
+
+    now = datetime.utcnow()
+    results = []
+    for token in tokens:
+        prescription = by_token.get(token)
+        if prescription is None and token in archived:
+            body = ARCHIVED_RESULT
+        elif prescription is None:
+            body = {"valid": False, "status": "not_found", "reason": "Ordonnance introuvable"}
+        else:
+            body, _ = _verification(prescription, now)
+        results.append({"token": token, **body})
 
-    if not prescription:
-         return jsonify({"error": "Ordonnance introuvable"}), 404
+    return jsonify({
+        "results": results,
+        "valid_count": sum(1 for result in results if result['valid'])
+    }), 200
 
-    if prescription.status == 'dispensed':
-        return jsonify({"error": "Déjà servie"}), 400
+@pharmacy_bp.route('/dispense/<token>', methods=['POST'])
+def dispense_prescription(token):
+    # Vérifier API Key dans header
+    if not _pharmacy_key_valid():
+        return jsonify({"error": "Non autorisé"}), 401
 
-    prescription.status = 'dispensed'
-    prescription.usage_count += 1
-    prescription.last_verified_at = datetime.utcnow()
+    # Incrément conditionnel + journal : un aller-retour, sûr entre terminaux concurrents
+    usage_number, refusal = EWassfaService.dispense(token, pharmacy_ref=request.headers.get('X-Pharmacy-Id'))
+    if refusal:
+        db.session.rollback()
+        return jsonify({"error": DISPENSE_ERRORS[refusal][0]}), DISPENSE_ERRORS[refusal][1]
     db.session.commit()
 
-    # Audit log (Task 4 says "Log l'action dans la table AuditLog (si elle existe)")
-    # We checked models.py and AuditLog does not exist.
-    # So we log to app logger.
-    current_app.logger.info(f"Prescription {token} dispensed by pharmacy.")
+    # Audit : chaque délivrance a sa ligne dans prescription_dispensations
+    current_app.logger.info(f"Prescription {token} dispensed by pharmacy (usage {usage_number}).")
 
-    return jsonify({"success": True, "message": "Ordonnance marquée comme servie"}), 200
+    return jsonify({"success": True, "message": "Ordonnance marquée comme servie",
+                    "usage_number": usage_number}), 200
@@ -1,12 +1,27 @@
-from flask import Blueprint, render_template, request, jsonify, url_for, redirect, flash, current_app
+from flask import Blueprint, render_template, request, jsonify, url_for, redirect, flash, current_app, abort
 from datetime import datetime, timedelta
 from flask_login import login_required, current_user
 from models import Prescription, Appointment
 from extensions import db
 
 from SERVICES.ewassfa import EWassfaService
+from utils.qr_cache import QR_FORMATS
+from utils.http_cache import blueprint_policy
 
 prescription_bp = Blueprint('prescription', __name__, url_prefix='/prescription')
+# Ordonnances : jamais conservées par le navigateur ni un proxy (le QR déclare sa propre durée)
+blueprint_policy(prescription_bp, 'no-store')
+
+# Le QR d'un token est immuable : cache navigateur d'un jour (privé, l'URL contient le token)
+QR_MAX_AGE_SECONDS = 86400
+
+def verify_url_for(token):
+    """URL de vérification encodée dans le QR, sur l'adresse publique configurée (pas l'en-tête Host)."""
+    base_url = current_app.config.get('PUBLIC_BASE_URL')
+    if base_url:
+        return base_url.rstrip('/') + url_for('prescription.verify_prescription', token=token)
+    # SERVER_NAME défini : Flask n'accepte que cet hôte ; sinon développement (pas de cache disque)
+    return url_for('prescription.verify_prescription', token=token, _external=True)
 
 @prescription_bp.route('/create/<int:appointment_id>', methods=['POST'])
 @login_required
@@ -55,7 +70,7 @@ def create_prescription(appointment_id):
     creation_time = datetime.utcnow()
     timestamp_int = int(creation_time.timestamp())
 
-    signature = EWassfaService.create_hmac_signature(
+    signature, key_id, signed_header = EWassfaService.sign_prescription(
         doctor_id=current_user.id,
         patient_id=appointment.patient_id,
         medications=medications,
@@ -75,6 +90,8 @@ def create_prescription(appointment_id):
         expiry_date=expiry,
         created_at=creation_time,
         security_hash=signature,
+        key_id=key_id,
+        signed_header=signed_header,
         status='pending'
     )
 
@@ -90,15 +107,32 @@ def view_prescription(token):
 
     prescription = Prescription.query.filter_by(token=token).first_or_404()
 
-    # Générer le QR Code
-    verify_url = url_for('prescription.verify_prescription', token=token, _external=True)
-    qr_code_base64 = EWassfaService.generate_qr_code(verify_url)
+    # Le QR Code est une image séparée (qr_code), mise en cache par le navigateur
+    verify_url = verify_url_for(token)
 
     return render_template('prescription.html',
                           prescription=prescription,
-                          qr_code=qr_code_base64,
+                          qr_url=url_for('prescription.qr_code', token=token, fmt='svg'),
                           verify_url=verify_url)
 
+@prescription_bp.route('/qr/<token>.<fmt>')
+def qr_code(token, fmt):
+    """QR Code de l'ordonnance (svg ou png) ; l'URL encodée ne change jamais"""
+
+    if fmt not in QR_FORMATS:
+        abort(404)
+    if not db.session.query(Prescription.id).filter_by(token=token).first():
+        abort(404)
+
+    verify_url = verify_url_for(token)
+    content, etag = EWassfaService.render_qr(verify_url, fmt)
+
+    response = current_app.response_class(content, mimetype=QR_FORMATS[fmt])
+    response.set_etag(etag)
+    response.cache_control.private = True
+    response.cache_control.max_age = QR_MAX_AGE_SECONDS
+    return response.make_conditional(request)
+
 @prescription_bp.route('/verify/<token>', methods=['GET', 'POST'])
 def verify_prescription(token):
     """Page publique de vérification (pour pharmaciens)"""
@@ -110,12 +144,16 @@ def verify_prescription(token):
     is_valid = validation_result['is_valid']
     error_message = validation_result['error_message']
 
-    # Si POST = le pharmacien confirme l'utilisation
+    # Si POST = le pharmacien confirme l'utilisation (incrément atomique + journal)
     if request.method == 'POST' and is_valid:
-        prescription.usage_count += 1
-        prescription.last_verified_at = datetime.utcnow()
-        db.session.commit()
-        flash('Ordonnance marquée comme utilisée', 'success')
+        usage_number, refusal = EWassfaService.dispense(token)
+        if refusal:
+            db.session.rollback()
+            flash('Ordonnance déjà utilisée ou expirée', 'error')
+        else:
+            db.session.commit()
+            flash('Ordonnance marquée comme utilisée', 'success')
+        db.session.refresh(prescription)
 
     return render_template('verify_prescription.html',
                           prescription=prescription,
@@ -1,221 +1,42 @@
-from flask import Blueprint, render_template, redirect, url_for, request, flash, session, jsonify, current_app
+import json
+import time as clock
+from functools import lru_cache
+from flask import Blueprint, render_template, redirect, url_for, request, flash, session, jsonify, current_app, Response, stream_with_context
 from flask_login import login_user, logout_user, login_required, current_user
 from extensions import db
 from models import User, DoctorProfile, Appointment, HealthRecord, DoctorAvailability, ConsultationType, DoctorAbsence, Relative, Referral
 from utils.engine import calculate_wait_time, shift_appointments, get_conflicting_appointments, cancel_appointments_in_range
-from utils.smart_engine import QueueOptimizer
+from utils.smart_engine import QueueOptimizer, notify_queue_change
+from utils.queue_events import queue_events, CHECK_IN, NEXT_PATIENT, PRESENT, NO_SHOW, WALK_IN, COMPLETED
+from utils.queue_snapshot import get_queue_snapshot, LIVE_STREAM_HEARTBEAT_SECONDS, LIVE_STREAM_MAX_SECONDS
+from utils.availability import AvailabilityWindow, invalidate_weekly_template, first_free_slots, SEARCH_MAX_DOCTORS
+from utils.query_options import appointment_options, patient_options
+from utils.queue_counter import next_queue_number
+from utils.doctor_search import search_doctors, DEFAULT_PER_PAGE
+from utils.pagination import InvalidCursor
+from utils.patient_roster import patient_page, patient_count, DEFAULT_PER_PAGE as PATIENTS_PER_PAGE
+from utils.facets import facet_cache
+from utils.http_cache import public, revalidate
+from utils.i18n import LANGUAGES, translate
 from datetime import date, datetime, timedelta, time
 
 main_bp = Blueprint('main', __name__)
 
-TRANSLATIONS = {
-    'fr': {
-        'brand': 'TBIB',
-        'home': 'Accueil',
-        'my_appointments': 'Mes Rendez-vous',
-        'dashboard': 'Tableau de bord',
-        'login': 'Se connecter',
-        'register': "S'inscrire",
-        'logout': 'Déconnexion',
-        'patient': 'Patient',
-        'doctor': 'Médecin',
-        'search': 'Rechercher',
-        'specialty': 'Spécialité',
-        'city': 'Ville',
-        'book': 'Prendre RDV',
-        'your_turn': 'Votre Tour',
-        'current': 'En cours',
-        'next_patient': 'Patient Suivant',
-        'no_show': 'Absent',
-        'complete': 'Terminé',
-        'cancel': 'Annuler',
-        'email': 'Email',
-        'password': 'Mot de passe',
-        'name': 'Nom complet',
-        'phone': 'Téléphone',
-        'find_doctor': 'Trouvez votre médecin',
-        'search_subtitle': 'Recherchez par spécialité et ville',
-        'all_specialties': 'Toutes les spécialités',
-        'all_cities': 'Toutes les villes',
-        'available_doctors': 'Médecins disponibles',
-        'today_appointments': "Aujourd'hui",
-        'queue_status': 'En attente',
-        'no_appointments': 'Aucun rendez-vous',
-        'appointment_booked': 'Rendez-vous confirmé !',
-        'login_required': 'Connectez-vous pour prendre rendez-vous',
-        'welcome': 'Bienvenue',
-        'address': 'Adresse',
-        'bio': 'Biographie',
-        'confirmed': 'Confirmé',
-        'completed': 'Terminé',
-        'cancelled': 'Annulé',
-        'no_show_status': 'Absent',
-        'waiting': 'En attente',
-        'total': 'Total',
-        'my_account': 'Mon Compte',
-        'my_info': 'Mes informations',
-        'health_record': 'Mon Carnet de Santé',
-        'security': 'Sécurité',
-        'relatives': 'Mes proches',
-        'save': 'Enregistrer',
-        'blood_type': 'Groupe sanguin',
-        'weight': 'Poids (kg)',
-        'height': 'Taille (cm)',
-        'allergies': 'Allergies & Contre-indications',
-        'vaccines': 'Vaccins',
-        'dob': 'Date de naissance',
-        'your_turn_message': 'Votre tour arrive',
-        'estimated_wait_time': "Temps d'attente estimé",
-        'confirm_presence': 'Je confirme ma présence',
-    },
-    'ar': {
-        'brand': 'طبيب',
-        'home': 'الرئيسية',
-        'my_appointments': 'مواعيدي',
-        'dashboard': 'لوحة التحكم',
-        'login': 'تسجيل الدخول',
-        'register': 'التسجيل',
-        'logout': 'تسجيل الخروج',
-        'patient': 'مريض',
-        'doctor': 'طبيب',
-        'search': 'بحث',
-        'specialty': 'التخصص',
-        'city': 'المدينة',
-        'book': 'حجز موعد',
-        'your_turn': 'دورك',
-        'current': 'الحالي',
-        'next_patient': 'المريض التالي',
-        'no_show': 'غائب',
-        'complete': 'مكتمل',
-        'cancel': 'إلغاء',
-        'email': 'البريد الإلكتروني',
-        'password': 'كلمة المرور',
-        'name': 'الاسم الكامل',
-        'phone': 'الهاتف',
-        'find_doctor': 'ابحث عن طبيبك',
-        'search_subtitle': 'ابحث حسب التخصص والمدينة',
-        'all_specialties': 'جميع التخصصات',
-        'all_cities': 'جميع المدن',
-        'available_doctors': 'الأطباء المتاحون',
-        'today_appointments': 'اليوم',
-        'queue_status': 'في الانتظار',
-        'no_appointments': 'لا توجد مواعيد',
-        'appointment_booked': 'تم تأكيد الموعد!',
-        'login_required': 'سجل الدخول لحجز موعد',
-        'welcome': 'مرحبا',
-        'address': 'العنوان',
-        'bio': 'السيرة الذاتية',
-        'confirmed': 'مؤكد',
-        'completed': 'مكتمل',
-        'cancelled': 'ملغى',
-        'no_show_status': 'غائب',
-        'waiting': 'في الانتظار',
-        'total': 'المجموع',
-        'my_account': 'حسابي',
-        'my_info': 'معلوماتي',
-        'health_record': 'السجل الصحي',
-        'security': 'الأمان',
-        'relatives': 'أقاربي',
-        'save': 'حفظ',
-        'blood_type': 'فصيلة الدم',
-        'weight': 'الوزن',
-        'height': 'الطول',
-        'allergies': 'الحساسية',
-        'vaccines': 'اللقاحات',
-        'dob': 'تاريخ الميلاد',
-        'your_turn_message': 'دورك يقترب',
-        'estimated_wait_time': 'وقت الانتظار المقدر',
-        'confirm_presence': 'أؤكد حضوري',
-    }
-}
-
-def get_t():
-    lang = session.get('lang', 'fr')
-    return TRANSLATIONS.get(lang, TRANSLATIONS['fr'])
-
-def initialize_demo_data():
-    import random
-
-    cities = ["Alger", "Oran", "Constantine", "Annaba", "Setif", "Bejaia", "Tlemcen", "Blida"]
-    specialties = ["Médecin Généraliste", "Dentiste", "Cardiologue", "Pédiatre", "Dermatologue", "Gynécologue", "Ophtalmologue"]
-    first_names = ["Mohamed", "Amine", "Sarah", "Fatima", "Youssef", "Karim", "Nadia", "Amina", "Rachid", "Leila", "Yasmine", "Omar", "Lina", "Anis"]
-    last_names = ["Benali", "Saidi", "Dahmani", "Boudiaf", "Hadj", "Mebarki", "Hamidi", "Cherif", "Bouzid", "Belkacem", "Rahmouni", "Meziane"]
-    street_names = ['Didouche Mourad', 'Ben Mhidi', 'Abane Ramdane', 'Amirouche', 'Pasteur']
-
-    for i in range(50):
-        first = random.choice(first_names)
-        last = random.choice(last_names)
-        full_name = f"Dr. {first} {last}"
-        city_choice = random.choice(cities)
-        specialty = random.choice(specialties)
-
-        user = User(
-            email=f"doctor{i+1}@tbib.dz",
-            role='doctor',
-            name=full_name,
-            phone=f"05{random.randint(10000000, 99999999)}",
-            city=city_choice
-        )
-        user.set_password('doctor123')
-        db.session.add(user)
-        db.session.flush()
-
-        doctor_profile = DoctorProfile(
-            user_id=user.id,
-            specialty=specialty,
-            city=city_choice,
-            address=f"{random.randint(1, 200)} Rue {random.choice(street_names)}",
-            bio=f"Médecin expérimenté diplômé de l'Université d'Alger, spécialiste en {specialty.lower()} avec plus de 10 ans d'expérience.",
-            waiting_room_count=0,
-            languages="Français, Arabe",
-            payment_methods="Espèces, Carte bancaire"
-        )
-        db.session.add(doctor_profile)
-        db.session.flush()
-
-        start_t = time(9, 0)
-        end_t = time(17, 0)
-        for day in range(5):
-            availability = DoctorAvailability(
-                doctor_id=doctor_profile.id,
-                day_of_week=day,
-                start_time=start_t,
-                end_time=end_t,
-                is_available=True
-            )
-            db.session.add(availability)
-
-        consultation = ConsultationType(
-            doctor_id=doctor_profile.id,
-            name="Consultation",
-            duration=30,
-            price="2000 DA",
-            color="#14b999",
-            is_active=True
-        )
-        db.session.add(consultation)
-
-        urgence = ConsultationType(
-            doctor_id=doctor_profile.id,
-            name="Urgence",
-            duration=15,
-            price="3000 DA",
-            color="#ef4444",
-            is_active=True
-        )
-        db.session.add(urgence)
-
-    db.session.commit()
-    print("✅ DATABASE INITIALIZED: 50 Doctors & Schedules Created!")
-
+@main_bp.route('/sw.js')
+def service_worker():
+    # Servi à la racine : la portée du service worker couvre tout le site (ticket live inclus),
+    # pas seulement /static/. send_static_file pose 'no-cache' : chaque déploiement est vu.
+    return current_app.send_static_file('sw.js')
 
 @main_bp.route('/legal/cgu')
+@revalidate
 def legal_cgu():
-    return render_template('legal/cgu.html', t=get_t(), lang=session.get('lang', 'fr'))
+    return render_template('legal/cgu.html', lang=session.get('lang', 'fr'))
 
 @main_bp.route('/legal/privacy')
+@revalidate
 def legal_privacy():
-    return render_template('legal/privacy.html', t=get_t(), lang=session.get('lang', 'fr'))
+    return render_template('legal/privacy.html', lang=session.get('lang', 'fr'))
 
 @main_bp.route('/contact', methods=['GET', 'POST'])
 def contact():
@@ -223,54 +44,62 @@ def contact():
         # Ici on pourrait envoyer un email ou sauvegarder le message
         flash('Votre message a bien été envoyé. Nous vous répondrons bientôt.', 'success')
         return redirect(url_for('main.contact'))
-    return render_template('contact.html', t=get_t(), lang=session.get('lang', 'fr'))
+    return render_template('contact.html', lang=session.get('lang', 'fr'))
 
 @main_bp.route('/')
 def home():
         if current_user.is_authenticated and current_user.role == 'doctor':
             return redirect(url_for('main.doctor_dashboard'))
 
+        # Facettes et nombre de médecins servis depuis la mémoire (aucune requête)
         try:
-            doctor_count = DoctorProfile.query.count()
+            facets = facet_cache.get()
+            doctor_count = facets.doctor_count
         except:
             db.create_all()
+            facets = None
             doctor_count = 0
 
         if doctor_count == 0:
             print("⚠ DATABASE EMPTY. INITIALIZING DEMO DATA...")
+            from seed_data import initialize_demo_data
             initialize_demo_data()
             return redirect(url_for('main.home'))
 
         specialty = request.args.get('specialty', '')
         city = request.args.get('city', '')
-        search_mode = bool(specialty or city)
+        q = request.args.get('q', '').strip()
+        after = request.args.get('after') or None
+        search_mode = bool(specialty or city or q)
         doctors = []
+        next_cursor = None
 
         if search_mode:
-            # ✅ FIX: Spécifie explicitement la condition de jointure
-            query = DoctorProfile.query.join(User, DoctorProfile.user_id == User.id)
-            if specialty:
-                query = query.filter(DoctorProfile.specialty.ilike(f'%{specialty}%'))
-            if city:
-                query = query.filter(DoctorProfile.city.ilike(f'%{city}%'))
-            doctors = query.all()
-
-        specialties = db.session.query(DoctorProfile.specialty).distinct().all()
-        cities = db.session.query(DoctorProfile.city).distinct().all()
+            # Index de recherche (FTS5 / pg_trgm) : accents, arabe et variantes tolérés
+            try:
+                doctors, next_cursor = search_doctors(q=q, specialty=specialty, city=city, after=after)
+            except InvalidCursor:
+                # Lien périmé ou modifié à la main : repartir de la première page
+                after = None
+                doctors, next_cursor = search_doctors(q=q, specialty=specialty, city=city)
 
         return render_template('home.html',
                                doctors=doctors,
                                search_mode=search_mode,
-                               specialties=[s[0] for s in specialties],
-                               cities=[c[0] for c in cities],
+                               specialties=facets.specialties,
+                               cities=facets.cities,
+                               specialty_counts=facets.specialty_counts,
+                               city_counts=facets.city_counts,
                                selected_specialty=specialty,
                                selected_city=city,
-                               t=get_t(),
+                               q=q,
+                               after=after,
+                               next_cursor=next_cursor,
                                lang=session.get('lang', 'fr'))
 
 @main_bp.route('/set_language/<lang>')
 def set_language(lang):
-    if lang in ['fr', 'ar']:
+    if lang in LANGUAGES:
         session['lang'] = lang
     return redirect(request.referrer or url_for('main.home'))
 
@@ -297,7 +126,7 @@ def login():
             return redirect(url_for('main.home'))
         flash('Email ou mot de passe incorrect', 'error')
 
-    return render_template('login.html', next_url=next_url, t=get_t(), lang=session.get('lang', 'fr'))
+    return render_template('login.html', next_url=next_url, lang=session.get('lang', 'fr'))
 
 @main_bp.route('/register', methods=['GET', 'POST'])
 def register():
@@ -315,7 +144,7 @@ def register():
 
         if User.query.filter_by(email=email).first():
             flash('Cet email est déjà utilisé', 'error')
-            return render_template('register.html', role=role, t=get_t(), lang=session.get('lang', 'fr'))
+            return render_template('register.html', role=role, lang=session.get('lang', 'fr'))
 
         user = User(email=email, name=name, phone=phone, role=role)
         user.set_password(password)
@@ -344,7 +173,7 @@ def register():
             return redirect(url_for('main.doctor_dashboard'))
         return redirect(url_for('main.home'))
 
-    return render_template('register.html', role=role, t=get_t(), lang=session.get('lang', 'fr'))
+    return render_template('register.html', role=role, lang=session.get('lang', 'fr'))
 
 @main_bp.route('/logout')
 @login_required
@@ -424,6 +253,7 @@ def book_appointment(doctor_id):
                 new_appointment.is_shadow_slot = True
                 db.session.add(new_appointment)
                 db.session.commit()
+                notify_queue_change(new_appointment)
                 flash('Réservation confirmée (Priorité SmartFlow)', 'info')
                 return redirect(url_for('main.my_appointments'))
             else:
@@ -440,28 +270,25 @@ def book_appointment(doctor_id):
 
             db.session.add(new_appointment)
             db.session.commit()
+            notify_queue_change(new_appointment)
             flash('Rendez-vous confirmé.', 'success')
             return redirect(url_for('main.my_appointments'))
 
         # --- FIN LOGIQUE SMARTFLOW ---
     else:
-        today_count = Appointment.query.filter_by(
-            doctor_id=doctor_id,
-            appointment_date=date.today()
-        ).count()
-
         appointment = Appointment(
             patient_id=current_user.id,
             doctor_id=doctor_id,
             status='confirmed',
             appointment_date=date.today(),
             booking_type='walk_in',
-            queue_number=today_count + 1
+            queue_number=next_queue_number(doctor_id, date.today())
         )
         db.session.add(appointment)
         db.session.commit()
+        notify_queue_change(appointment)
 
-    flash(get_t()['appointment_booked'], 'success')
+    flash(translate('appointment_booked'), 'success')
     return redirect(url_for('main.my_appointments'))
 
 @main_bp.route('/my-appointments')
@@ -483,7 +310,6 @@ def my_appointments():
                            appointments=appointments,
                            get_token=get_token,  # <--- On passe la clé ici
                            today=date.today(),
-                           t=get_t(), 
                            lang=session.get('lang', 'fr'))
 @main_bp.route('/patient/profile', methods=['GET', 'POST'])
 @main_bp.route('/patient/profile/<section>', methods=['GET', 'POST'])
@@ -540,7 +366,6 @@ def patient_profile(section='info'):
     return render_template('patient_profile.html',
                            section=section,
                            health_record=health_record,
-                           t=get_t(),
                            lang=session.get('lang', 'fr'))
 
 
@@ -560,7 +385,6 @@ def patient_health_record():
     return render_template('patient_health_record.html',
                            health_record=health_record,
                            today=date.today(),
-                           t=get_t(),
                            lang=session.get('lang', 'fr'))
 
 
@@ -643,27 +467,17 @@ def doctor_dashboard():
     try:
         current_app.logger.info(f"Dashboard access by Doctor {current_user.id}")
         doctor_profile = current_user.doctor_profile
+        snapshot = get_queue_snapshot(doctor_profile.id)
 
-        waiting_count = Appointment.query.filter(
-            Appointment.doctor_id == doctor_profile.id,
-            Appointment.appointment_date == date.today(),
-            Appointment.queue_number.isnot(None),
-            Appointment.status.in_(['confirmed', 'waiting'])
-        ).count()
+        waiting_count = snapshot.count(['confirmed', 'waiting'], queued_only=True)
         
         # Calcul recette du jour
-        today_revenue = db.session.query(db.func.sum(Appointment.price_paid)).filter(
-            Appointment.doctor_id == doctor_profile.id,
-            Appointment.appointment_date == date.today(),
-            Appointment.status == 'completed',
-            Appointment.price_paid.isnot(None)
-        ).scalar() or 0
+        today_revenue = snapshot.revenue()
 
         return render_template('doctor_dashboard.html',
                             doctor_profile=doctor_profile,
                             waiting_count=waiting_count,
                             today_revenue=today_revenue,
-                            t=get_t(),
                             lang=session.get('lang', 'fr'))
     except Exception as e:
         current_app.logger.error(f"Error accessing doctor dashboard for user {current_user.id}: {str(e)}", exc_info=True)
@@ -690,7 +504,6 @@ def secretary_dashboard():
     return render_template('secretary_dashboard.html',
                            doctor=doctor,
                            today=date.today(),
-                           t=get_t(),
                            lang=session.get('lang', 'fr'))
 
 
@@ -712,39 +525,37 @@ def api_secretary_appointments():
     except ValueError:
         target_date = date.today()
     
-    # Filtre STRICT par doctor.id
-    appointments = Appointment.query.filter(
-        Appointment.doctor_id == doctor.id,
-        Appointment.appointment_date == target_date
-    ).order_by(Appointment.appointment_time).all()
+    # Filtre STRICT par doctor.id (snapshot partagé de la file du jour demandé)
+    snapshot = get_queue_snapshot(doctor.id, target_date)
+    appointments = snapshot.rows
     
     # Stats
     stats = {
-        'waiting': sum(1 for a in appointments if a.status in ['confirmed', 'waiting']),
-        'checked_in': sum(1 for a in appointments if a.status == 'checked_in'),
-        'completed': sum(1 for a in appointments if a.status == 'completed'),
+        'waiting': snapshot.count(['confirmed', 'waiting']),
+        'checked_in': snapshot.count(['checked_in']),
+        'completed': snapshot.count(['completed']),
         'total': len(appointments)
     }
     
     # Waiting room
     waiting_room = []
     for a in appointments:
-        if a.status == 'checked_in' and a.check_in_time:
-            wait_mins = int((datetime.now() - a.check_in_time).total_seconds() / 60)
+        if a['status'] == 'checked_in' and a['check_in_time']:
+            wait_mins = int((datetime.now() - a['check_in_time']).total_seconds() / 60)
             waiting_room.append({
-                'id': a.id,
-                'name': a.patient.name if a.patient else 'Patient',
-                'arrival_time': a.check_in_time.strftime('%H:%M'),
+                'id': a['id'],
+                'name': a['patient_name'] or 'Patient',
+                'arrival_time': a['check_in_time'].strftime('%H:%M'),
                 'wait_time': wait_mins
             })
     
     response = jsonify({
         'appointments': [{
-            'id': a.id,
-            'patient_name': a.patient.name if a.patient else 'Patient',
-            'time': a.appointment_time.strftime('%H:%M') if a.appointment_time else '--:--',
-            'status': a.status,
-            'reason': a.consultation_reason
+            'id': a['id'],
+            'patient_name': a['patient_name'] or 'Patient',
+            'time': a['appointment_time'].strftime('%H:%M') if a['appointment_time'] else '--:--',
+            'status': a['status'],
+            'reason': a['consultation_reason']
         } for a in appointments],
         'waiting_room': waiting_room,
         'stats': stats
@@ -773,6 +584,7 @@ def api_secretary_checkin(appointment_id):
     appointment.status = 'checked_in'
     appointment.check_in_time = datetime.now()
     db.session.commit()
+    notify_queue_change(appointment, CHECK_IN)
     
     return jsonify({'success': True, 'message': 'Patient enregistré'})
 
@@ -830,6 +642,7 @@ def api_secretary_quick_appointment():
     )
     db.session.add(appointment)
     db.session.commit()
+    notify_queue_change(appointment)
     
     return jsonify({'success': True, 'appointment_id': appointment.id})
 
@@ -847,7 +660,6 @@ def dashboard():
     return render_template('doctor_dashboard.html',
                            doctor=doctor_profile,
                            wait_time=wait_time,
-                           t=get_t(),
                            lang=session.get('lang', 'fr'))
 
 @main_bp.route('/ticket/<int:patient_id>')
@@ -865,7 +677,6 @@ def patient_ticket(patient_id):
 
     return render_template('patient_ticket.html',
                            wait_time=wait_time,
-                           t=get_t(),
                            lang=session.get('lang', 'fr'))
 
 @main_bp.route('/doctor/next-patient', methods=['POST'])
@@ -878,6 +689,7 @@ def next_patient():
         doctor_profile = current_user.doctor_profile
 
         # 1. Terminer le patient précédent (si applicable)
+        previous_appointment = None
         if doctor_profile.waiting_room_count > 0:
             previous_appointment = Appointment.query.filter_by(
                 doctor_id=doctor_profile.id,
@@ -913,6 +725,7 @@ def next_patient():
             # mais généralement le patient check-in avant.
 
         db.session.commit()
+        queue_events.publish(NEXT_PATIENT, doctor_profile.id, date.today(), previous_appointment)
 
         return jsonify({
             'success': True,
@@ -936,6 +749,7 @@ def mark_no_show(appointment_id):
         if appointment.doctor_id == current_user.doctor_profile.id:
             appointment.status = 'no_show'
             db.session.commit()
+            notify_queue_change(appointment, NO_SHOW)
             current_app.logger.info(f"Appointment {appointment_id} marked as no-show by doctor {current_user.id}")
     except Exception as e:
         db.session.rollback()
@@ -964,6 +778,7 @@ def mark_patient_present(appt_id):
             new_score = SmartFlowService.update_prs_on_present(patient.id)
         
         db.session.commit()
+        notify_queue_change(appointment, PRESENT)
         current_app.logger.info(f"Appointment {appt_id} marked as present by doctor {current_user.id}")
         flash("Patient confirmé. Score de fiabilité augmenté (+2).", "success")
         
@@ -998,6 +813,7 @@ def mark_patient_noshow(appt_id):
             new_score = SmartFlowService.update_prs_on_noshow(patient.id)
         
         db.session.commit()
+        notify_queue_change(appointment, NO_SHOW)
         current_app.logger.info(f"Appointment {appt_id} marked as no-show by doctor {current_user.id}")
         flash("Absence signalée. Score de fiabilité diminué (-20).", "warning")
         
@@ -1051,6 +867,7 @@ def undo_noshow(appt_id):
              flash("Patient marqué en retard. Pénalité ajustée (-5 pts).", "warning")
 
         db.session.commit()
+        notify_queue_change(appointment)
 
         return jsonify({
             'success': True,
@@ -1074,6 +891,7 @@ def cancel_appointment(appointment_id):
     if appointment.patient_id == current_user.id:
         appointment.status = 'cancelled'
         db.session.commit()
+        notify_queue_change(appointment)
 
     return redirect(url_for('main.my_appointments'))
 
@@ -1107,33 +925,20 @@ def shift_appointments_api():
 def get_queue_status(doctor_id):
     """Retourne l'état de la file d'attente avec données SmartFlow."""
     doctor = DoctorProfile.query.get_or_404(doctor_id)
+    snapshot = get_queue_snapshot(doctor_id)
 
     # Comptage des patients en attente
-    waiting_count = Appointment.query.filter_by(
-        doctor_id=doctor_id,
-        appointment_date=date.today(),
-        status='confirmed'
-    ).count()
-
-    checked_in_count = Appointment.query.filter_by(
-        doctor_id=doctor_id,
-        appointment_date=date.today(),
-        status='waiting'
-    ).count()
+    waiting_count = snapshot.count(['confirmed'])
+    checked_in_count = snapshot.count(['waiting'])
 
     # Patient actuel
     current_patient = None
-    current_appt = Appointment.query.filter_by(
-        doctor_id=doctor_id,
-        appointment_date=date.today(),
-        queue_number=doctor.waiting_room_count
-    ).first()
+    current_appt = snapshot.at_queue_number(doctor.waiting_room_count)
     if current_appt:
-        current_patient = current_appt.patient.name
+        current_patient = current_appt['patient_name']
 
     # === SmartFlow: Détection du Drift ===
-    optimizer = QueueOptimizer()
-    drift_info = optimizer.detect_drift(doctor_id)
+    drift_info = snapshot.drift
 
     response = jsonify({
         'current_serving': doctor.waiting_room_count,
@@ -1166,15 +971,13 @@ def check_in_patient(appointment_id):
         # Logique SmartFlow (Queue Number)
         if not appointment.queue_number:
             # Assigner un numéro s'il n'en a pas
-            max_queue = db.session.query(func.max(Appointment.queue_number))\
-                .filter(Appointment.doctor_id == current_user.doctor_profile.id, 
-                        Appointment.appointment_date == date.today()).scalar() or 0
-            appointment.queue_number = max_queue + 1
+            appointment.queue_number = next_queue_number(current_user.doctor_profile.id, date.today())
 
         if not appointment.arrival_time:
             appointment.arrival_time = datetime.now()
 
         db.session.commit()
+        notify_queue_change(appointment, CHECK_IN)
 
         return jsonify({
             'success': True,
@@ -1196,55 +999,22 @@ def get_doctor_slots(doctor_id):
         start_date = date.today()
 
     slots = {}
+    window = AvailabilityWindow(
+        doctor_id,
+        start_date,
+        start_date + timedelta(days=max(days, 1) - 1),
+        statuses=('confirmed',)
+    )
+    now = datetime.now()
 
     for i in range(days):
         current_date = start_date + timedelta(days=i)
-        day_of_week = current_date.weekday()
 
-        availability = DoctorAvailability.query.filter_by(
-            doctor_id=doctor_id,
-            day_of_week=day_of_week,
-            is_available=True
-        ).first()
-
-        if availability:
-            start_time = availability.start_time
-            end_time = availability.end_time
-        else:
-            start_time = time(9, 0)
-            end_time = time(17, 0)
-
-        existing_appointments = Appointment.query.filter_by(
-            doctor_id=doctor_id,
-            appointment_date=current_date,
-            status='confirmed'
-        ).all()
-
-        booked_times = set()
-        for appt in existing_appointments:
-            if appt.appointment_time:
-                booked_times.add(appt.appointment_time.strftime('%H:%M'))
-
-        day_slots = []
-        current_time = datetime.combine(current_date, start_time)
-        end_datetime = datetime.combine(current_date, end_time)
-
-        now = datetime.now()
-
-        while current_time < end_datetime:
-            time_str = current_time.strftime('%H:%M')
-
-            # HIDE PAST SLOTS: Si c'est aujourd'hui, on ignore les créneaux passés
-            if current_date == date.today() and current_time <= datetime.now():
-                current_time += timedelta(minutes=30)
-                continue
+        # HIDE PAST SLOTS: Si c'est aujourd'hui, on ignore les créneaux passés
+        not_before = now if current_date == date.today() else None
+        day_slots = window.free_slots(current_date, duration=30, step=30, not_before=not_before)
 
-            if time_str not in booked_times:
-                day_slots.append(time_str)
-
-            current_time += timedelta(minutes=30)
-
-        slots[current_date.isoformat()] = day_slots
+        slots[current_date.isoformat()] = [slot.strftime('%H:%M') for slot in day_slots]
 
     response = jsonify(slots)
     # FORCE REFRESH: Horaires Temps Réel
@@ -1252,11 +1022,11 @@ def get_doctor_slots(doctor_id):
     return response
 
 @main_bp.route('/doctor/<int:doctor_id>')
+@revalidate
 def doctor_profile(doctor_id):
     doctor = DoctorProfile.query.get_or_404(doctor_id)
     return render_template('doctor_detail.html',
                            doctor=doctor,
-                           t=get_t(),
                            lang=session.get('lang', 'fr'))
 
 @main_bp.route('/admin/seed_50_doctors')
@@ -1294,7 +1064,9 @@ def api_doctor_appointments():
         start_date = date.today() - timedelta(days=7)
         end_date = date.today() + timedelta(days=30)
 
-    appointments = Appointment.query.filter(
+    appointments = Appointment.query.options(
+        *appointment_options('doctor_calendar')
+    ).filter(
         Appointment.doctor_id == doctor_profile.id,
         Appointment.appointment_date >= start_date,
         Appointment.appointment_date <= end_date
@@ -1408,11 +1180,7 @@ def update_appointment_status(appointment_id):
             appointment.doctor_notes = f"DIAGNOSTIC: {diagnosis}\n\n{existing_notes}".strip()
 
         if new_status == 'waiting' and appointment.queue_number is None:
-            max_queue = db.session.query(db.func.max(Appointment.queue_number)).filter(
-                Appointment.doctor_id == current_user.doctor_profile.id,
-                Appointment.appointment_date == date.today()
-            ).scalar() or 0
-            appointment.queue_number = max_queue + 1
+            appointment.queue_number = next_queue_number(current_user.doctor_profile.id, date.today())
 
         if new_status == 'no_show':
             appointment.patient.no_show_count = (appointment.patient.no_show_count or 0) + 1
@@ -1420,6 +1188,7 @@ def update_appointment_status(appointment_id):
                 appointment.patient.is_blocked = True
 
         db.session.commit()
+        notify_queue_change(appointment)
         current_app.logger.info(f"Status update for appt {appointment_id}: {old_status} -> {new_status} by doctor {current_user.id}")
 
         return jsonify({
@@ -1460,41 +1229,55 @@ def doctor_patients():
     doctor_profile = current_user.doctor_profile
     search_query = request.args.get('q', '').strip()
 
-    patient_subquery = db.session.query(
-        Appointment.patient_id,
-        db.func.max(Appointment.appointment_date).label('last_visit'),
-        db.func.count(Appointment.id).label('visit_count')
-    ).filter(
-        Appointment.doctor_id == doctor_profile.id
-    ).group_by(Appointment.patient_id).subquery()
-
-    query = db.session.query(
-        User,
-        patient_subquery.c.last_visit,
-        patient_subquery.c.visit_count
-    ).join(patient_subquery, User.id == patient_subquery.c.patient_id)
-
-    if search_query:
-        query = query.filter(User.name.ilike(f'%{search_query}%'))
-
-    patients_data = query.order_by(patient_subquery.c.last_visit.desc()).all()
-
-    patients = [{
-        'user': p[0],
-        'last_visit': p[1],
-        'visit_count': p[2]
-    } for p in patients_data]
+    # Page suivante chargée par HTMX quand la dernière ligne devient visible
+    try:
+        patients, next_cursor = patient_page(doctor_profile.id, search_query,
+                                             after=request.args.get('after') or None)
+    except InvalidCursor:
+        patients, next_cursor = patient_page(doctor_profile.id, search_query)
 
     if request.headers.get('HX-Request'):
-        return render_template('partials/patient_rows.html', patients=patients)
+        return render_template('partials/patient_rows.html', patients=patients,
+                               next_cursor=next_cursor, search_query=search_query)
 
     return render_template('doctor_patients.html',
                            patients=patients,
+                           next_cursor=next_cursor,
+                           patient_total=patient_count(doctor_profile.id, search_query),
                            search_query=search_query,
-                           t=get_t(),
                            lang=session.get('lang', 'fr'))
 
 
+@main_bp.route('/api/doctor/patients')
+@login_required
+def api_doctor_patients():
+    """Patients du médecin connecté, plus récents d'abord : q, after (curseur), per_page."""
+    if current_user.role != 'doctor':
+        return jsonify({'error': 'Unauthorized'}), 403
+
+    try:
+        patients, next_cursor = patient_page(
+            current_user.doctor_profile.id,
+            request.args.get('q', '').strip(),
+            after=request.args.get('after') or None,
+            per_page=request.args.get('per_page', PATIENTS_PER_PAGE, type=int)
+        )
+    except InvalidCursor:
+        return jsonify({'error': 'Curseur invalide'}), 400
+
+    return jsonify({
+        'patients': [{
+            'id': p['user'].id,
+            'name': p['user'].name,
+            'phone': p['user'].phone or '',
+            'city': p['user'].city or '',
+            'last_visit': p['last_visit'].isoformat() if p['last_visit'] else None,
+            'visit_count': p['visit_count']
+        } for p in patients],
+        'next_cursor': next_cursor
+    })
+
+
 @main_bp.route('/api/doctor/patient/<int:patient_id>/history')
 @login_required
 def get_patient_history(patient_id):
@@ -1512,10 +1295,12 @@ def get_patient_history(patient_id):
     # if not has_relationship:
     #     return jsonify({'error': 'Patient not found'}), 404
 
-    patient = User.query.get_or_404(patient_id)
+    patient = User.query.options(*patient_options('patient_history')).filter_by(id=patient_id).first_or_404()
     health_record = patient.health_record
 
-    appointments = Appointment.query.filter(
+    appointments = Appointment.query.options(
+        *appointment_options('patient_history')
+    ).filter(
         Appointment.doctor_id == doctor_profile.id,
         Appointment.patient_id == patient_id
     ).order_by(Appointment.appointment_date.desc(), Appointment.appointment_time.desc()).all()
@@ -1666,6 +1451,7 @@ def complete_consultation(appointment_id):
             patient.reliability_score = min(100.0, current_score + 2.0)
         
         db.session.commit()
+        notify_queue_change(appointment, COMPLETED)
         current_app.logger.info(f"Consultation {appointment_id} completed by doctor {current_user.id}")
         
         return jsonify({
@@ -1711,7 +1497,6 @@ def doctor_settings():
                            absences=absences,
                            availability=availability,
                            secretaries=secretaries,
-                           t=get_t(),
                            lang=session.get('lang', 'fr'))
 
 
@@ -1771,6 +1556,7 @@ def doctor_settings_availability():
         db.session.add(slot)
 
     db.session.commit()
+    invalidate_weekly_template(doctor_id)
     flash('Horaires enregistrés !', 'success')
     return redirect(url_for('main.doctor_settings'))
 
@@ -1856,6 +1642,7 @@ def add_absence():
 
     db.session.add(absence)
     db.session.commit()
+    invalidate_weekly_template(doctor_id)
 
     return jsonify({
         'success': True,
@@ -1875,6 +1662,7 @@ def delete_absence(absence_id):
 
     db.session.delete(absence)
     db.session.commit()
+    invalidate_weekly_template(absence.doctor_id)
 
     return jsonify({'success': True})
 
@@ -1954,6 +1742,7 @@ def toggle_secretary_delegation(secretary_id):
     return jsonify({'success': True})
 
 @main_bp.route('/api/doctors/<int:doctor_id>/consultation-types')
+@public(max_age=300)  # Identique pour tous ; les modifications du médecin visibles sous 5 min
 def get_consultation_types(doctor_id):
     doctor = DoctorProfile.query.get_or_404(doctor_id)
     types = ConsultationType.query.filter_by(doctor_id=doctor_id, is_active=True).all()
@@ -2020,82 +1809,110 @@ def get_smart_slots(doctor_id):
     if current_user.is_authenticated and (current_user.no_show_count or 0) >= 3:
         return jsonify({'error': 'Your account is blocked due to repeated no-shows', 'slots': {}})
 
-    absences = DoctorAbsence.query.filter(
-        DoctorAbsence.doctor_id == doctor_id,
-        DoctorAbsence.end_date >= datetime.combine(start_date, time(0, 0))
-    ).all()
+    # Une requête par table pour toute la fenêtre (horaires, absences, RDV)
+    window = AvailabilityWindow(
+        doctor_id,
+        start_date,
+        start_date + timedelta(days=max(days, 1) - 1)
+    )
+    now = datetime.now()
 
     slots = {}
 
     for i in range(days):
         current_date = start_date + timedelta(days=i)
-        day_of_week = current_date.weekday()
 
-        is_absent = False
-        for absence in absences:
-            if absence.start_date.date() <= current_date <= absence.end_date.date():
-                is_absent = True
-                break
+        # HIDE PAST SLOTS: Filtrage strict pour le dashboard
+        not_before = now if current_date == date.today() else None
+        day_slots = window.free_slots(current_date, duration=duration, step=15, not_before=not_before)
 
-        if is_absent:
-            slots[current_date.isoformat()] = []
-            continue
+        slots[current_date.isoformat()] = [slot.strftime('%H:%M') for slot in day_slots]
 
-        availability = DoctorAvailability.query.filter_by(
-            doctor_id=doctor_id,
-            day_of_week=day_of_week,
-            is_available=True
-        ).first()
-
-        if availability:
-            slot_start_time = availability.start_time
-            slot_end_time = availability.end_time
-        else:
-            slot_start_time = time(9, 0)
-            slot_end_time = time(17, 0)
-
-        existing_appointments = Appointment.query.filter(
-            Appointment.doctor_id == doctor_id,
-            Appointment.appointment_date == current_date,
-            Appointment.status.in_(['confirmed', 'waiting'])
-        ).all()
-
-        booked_ranges = []
-        for appt in existing_appointments:
-            if appt.appointment_time:
-                appt_duration = appt.consultation_type.duration if appt.consultation_type else 30
-                appt_start = datetime.combine(current_date, appt.appointment_time)
-                appt_end = appt_start + timedelta(minutes=appt_duration)
-                booked_ranges.append((appt_start, appt_end))
-
-        day_slots = []
-        current_time = datetime.combine(current_date, slot_start_time)
-        end_datetime = datetime.combine(current_date, slot_end_time)
+    response = jsonify({'slots': slots})
+    # FORCE REFRESH: Horaires Temps Réel
+    response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
+    return response
 
-        now = datetime.now()
 
-        while current_time + timedelta(minutes=duration) <= end_datetime:
-            slot_end = current_time + timedelta(minutes=duration)
+@main_bp.route('/api/doctors/search')
+def api_search_doctors():
+    """Recherche classée de médecins : q, specialty, city, after (curseur), per_page."""
+    per_page = request.args.get('per_page', DEFAULT_PER_PAGE, type=int)
+    try:
+        doctors, next_cursor = search_doctors(
+            q=request.args.get('q', ''),
+            specialty=request.args.get('specialty', ''),
+            city=request.args.get('city', ''),
+            after=request.args.get('after') or None,
+            per_page=per_page
+        )
+    except InvalidCursor:
+        return jsonify({'error': 'Curseur invalide'}), 400
 
-            # HIDE PAST SLOTS: Filtrage strict pour le dashboard
-            if current_date == date.today() and current_time <= datetime.now():
-                current_time += timedelta(minutes=15)
-                continue
+    return jsonify({
+        'doctors': [{
+            'id': doctor.id,
+            'name': doctor.user.name,
+            'specialty': doctor.specialty,
+            'city': doctor.city,
+            'languages': doctor.languages or '',
+            'profile_picture': doctor.profile_picture or ''
+        } for doctor in doctors],
+        'next_cursor': next_cursor
+    })
 
-            conflict = False
-            for booked_start, booked_end in booked_ranges:
-                if not (slot_end <= booked_start or current_time >= booked_end):
-                    conflict = True
-                    break
 
-            if not conflict:
-                day_slots.append(current_time.strftime('%H:%M'))
+@main_bp.route('/api/slots/search')
+def search_slots():
+    """
+    Premiers créneaux libres de tous les médecins d'une spécialité / ville.
 
-            current_time += timedelta(minutes=15)
+    Une requête par table pour tout le lot de médecins (profils, horaires,
+    absences, RDV) au lieu d'un appel smart-slots par médecin.
+    Paramètres : specialty et/ou city (au moins un), from (AAAA-MM-JJ),
+    days (1-14), limit (1-100). Au plus SEARCH_MAX_DOCTORS médecins examinés.
+    """
+    specialty = request.args.get('specialty', '').strip()
+    city = request.args.get('city', '').strip()
+    if not specialty and not city:
+        return jsonify({'error': 'Précisez une spécialité ou une ville'}), 400
+    days = min(max(request.args.get('days', 7, type=int), 1), 14)
+    limit = min(max(request.args.get('limit', 20, type=int), 1), 100)
 
-        slots[current_date.isoformat()] = day_slots
+    try:
+        start_date = datetime.strptime(request.args.get('from', ''), '%Y-%m-%d').date()
+    except ValueError:
+        start_date = date.today()
+    start_date = max(start_date, date.today())
+
+    query = db.session.query(DoctorProfile, User.name).join(User, DoctorProfile.user_id == User.id)
+    if specialty:
+        query = query.filter(DoctorProfile.specialty.ilike(f'%{specialty}%'))
+    if city:
+        query = query.filter(DoctorProfile.city.ilike(f'%{city}%'))
+    # Route publique : lot de médecins borné, ordre stable
+    query = query.order_by(DoctorProfile.id).limit(SEARCH_MAX_DOCTORS)
+    doctors = {profile.id: (profile, name) for profile, name in query.all()}
+
+    windows = AvailabilityWindow.for_doctors(
+        list(doctors), start_date, start_date + timedelta(days=days - 1)
+    )
+    not_before = datetime.now() if start_date == date.today() else None
+    found = first_free_slots(windows, start_date, days, limit, duration=30, step=15, not_before=not_before)
+
+    slots = []
+    for start, doctor_id in found:
+        profile, name = doctors[doctor_id]
+        slots.append({
+            'doctor_id': doctor_id,
+            'doctor_name': name,
+            'specialty': profile.specialty,
+            'city': profile.city,
+            'date': start.date().isoformat(),
+            'time': start.strftime('%H:%M')
+        })
 
-    response = jsonify({'slots': slots})
+    response = jsonify({'slots': slots, 'doctor_count': len(doctors)})
     # FORCE REFRESH: Horaires Temps Réel
     response.headers["Cache-Control"] = "no-cache, no-store, must-revalidate"
     return response
@@ -2263,26 +2080,20 @@ def demo_force_login():
 
 @main_bp.route('/admin/ministry')
 def ministry_dashboard():
-    # 1. Calcul des Chiffres Clés
-    total_doctors = DoctorProfile.query.count()
-    total_cities = db.session.query(DoctorProfile.city).distinct().count()
-
-    # 2. Données pour l'équité (Carte/Liste)
-    doctors_per_city = db.session.query(
-        DoctorProfile.city,
-        db.func.count(DoctorProfile.id).label('count')
-    ).group_by(DoctorProfile.city).order_by(db.func.count(DoctorProfile.id).desc()).all()
-
-    underserved_cities = [city for city, count in doctors_per_city if count < 2]
-
-    # 3. Données de Veille Sanitaire (Anonymisées)
-    health_trends = {
-        'Grippe saisonnière': '+12%',
-        'Diabète Type 2': 'Stable',
-        'Hypertension': '+5%',
-        'Allergies': '-3%',
-        'Consultations préventives': '+8%'
-    }
+    # Lecture des agrégats (utils/rollups) : quelques petites lignes, pas de scan des tables sources
+    from utils import rollups
+
+    # 1. Données pour l'équité (Carte/Liste)
+    doctors_per_city = rollups.doctors_per_city()
+
+    # 2. Calcul des Chiffres Clés
+    total_doctors = sum(count for _, count in doctors_per_city)
+    total_cities = len(doctors_per_city)
+    underserved_cities = [city for city, count in doctors_per_city if count < rollups.UNDERSERVED_THRESHOLD]
+
+    # 3. Données de Veille Sanitaire (Anonymisées) : tendances semaine sur semaine
+    health_trends = rollups.health_trends()
+    appointments_per_specialty = rollups.appointments_per_specialty()
 
     # 4. Génération du Rapport Texte
     if underserved_cities:
@@ -2299,8 +2110,8 @@ def ministry_dashboard():
                            doctors_per_city=doctors_per_city,
                            underserved_cities=underserved_cities,
                            health_trends=health_trends,
+                           appointments_per_specialty=appointments_per_specialty,
                            report=report,
-                           t=get_t(),
                            lang=session.get('lang', 'fr')
                            )
 
@@ -2316,7 +2127,6 @@ def doctor_agenda():
     return render_template('doctor_agenda.html',
                            doctor_profile=doctor_profile,
                            doctor=doctor_profile,
-                           t=get_t(),
                            lang=session.get('lang', 'fr'))
 
 
@@ -2334,7 +2144,6 @@ def doctor_public_profile():
                            doctor=doctor_profile,
                            doctor_profile=doctor_profile,
                            consultation_types=consultation_types,
-                           t=get_t(),
                            lang=session.get('lang', 'fr'))
 
 
@@ -2351,88 +2160,98 @@ def add_walkin():
     from sqlalchemy.exc import IntegrityError
 
     print("DEBUG: Entering add_walkin")  # DEBUG
-    max_retries = 3
-    for retry in range(max_retries):
-        try:
-            doctor_profile = current_user.doctor_profile
-            patient_name = request.form.get('patient_name', 'Walk-in Patient')
-            phone = request.form.get('phone', '').strip()
-            urgency_level = int(request.form.get('urgency_level', 1))
+    try:
+        doctor_profile = current_user.doctor_profile
+        patient_name = request.form.get('patient_name', 'Walk-in Patient')
+        phone = request.form.get('phone', '').strip()
+        urgency_level = int(request.form.get('urgency_level', 1))
 
-            print(f"DEBUG: Form data - Name: {patient_name}, Phone: '{phone}', Urgency: {urgency_level}")
+        print(f"DEBUG: Form data - Name: {patient_name}, Phone: '{phone}', Urgency: {urgency_level}")
 
-            existing_patient = User.query.filter_by(phone=phone).first() if phone else None
+        existing_patient = User.query.filter_by(phone=phone).first() if phone else None
 
-            if existing_patient:
-                print(f"DEBUG: Found existing patient ID: {existing_patient.id}")
+        if existing_patient:
+            print(f"DEBUG: Found existing patient ID: {existing_patient.id}")
 
-            if not existing_patient:
-                print("DEBUG: Creating new ghost patient...")
-                temp_email = f"walkin_{uuid.uuid4().hex}@temp.tbib.dz"
-                secure_random_password = secrets.token_urlsafe(32)
+        if not existing_patient:
+            print("DEBUG: Creating new ghost patient...")
+            temp_email = f"walkin_{uuid.uuid4().hex}@temp.tbib.dz"
+            secure_random_password = secrets.token_urlsafe(32)
 
-                existing_patient = User(
-                    name=patient_name,
-                    email=temp_email,
-                    phone=phone if phone else None,
-                    role='patient',
-                    password_hash=generate_password_hash(secure_random_password),
-                    reliability_score=100.0
-                )
+            existing_patient = User(
+                name=patient_name,
+                email=temp_email,
+                phone=phone if phone else None,
+                role='patient',
+                password_hash=generate_password_hash(secure_random_password),
+                reliability_score=100.0
+            )
 
-                db.session.add(existing_patient)
-                db.session.flush()
-                print(f"DEBUG: New patient created with ID: {existing_patient.id}")
+            db.session.add(existing_patient)
+            db.session.flush()
+            print(f"DEBUG: New patient created with ID: {existing_patient.id}")
 
-            # Calcul du dernier ticket via SmartFlowService
-            from SERVICES.smartflow import SmartFlowService
+        # Calcul du dernier ticket via SmartFlowService
+        from SERVICES.smartflow import SmartFlowService
 
-            queue_number = SmartFlowService.assign_queue_number(
-                doctor_id=doctor_profile.id,
-                appointment_date=date.today()
-            )
+        queue_number = SmartFlowService.assign_queue_number(
+            doctor_id=doctor_profile.id,
+            appointment_date=date.today()
+        )
 
-            print(f"DEBUG: Creating appointment. Doctor ID: {doctor_profile.id}, Queue: {queue_number}")
+        print(f"DEBUG: Creating appointment. Doctor ID: {doctor_profile.id}, Queue: {queue_number}")
 
-            appointment = Appointment(
-                patient_id=existing_patient.id,
-                doctor_id=doctor_profile.id,
-                appointment_date=date.today(),
-                appointment_time=datetime.now().time(),
-                status='waiting',
-                queue_number=queue_number,
-                urgency_level=urgency_level,
-                consultation_reason='Walk-in / Urgence',
-                arrival_time=datetime.now()
-            )
-            db.session.add(appointment)
-            db.session.commit()
+        appointment = Appointment(
+            patient_id=existing_patient.id,
+            doctor_id=doctor_profile.id,
+            appointment_date=date.today(),
+            appointment_time=datetime.now().time(),
+            status='waiting',
+            queue_number=queue_number,
+            urgency_level=urgency_level,
+            consultation_reason='Walk-in / Urgence',
+            arrival_time=datetime.now()
+        )
+        db.session.add(appointment)
+        db.session.commit()
+        notify_queue_change(appointment, WALK_IN)
 
-            print("DEBUG: Appointment committed successfully.")
-            flash(f"Patient {patient_name} ajouté en urgence (Ticket #{queue_number}).", "success")
-            break
-
-        except IntegrityError as e:
-            print(f"DEBUG: IntegrityError: {e}")
-            db.session.rollback()
-            if retry == max_retries - 1:
-                current_app.logger.error("Failed to create walk-in patient after retries")
-                flash("Erreur lors de l'ajout du patient. Veuillez réessayer.", "error")
-            continue
-        except Exception as e:
-            print(f"DEBUG: Exception: {e}")
-            db.session.rollback()
-            current_app.logger.error(f"Error adding walk-in: {str(e)}", exc_info=True)
-            flash("Erreur lors de l'ajout du patient.", "error")
-            break
+        print("DEBUG: Appointment committed successfully.")
+        flash(f"Patient {patient_name} ajouté en urgence (Ticket #{queue_number}).", "success")
+
+    except IntegrityError as e:
+        print(f"DEBUG: IntegrityError: {e}")
+        db.session.rollback()
+        current_app.logger.error("Failed to create walk-in patient")
+        flash("Erreur lors de l'ajout du patient. Veuillez réessayer.", "error")
+    except Exception as e:
+        print(f"DEBUG: Exception: {e}")
+        db.session.rollback()
+        current_app.logger.error(f"Error adding walk-in: {str(e)}", exc_info=True)
+        flash("Erreur lors de l'ajout du patient.", "error")
 
     return redirect(url_for('main.doctor_dashboard'))
-from itsdangerous import URLSafeSerializer
+@lru_cache(maxsize=8)
+def _serializer_for(secret_key):
+    from itsdangerous import URLSafeSerializer
+    return URLSafeSerializer(secret_key)
 
 def get_serializer(secret_key=None):
+    # Un sérialiseur par clé, construit au premier ticket live (dérivation de clé comprise)
     if secret_key is None:
         secret_key = current_app.secret_key
-    return URLSafeSerializer(secret_key)
+    return _serializer_for(secret_key)
+
+def live_stream_enabled():
+    """
+    Le flux SSE garde la requête ouverte plusieurs minutes : avec un worker
+    synchrone (un seul client à la fois), un ticket ouvert bloquerait toute
+    l'application. Dans ce cas le ticket se met à jour par polling.
+    """
+    setting = current_app.config.get('LIVE_STREAM_ENABLED')
+    if setting is not None:
+        return setting
+    return bool(request.environ.get('wsgi.multithread'))
 
 @main_bp.route('/patient/live/<token>')
 def patient_live_ticket(token):
@@ -2440,50 +2259,20 @@ def patient_live_ticket(token):
         try:
             appointment_id = s.loads(token)
         except:
-            return render_template('404.html', t=get_t(), lang=session.get('lang', 'fr'))
+            return render_template('404.html', lang=session.get('lang', 'fr'))
 
         appointment = Appointment.query.get_or_404(appointment_id)
 
-        # 1. Récupérer les patients DEVANT (pas juste le nombre, mais les objets)
-        query = Appointment.query.filter(
-            Appointment.doctor_id == appointment.doctor_id,
-            Appointment.appointment_date == date.today(),
-            Appointment.status.in_(['waiting', 'confirmed'])
-        )
-
-        if appointment.queue_number:
-            # Si j'ai un ticket, je compte ceux qui ont un numéro plus petit
-            query = query.filter(Appointment.queue_number < appointment.queue_number)
-        else:
-            # Sinon, je compte ceux qui ont une heure prévue avant moi
-            query = query.filter(Appointment.appointment_time < appointment.appointment_time)
-
-        appointments_ahead = query.all()
-        waiting_ahead = len(appointments_ahead)
-
-        # 2. CALCUL PRÉCIS : Somme des durées réelles
-        base_wait = 0
-        for appt in appointments_ahead:
-            # Si le RDV a un type spécifique (ex: "Consultation longue"), on prend sa durée
-            # Sinon, on prend 30 min par défaut
-            duration = appt.consultation_type.duration if appt.consultation_type else 30
-            base_wait += duration
-
-        # 3. INTELLIGENCE SMARTFLOW : Ajout du "Météo Drift"
-        optimizer = QueueOptimizer()
-        drift_data = optimizer.detect_drift(appointment.doctor_id)
-        drift_minutes = drift_data.get('drift_minutes', 0)
-
-        # Temps Total = Somme des durées devant + Retard accumulé
-        estimated_wait = max(0, base_wait + drift_minutes)
+        # Position, attente et drift lus sur le snapshot partagé de la file
+        live = _live_ticket_payload(appointment)
 
         return render_template('live_ticket.html',
                                appointment=appointment,
-                               waiting_ahead=waiting_ahead,
-                               estimated_wait=int(estimated_wait),
-                               drift_minutes=int(drift_minutes),
-                               t=get_t(),
+                               waiting_ahead=live['waiting_ahead'],
+                               estimated_wait=live['estimated_wait'],
+                               drift_minutes=live['drift_minutes'],
                                token=token,
+                               stream_enabled=live_stream_enabled(),
                                lang=session.get('lang', 'fr'))
 
 @main_bp.route('/patient/live/status/<token>')
@@ -2496,43 +2285,74 @@ def patient_live_status(token):
 
         appointment = Appointment.query.get_or_404(appointment_id)
 
-        # Même logique de requête
-        query = Appointment.query.filter(
-            Appointment.doctor_id == appointment.doctor_id,
-            Appointment.appointment_date == date.today(),
-            Appointment.status.in_(['waiting', 'confirmed'])
-        )
+        return jsonify(_live_ticket_payload(appointment))
 
-        if appointment.queue_number:
-            query = query.filter(Appointment.queue_number < appointment.queue_number)
-        else:
-            query = query.filter(Appointment.appointment_time < appointment.appointment_time)
+@main_bp.route('/patient/live/stream/<token>')
+def patient_live_stream(token):
+    """
+    Flux SSE du ticket live : position, attente estimée et drift.
 
-        appointments_ahead = query.all()
-        waiting_ahead = len(appointments_ahead)
+    Tous les abonnés d'un médecin lisent le même snapshot (get_queue_snapshot),
+    recalculé une fois par changement de file. Un événement n'est envoyé
+    que si les données du ticket ont changé.
+    """
+    if not live_stream_enabled():
+        # 204 : EventSource ne se reconnecte pas, la page reste en polling
+        return Response(status=204)
 
-        # Calcul précis
-        base_wait = 0
-        for appt in appointments_ahead:
-            duration = appt.consultation_type.duration if appt.consultation_type else 30
-            base_wait += duration
+    s = get_serializer()
+    try:
+        appointment_id = s.loads(token)
+    except:
+        return jsonify({'error': 'Invalid token'}), 403
 
-        # Ajout du Drift
-        optimizer = QueueOptimizer()
-        drift_data = optimizer.detect_drift(appointment.doctor_id)
-        drift_minutes = drift_data.get('drift_minutes', 0)
+    appointment = Appointment.query.get_or_404(appointment_id)
+    doctor_id = appointment.doctor_id
+    fallback = {
+        'status': appointment.status,
+        'queue_number': appointment.queue_number,
+        'appointment_time': appointment.appointment_time,
+        'patient_name': appointment.patient.name
+    }
+    # Ne pas garder de connexion SQL ouverte pendant toute la durée du flux
+    db.session.close()
+
+    def events():
+        started = clock.monotonic()
+        last_payload = None
+        version = queue_events.version(doctor_id)
+
+        while clock.monotonic() - started < LIVE_STREAM_MAX_SECONDS:
+            snapshot = get_queue_snapshot(doctor_id)
+            db.session.close()
+
+            payload = snapshot.ticket(appointment_id) or snapshot.payload(**fallback)
+            if payload != last_payload:
+                last_payload = payload
+                yield f"data: {json.dumps(payload)}\n\n"
+            else:
+                yield ": keep-alive\n\n"
 
-        estimated_wait = max(0, base_wait + drift_minutes)
+            # Réveil au prochain changement de file (ou pour rafraîchir le drift)
+            version = queue_events.wait(doctor_id, version, LIVE_STREAM_HEARTBEAT_SECONDS)
 
-        return jsonify({
-            'success': True,
-            'status': appointment.status,
-            'waiting_ahead': waiting_ahead,
-            'estimated_wait': int(estimated_wait),
-            'drift_minutes': int(drift_minutes),
-            'queue_number': appointment.queue_number,
-            'patient_name': appointment.patient.name
-        })
+        # Le navigateur (EventSource) se reconnecte de lui-même
+        yield "retry: 1000\n\n"
+
+    response = Response(stream_with_context(events()), mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    response.headers['X-Accel-Buffering'] = 'no'  # Pas de buffering côté proxy (nginx)
+    return response
+
+def _live_ticket_payload(appointment):
+    """Données live d'un ticket, lues sur le snapshot partagé de la file."""
+    snapshot = get_queue_snapshot(appointment.doctor_id)
+    return snapshot.ticket(appointment.id) or snapshot.payload(
+        appointment.status,
+        appointment.queue_number,
+        appointment.appointment_time,
+        appointment.patient.name
+    )
 
 @main_bp.route('/patient/live/confirm/<token>', methods=['POST'])
 def patient_live_confirm(token):
@@ -2544,17 +2364,19 @@ def patient_live_confirm(token):
 
     appointment = Appointment.query.get_or_404(appointment_id)
 
+    # Check-in (éventuellement rejoué hors ligne) seulement le jour même, pour un RDV encore attendu
+    if appointment.appointment_date != date.today():
+        return jsonify({'error': "Ce rendez-vous n'est pas prévu aujourd'hui"}), 409
+    if appointment.status not in ('confirmed', 'waiting'):
+        return jsonify({'error': "Ce rendez-vous n'attend plus de confirmation"}), 409
+
     # 1. Vérification : Si déjà en salle d'attente, on ne fait rien
     if appointment.status == 'waiting' and appointment.queue_number:
          return jsonify({'success': True, 'message': 'Déjà enregistré'})
 
     # 2. Génération du Numéro de Passage (S'il n'en a pas)
     if not appointment.queue_number:
-        max_queue = db.session.query(db.func.max(Appointment.queue_number)).filter(
-            Appointment.doctor_id == appointment.doctor_id,
-            Appointment.appointment_date == date.today()
-        ).scalar() or 0
-        appointment.queue_number = max_queue + 1
+        appointment.queue_number = next_queue_number(appointment.doctor_id, date.today())
 
     # 3. MISE À JOUR CRITIQUE (Le Fix)
     appointment.status = 'waiting'  # Force le vert (Salle d'attente)
@@ -2564,6 +2386,7 @@ def patient_live_confirm(token):
         appointment.arrival_time = datetime.now()
 
     db.session.commit()
+    notify_queue_change(appointment, CHECK_IN)
 
     return jsonify({
         'success': True,
@@ -1,7 +1,8 @@
 import random
 from datetime import date, time
 from extensions import db
-from models import User, DoctorProfile, DoctorAvailability, Appointment
+from models import User, DoctorProfile, DoctorAvailability, Appointment, ConsultationType, DoctorPatientStats
+from utils.rollups import rebuild_rollups
 
 CITIES = ["Alger", "Oran", "Constantine", "Annaba", "Setif", "Bejaia", "Tlemcen", "Blida", "Tizi Ouzou", "Batna"]
 
@@ -76,10 +77,13 @@ def seed_test_accounts():
 
 def seed_50_doctors(reset=False):
     if reset:
+        # Suppressions en masse : sans événements ORM, les tables dérivées sont vidées / recalculées ici
         DoctorAvailability.query.delete()
         Appointment.query.delete()
+        DoctorPatientStats.query.delete()  # Clé étrangère vers doctor_profiles
         DoctorProfile.query.delete()
         User.query.filter(User.role == 'doctor').delete()
+        rebuild_rollups()
         db.session.commit()
     
     created_count = 0
@@ -129,3 +133,77 @@ def seed_50_doctors(reset=False):
     
     db.session.commit()
     return created_count
+
+def initialize_demo_data():
+    """Base vide à la première visite : 50 médecins de démonstration avec horaires et tarifs."""
+    cities = ["Alger", "Oran", "Constantine", "Annaba", "Setif", "Bejaia", "Tlemcen", "Blida"]
+    specialties = ["Médecin Généraliste", "Dentiste", "Cardiologue", "Pédiatre", "Dermatologue", "Gynécologue", "Ophtalmologue"]
+    first_names = ["Mohamed", "Amine", "Sarah", "Fatima", "Youssef", "Karim", "Nadia", "Amina", "Rachid", "Leila", "Yasmine", "Omar", "Lina", "Anis"]
+    last_names = ["Benali", "Saidi", "Dahmani", "Boudiaf", "Hadj", "Mebarki", "Hamidi", "Cherif", "Bouzid", "Belkacem", "Rahmouni", "Meziane"]
+    street_names = ['Didouche Mourad', 'Ben Mhidi', 'Abane Ramdane', 'Amirouche', 'Pasteur']
+
+    for i in range(50):
+        first = random.choice(first_names)
+        last = random.choice(last_names)
+        full_name = f"Dr. {first} {last}"
+        city_choice = random.choice(cities)
+        specialty = random.choice(specialties)
+
+        user = User(
+            email=f"doctor{i+1}@tbib.dz",
+            role='doctor',
+            name=full_name,
+            phone=f"05{random.randint(10000000, 99999999)}",
+            city=city_choice
+        )
+        user.set_password('doctor123')
+        db.session.add(user)
+        db.session.flush()
+
+        doctor_profile = DoctorProfile(
+            user_id=user.id,
+            specialty=specialty,
+            city=city_choice,
+            address=f"{random.randint(1, 200)} Rue {random.choice(street_names)}",
+            bio=f"Médecin expérimenté diplômé de l'Université d'Alger, spécialiste en {specialty.lower()} avec plus de 10 ans d'expérience.",
+            waiting_room_count=0,
+            languages="Français, Arabe",
+            payment_methods="Espèces, Carte bancaire"
+        )
+        db.session.add(doctor_profile)
+        db.session.flush()
+
+        start_t = time(9, 0)
+        end_t = time(17, 0)
+        for day in range(5):
+            availability = DoctorAvailability(
+                doctor_id=doctor_profile.id,
+                day_of_week=day,
+                start_time=start_t,
+                end_time=end_t,
+                is_available=True
+            )
+            db.session.add(availability)
+
+        consultation = ConsultationType(
+            doctor_id=doctor_profile.id,
+            name="Consultation",
+            duration=30,
+            price="2000 DA",
+            color="#14b999",
+            is_active=True
+        )
+        db.session.add(consultation)
+
+        urgence = ConsultationType(
+            doctor_id=doctor_profile.id,
+            name="Urgence",
+            duration=15,
+            price="3000 DA",
+            color="#ef4444",
+            is_active=True
+        )
+        db.session.add(urgence)
+
+    db.session.commit()
+    print("✅ DATABASE INITIALIZED: 50 Doctors & Schedules Created!")
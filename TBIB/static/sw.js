@@ -1,25 +1,87 @@
-const CACHE_NAME = 'tbib-cache-v1';
+// Servi à la racine (/sw.js, routes.service_worker) : portée = tout le site, dont /patient/live/...
+// Liste générée par `flask assets-build` (utils/assets.py) : URLs empreintées + version
+try {
+    importScripts('/static/dist/precache.js');
+} catch (error) {
+    // Pas de build (développement) : cache au premier usage uniquement
+}
+
+const PRECACHE = self.TBIB_PRECACHE || { version: 'dev', urls: [] };
+const ASSETS_CACHE = `tbib-assets-${PRECACHE.version}`;
+const PAGES_CACHE = 'tbib-pages-v2';
+const LIVE_CACHE = 'tbib-live-v1';
+const KEPT_CACHES = [ASSETS_CACHE, PAGES_CACHE, LIVE_CACHE];
 const ASSET_EXTENSIONS = ['.png', '.jpg', '.jpeg', '.svg', '.gif', '.css', '.js', '.woff', '.woff2', '.ttf'];
 
+// Ticket live : dernier statut connu et check-ins en attente de réseau
+const LIVE_STATUS_PATH = '/patient/live/status/';
+const LIVE_CONFIRM_PATH = '/patient/live/confirm/';
+const CACHED_AT_HEADER = 'X-TBIB-Cached-At';
+const CONFIRM_SYNC_TAG = 'tbib-live-confirm';
+const QUEUE_DB = 'tbib-offline';
+const QUEUE_STORE = 'confirmations';
+
+// Pages HTML : seules les réponses partageables sont gardées hors ligne.
+// Les pages no-store / private (dossiers patients, ordonnances, profils) ne touchent jamais le cache.
+const PAGES_PREFIX = 'tbib-pages-';
+const LOGOUT_PATH = '/logout';
+
 self.addEventListener('install', (event) => {
-    self.skipWaiting();
+    // Chaque fichier empreinté n'est téléchargé qu'une fois par version
+    event.waitUntil(
+        caches.open(ASSETS_CACHE)
+            .then((cache) => cache.addAll(PRECACHE.urls))
+            .then(() => self.skipWaiting())
+    );
 });
 
 self.addEventListener('activate', (event) => {
-    event.waitUntil(clients.claim());
+    // Supprimer les caches des versions précédentes (dont l'ancien tbib-cache-v1)
+    event.waitUntil(
+        caches.keys()
+            .then((names) => Promise.all(names
+                .filter((name) => name.startsWith('tbib-') && !KEPT_CACHES.includes(name))
+                .map((name) => caches.delete(name))))
+            .then(() => clients.claim())
+            .then(() => replayConfirmations().catch(() => null))
+    );
 });
 
 self.addEventListener('fetch', (event) => {
     const url = new URL(event.request.url);
-    const isAsset = ASSET_EXTENSIONS.some(ext => url.pathname.endsWith(ext));
-    const isHTML = event.request.mode === 'navigate' || (event.request.method === 'GET' && event.request.headers.get('accept').includes('text/html'));
+    if (url.origin !== self.location.origin) {
+        return;
+    }
+
+    if (event.request.method === 'POST' && url.pathname.startsWith(LIVE_CONFIRM_PATH)) {
+        event.respondWith(confirmOrQueue(event.request));
+        return;
+    }
+    if (event.request.method !== 'GET') {
+        return;
+    }
+    if (url.pathname === LOGOUT_PATH) {
+        // Déconnexion : aucune page de la session ne reste sur l'appareil
+        event.waitUntil(clearPages());
+        return;
+    }
+    if (url.pathname.startsWith(LIVE_STATUS_PATH)) {
+        event.respondWith(liveStatus(event.request));
+        return;
+    }
+
+    const isAsset = ASSET_EXTENSIONS.some(ext => url.pathname.endsWith(ext)) && url.pathname !== '/sw.js';
+    const isHTML = event.request.mode === 'navigate' || (event.request.headers.get('accept') || '').includes('text/html');
 
     if (isAsset) {
-        // Cache First
+        // Cache First : une URL empreintée ne change jamais de contenu
         event.respondWith(
             caches.match(event.request).then((cachedResponse) => {
                 return cachedResponse || fetch(event.request).then((networkResponse) => {
-                    return caches.open(CACHE_NAME).then((cache) => {
+                    if (!networkResponse.ok) {
+                        return networkResponse;
+                    }
+                    return caches.open(ASSETS_CACHE).then((cache) => {
                         cache.put(event.request, networkResponse.clone());
                         return networkResponse;
                     });
@@ -31,7 +93,10 @@ self.addEventListener('fetch', (event) => {
         event.respondWith(
             fetch(event.request)
                 .then((networkResponse) => {
-                    return caches.open(CACHE_NAME).then((cache) => {
+                    if (!isShareable(networkResponse)) {
+                        return networkResponse;
+                    }
+                    return caches.open(PAGES_CACHE).then((cache) => {
                         cache.put(event.request, networkResponse.clone());
                         return networkResponse;
                     });
@@ -42,3 +107,127 @@ self.addEventListener('fetch', (event) => {
         );
     }
 });
+
+function isShareable(response) {
+    // Politique posée par utils/http_cache : no-store par défaut, private pour les pages personnalisées
+    const cacheControl = (response.headers.get('Cache-Control') || '').toLowerCase();
+    return response.ok && response.type === 'basic'
+        && !cacheControl.includes('no-store') && !cacheControl.includes('private');
+}
+
+function clearPages() {
+    return caches.keys().then((names) => Promise.all(names
+        .filter((name) => name.startsWith(PAGES_PREFIX))
+        .map((name) => caches.delete(name))));
+}
+
+// ========================================
+// STATUT LIVE : réseau, sinon dernier statut connu horodaté
+// ========================================
+
+async function liveStatus(request) {
+    try {
+        const networkResponse = await fetch(request);
+        if (networkResponse.ok) {
+            const body = await networkResponse.clone().text();
+            const cache = await caches.open(LIVE_CACHE);
+            await cache.put(request, new Response(body, {
+                headers: {
+                    'Content-Type': 'application/json',
+                    [CACHED_AT_HEADER]: String(Date.now())
+                }
+            }));
+        }
+        return networkResponse;
+    } catch (error) {
+        // Hors ligne : la page affiche le dernier statut et son âge (en-tête X-TBIB-Cached-At)
+        const cached = await caches.match(request);
+        return cached || new Response(JSON.stringify({ success: false, offline: true }), {
+            status: 503,
+            headers: { 'Content-Type': 'application/json' }
+        });
+    }
+}
+
+// ========================================
+// CHECK-IN HORS LIGNE : file IndexedDB rejouée par Background Sync
+// ========================================
+
+function openQueue() {
+    return new Promise((resolve, reject) => {
+        const open = indexedDB.open(QUEUE_DB, 1);
+        open.onupgradeneeded = () => open.result.createObjectStore(QUEUE_STORE, { keyPath: 'url' });
+        open.onsuccess = () => resolve(open.result);
+        open.onerror = () => reject(open.error);
+    });
+}
+
+function queueTransaction(mode, action) {
+    return openQueue().then((db) => new Promise((resolve, reject) => {
+        const transaction = db.transaction(QUEUE_STORE, mode);
+        const result = action(transaction.objectStore(QUEUE_STORE));
+        transaction.oncomplete = () => resolve(result.result);
+        transaction.onerror = () => reject(transaction.error);
+    }));
+}
+
+async function confirmOrQueue(request) {
+    const queued = {
+        url: request.url,  // Un seul check-in par ticket : la clé est l'URL
+        csrfToken: request.headers.get('X-CSRFToken'),
+        queuedAt: Date.now()
+    };
+    try {
+        return await fetch(request);
+    } catch (error) {
+        await queueTransaction('readwrite', (store) => store.put(queued));
+        if (self.registration.sync) {
+            await self.registration.sync.register(CONFIRM_SYNC_TAG);
+        }
+        return new Response(JSON.stringify({ success: true, queued: true }), {
+            status: 202,
+            headers: { 'Content-Type': 'application/json' }
+        });
+    }
+}
+
+function queuedToday(item) {
+    // Un check-in ne vaut que pour le jour du RDV : celui d'un autre jour est abandonné
+    return new Date(item.queuedAt || 0).toDateString() === new Date().toDateString();
+}
+
+async function replayConfirmations() {
+    const pending = await queueTransaction('readonly', (store) => store.getAll());
+    for (const item of pending || []) {
+        if (!queuedToday(item)) {
+            await queueTransaction('readwrite', (store) => store.delete(item.url));
+            continue;
+        }
+        // Le serveur refuse (409) un RDV qui n'est plus du jour ou plus attendu
+        const response = await fetch(item.url, {
+            method: 'POST',
+            credentials: 'same-origin',
+            headers: { 'Content-Type': 'application/json', 'X-CSRFToken': item.csrfToken || '' }
+        });
+        // 4xx (token expiré, RDV supprimé) : inutile de réessayer
+        if (response.ok || response.status < 500) {
+            await queueTransaction('readwrite', (store) => store.delete(item.url));
+        }
+        const body = response.ok ? await response.json() : { success: false };
+        const windows = await clients.matchAll({ type: 'window' });
+        windows.forEach((client) => client.postMessage({ type: 'live-confirm-replayed', url: item.url, result: body }));
+    }
+}
+
+// Background Sync (Chrome/Android) ; sinon la page demande le rejeu au retour du réseau
+self.addEventListener('sync', (event) => {
+    if (event.tag === CONFIRM_SYNC_TAG) {
+        event.waitUntil(replayConfirmations());
+    }
+});
+
+self.addEventListener('message', (event) => {
+    if (event.data && event.data.type === 'replay-confirmations') {
+        event.waitUntil(replayConfirmations().catch(() => null));
+    }
+});
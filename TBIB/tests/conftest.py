@@ -22,6 +22,9 @@ def app():
 
     with app.app_context():
         db.create_all()
+        # Les ids repartent de 1 à chaque base : vider les caches par médecin
+        from utils.availability import invalidate_weekly_template
+        invalidate_weekly_template()
         yield app
         db.session.remove()
         db.drop_all()
@@ -33,3 +36,13 @@ def client(app):
 @pytest.fixture
 def runner(app):
     return app.test_cli_runner()
+
+@pytest.fixture
+def query_budget(app):
+    """Échoue si le bloc dépasse son budget de requêtes SQL : `with query_budget(5): ...`"""
+    from app import db
+    from utils.query_options import query_budget as budget
+
+    def _budget(max_queries, label='bloc'):
+        return budget(db.engine, max_queries, label)
+    return _budget
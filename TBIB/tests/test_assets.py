@@ -0,0 +1,113 @@
+import gzip
+import json
+import os
+import shutil
+import pytest
+from utils.assets import assets, build_assets, prune_assets, DIST_DIR, PRECACHE_NAME, PRECACHE_MAX_BYTES
+
+
+@pytest.fixture
+def built(app, tmp_path):
+    """Copie de static/ empreintée dans un dossier temporaire, servie par l'application."""
+    static_folder = str(tmp_path / 'static')
+    shutil.copytree(app.static_folder, static_folder, ignore=shutil.ignore_patterns(DIST_DIR))
+    with open(os.path.join(static_folder, 'img', 'big.png'), 'wb') as handle:
+        handle.write(os.urandom(PRECACHE_MAX_BYTES + 1))
+
+    original = app.static_folder
+    app.static_folder = static_folder
+    manifest = build_assets(static_folder)
+    assets.load(static_folder)
+    yield manifest
+    app.static_folder = original
+    assets.load(original)
+
+
+class TestAssetBuild:
+    """Build : fichiers empreintés, variantes compressées, liste de préchargement"""
+
+    def test_manifest(self, app, built):
+        entry = built['assets']['css/style.css']
+        assert entry['path'].startswith('dist/css/style.') and entry['path'].endswith('.css')
+        assert 'gzip' in entry['encodings']
+        assert built['assets']['img/logo_final.png']['encodings'] == []
+        assert 'sw.js' not in built['assets'] and 'manifest.json' not in built['assets']
+
+        compressed = os.path.join(app.static_folder, entry['path'] + '.gz')
+        with open(os.path.join(app.static_folder, 'css', 'style.css'), 'rb') as handle:
+            assert gzip.decompress(open(compressed, 'rb').read()) == handle.read()
+
+    def test_precache_list(self, app, built):
+        with open(os.path.join(app.static_folder, DIST_DIR, PRECACHE_NAME)) as handle:
+            source = handle.read()
+        payload = json.loads(source[source.index('{'):source.rindex('}') + 1])
+        assert payload['version'] == built['version']
+        assert '/static/' + built['assets']['css/style.css']['path'] in payload['urls']
+        # Fichiers lourds : cache au premier usage
+        assert '/static/' + built['assets']['img/big.png']['path'] not in payload['urls']
+
+    def test_version_changes_with_content(self, app, built):
+        with open(os.path.join(app.static_folder, 'js', 'app.js'), 'a') as handle:
+            handle.write('\n// v2\n')
+        rebuilt = build_assets(app.static_folder)
+        assert rebuilt['version'] != built['version']
+        assert rebuilt['assets']['js/app.js']['path'] != built['assets']['js/app.js']['path']
+        assert rebuilt['assets']['css/style.css'] == built['assets']['css/style.css']
+
+    def _rebuild_with_change(self, app, marker, age):
+        with open(os.path.join(app.static_folder, 'js', 'app.js'), 'a') as handle:
+            handle.write(f'\n// {marker}\n')
+        manifest = build_assets(app.static_folder)
+        build_record = os.path.join(app.static_folder, DIST_DIR, 'builds', f"{manifest['version']}.json")
+        os.utime(build_record, (age, age))
+        return manifest
+
+    def test_rebuild_keeps_previous_files(self, app, built):
+        os.utime(os.path.join(app.static_folder, DIST_DIR, 'builds', f"{built['version']}.json"), (1, 1))
+        rebuilt = self._rebuild_with_change(app, 'v2', 2)
+        # Une page rendue avant le déploiement charge encore l'ancien script
+        assert os.path.exists(os.path.join(app.static_folder, built['assets']['js/app.js']['path']))
+        assert os.path.exists(os.path.join(app.static_folder, rebuilt['assets']['js/app.js']['path']))
+
+    def test_prune_keeps_recent_builds(self, app, built):
+        os.utime(os.path.join(app.static_folder, DIST_DIR, 'builds', f"{built['version']}.json"), (1, 1))
+        second = self._rebuild_with_change(app, 'v2', 2)
+        third = self._rebuild_with_change(app, 'v3', 3)
+
+        removed = prune_assets(app.static_folder, keep=2)
+
+        def exists(manifest):
+            return os.path.exists(os.path.join(app.static_folder, manifest['assets']['js/app.js']['path']))
+        assert not exists(built)
+        assert exists(second) and exists(third)
+        assert built['assets']['js/app.js']['path'] in removed
+        # Fichiers inchangés d'un build à l'autre : partagés, donc gardés
+        assert os.path.exists(os.path.join(app.static_folder, third['assets']['css/style.css']['path']))
+
+
+class TestAssetServing:
+    """asset_url() et variantes précompressées"""
+
+    def test_asset_url_and_gzip(self, app, client, built):
+        path = built['assets']['css/style.css']['path']
+        with app.test_request_context():
+            assert app.jinja_env.globals['asset_url']('css/style.css') == f'/static/{path}'
+
+        response = client.get(f'/static/{path}', headers={'Accept-Encoding': 'gzip, deflate'})
+        assert response.status_code == 200
+        assert response.headers['Content-Encoding'] == 'gzip'
+        assert response.mimetype == 'text/css'
+        assert 'Accept-Encoding' in response.headers['Vary']
+        assert 'immutable' in response.headers['Cache-Control']
+        body = gzip.decompress(response.get_data())
+        response.close()
+
+        plain = client.get(f'/static/{path}', headers={'Accept-Encoding': 'identity'})
+        assert 'Content-Encoding' not in plain.headers
+        assert plain.get_data() == body
+        plain.close()
+
+    def test_without_build(self, app):
+        # Pas de manifeste : URL classique versionnée par ?v=
+        with app.test_request_context():
+            assert '?v=' in app.jinja_env.globals['asset_url']('css/style.css')
@@ -0,0 +1,325 @@
+import pytest
+import datetime
+from app import db
+from models import User, DoctorProfile, Appointment, ConsultationType, DoctorAvailability, DoctorAbsence
+from utils.availability import (merge_intervals, free_starts, AvailabilityWindow, get_weekly_template,
+                                invalidate_weekly_template)
+
+
+def dt(hour, minute=0):
+    return datetime.datetime(2030, 1, 7, hour, minute)
+
+
+class TestSweepLine:
+    """Fusion des intervalles et calcul linéaire des créneaux libres"""
+
+    def test_merge_overlapping_and_touching(self):
+        merged = merge_intervals([
+            (dt(9), dt(9, 30)),
+            (dt(9, 15), dt(10)),
+            (dt(10), dt(10, 30)),
+            (dt(11), dt(11, 30)),
+        ])
+        assert merged == [(dt(9), dt(10, 30)), (dt(11), dt(11, 30))]
+
+    def test_free_starts_skips_overlaps(self):
+        busy = [(dt(9, 30), dt(10)), (dt(11), dt(12))]
+        slots = free_starts(dt(9), dt(12), busy, duration=30, step=15)
+        assert slots == [dt(9), dt(10), dt(10, 15), dt(10, 30)]
+
+    def test_free_starts_respects_not_before(self):
+        slots = free_starts(dt(9), dt(10), [], duration=30, step=15, not_before=dt(9, 15))
+        assert slots == [dt(9, 30)]
+
+
+class TestAvailabilityWindow:
+    """Le moteur charge la fenêtre en une requête par table"""
+
+    @pytest.fixture
+    def doctor(self, app):
+        user = User(email='doc@t.com', password_hash='x', role='doctor', name='Dr', reliability_score=100)
+        patient = User(email='pat@t.com', password_hash='x', role='patient', name='Pat', reliability_score=100)
+        db.session.add_all([user, patient])
+        db.session.commit()
+
+        profile = DoctorProfile(user_id=user.id, specialty='X', city='Y')
+        db.session.add(profile)
+        db.session.commit()
+
+        # Lundi 2030-01-07 : 9h-12h
+        db.session.add(DoctorAvailability(doctor_id=profile.id, day_of_week=0,
+                                          start_time=datetime.time(9, 0), end_time=datetime.time(12, 0)))
+        long_type = ConsultationType(doctor_id=profile.id, name='Long', duration=60)
+        db.session.add(long_type)
+        db.session.commit()
+
+        db.session.add(Appointment(patient_id=patient.id, doctor_id=profile.id,
+                                   appointment_date=datetime.date(2030, 1, 7),
+                                   appointment_time=datetime.time(10, 0),
+                                   consultation_type_id=long_type.id, status='confirmed'))
+        db.session.commit()
+        return profile
+
+    def test_free_slots_use_consultation_duration(self, app, doctor):
+        window = AvailabilityWindow(doctor.id, datetime.date(2030, 1, 7), datetime.date(2030, 1, 7))
+        slots = [s.strftime('%H:%M') for s in window.free_slots(datetime.date(2030, 1, 7), duration=30)]
+        assert slots == ['09:00', '09:15', '09:30', '11:00', '11:15', '11:30']
+
+    def test_is_free(self, app, doctor):
+        window = AvailabilityWindow(doctor.id, datetime.date(2030, 1, 7), datetime.date(2030, 1, 7))
+        assert window.is_free(dt(9), 30) is True
+        assert window.is_free(dt(10, 30), 15) is False
+        assert window.is_free(dt(11, 45), 30) is False  # Dépasse la fin de journée
+
+    def test_smart_slots_endpoint(self, client, doctor):
+        response = client.get(f'/api/doctors/{doctor.id}/smart-slots?start_date=2030-01-07&days=2')
+        assert response.status_code == 200
+        slots = response.get_json()['slots']
+        assert '10:00' not in slots['2030-01-07']
+        assert '11:00' in slots['2030-01-07']
+        # Mardi sans horaires définis : fallback 9h-17h
+        assert slots['2030-01-08'][0] == '09:00'
+
+
+class TestWeeklyTemplate:
+    """Horaires compilés par médecin, recompilés seulement après un changement"""
+
+    @pytest.fixture
+    def doctor(self, app):
+        user = User(email='doc@w.com', password_hash='x', role='doctor', name='Dr W', reliability_score=100)
+        db.session.add(user)
+        db.session.commit()
+        profile = DoctorProfile(user_id=user.id, specialty='X', city='Y')
+        db.session.add(profile)
+        db.session.commit()
+
+        # Lundi en deux plages : 9h-12h et 14h-17h
+        db.session.add_all([
+            DoctorAvailability(doctor_id=profile.id, day_of_week=0,
+                               start_time=datetime.time(14, 0), end_time=datetime.time(17, 0)),
+            DoctorAvailability(doctor_id=profile.id, day_of_week=0,
+                               start_time=datetime.time(9, 0), end_time=datetime.time(12, 0)),
+        ])
+        db.session.commit()
+        return profile
+
+    def test_lunch_break_is_blocked(self, app, doctor):
+        window = AvailabilityWindow(doctor.id, datetime.date(2030, 1, 7), datetime.date(2030, 1, 7))
+        assert window.working_hours(datetime.date(2030, 1, 7)) == (dt(9), dt(17))
+        assert window.is_free(dt(11, 30), 30) is True
+        assert window.is_free(dt(12), 30) is False
+        assert window.is_free(dt(14), 30) is True
+
+    def test_absence_split_into_exceptions(self, app, doctor):
+        db.session.add(DoctorAbsence(doctor_id=doctor.id, start_date=dt(15),
+                                     end_date=datetime.datetime(2030, 1, 8, 10, 0)))
+        db.session.commit()
+
+        template = get_weekly_template(doctor.id)
+        assert template.absences_on(datetime.date(2030, 1, 7)) == [(dt(15), datetime.datetime(2030, 1, 8, 0, 0))]
+        assert template.absences_on(datetime.date(2030, 1, 8)) == [
+            (datetime.datetime(2030, 1, 8, 0, 0), datetime.datetime(2030, 1, 8, 10, 0))]
+        assert template.blocked_on(datetime.date(2030, 1, 7)) == [(dt(12), dt(14)), (dt(15), datetime.datetime(2030, 1, 8, 0, 0))]
+
+    def test_cached_until_invalidated(self, app, doctor):
+        template = get_weekly_template(doctor.id)
+        db.session.add(DoctorAbsence(doctor_id=doctor.id, start_date=dt(9), end_date=dt(10)))
+        db.session.commit()
+
+        assert get_weekly_template(doctor.id) is template
+        invalidate_weekly_template(doctor.id)
+        assert get_weekly_template(doctor.id).absences_on(datetime.date(2030, 1, 7)) == [(dt(9), dt(10))]
+
+    def test_invalidation_from_another_worker(self, app, doctor):
+        # Un autre worker a modifié les réglages : seule la version partagée a changé
+        from utils.availability import TEMPLATES_VERSION_KEY
+        from utils.queue_events import queue_events
+        template = get_weekly_template(doctor.id)
+        db.session.add(DoctorAbsence(doctor_id=doctor.id, start_date=dt(9), end_date=dt(10)))
+        db.session.commit()
+
+        queue_events.backend.bump(TEMPLATES_VERSION_KEY)
+        reloaded = get_weekly_template(doctor.id)
+        assert reloaded is not template
+        assert reloaded.absences_on(datetime.date(2030, 1, 7)) == [(dt(9), dt(10))]
+
+    def test_past_absences_not_loaded(self, app, doctor):
+        yesterday = datetime.datetime.combine(datetime.date.today() - datetime.timedelta(days=1),
+                                              datetime.time(9, 0))
+        db.session.add(DoctorAbsence(doctor_id=doctor.id, start_date=yesterday - datetime.timedelta(days=30),
+                                     end_date=yesterday))
+        db.session.commit()
+
+        assert get_weekly_template(doctor.id)._exceptions == {}
+
+    def test_add_absence_route_invalidates(self, app, client, doctor):
+        app.config['WTF_CSRF_ENABLED'] = False
+        get_weekly_template(doctor.id)
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(doctor.user_id)
+            sess['_fresh'] = True
+
+        response = client.post('/doctor/settings/absence', json={
+            'start_date': '2030-01-07T09:00:00', 'end_date': '2030-01-07T10:00:00', 'force': True})
+        assert response.status_code == 200
+        assert get_weekly_template(doctor.id).absences_on(datetime.date(2030, 1, 7)) == [(dt(9), dt(10))]
+
+
+class TestSlotSearch:
+    """Recherche de créneaux sur tous les médecins d'une spécialité / ville"""
+
+    @pytest.fixture
+    def cardiologists(self, app):
+        patient = User(email='p@s.com', password_hash='x', role='patient', name='P', reliability_score=100)
+        db.session.add(patient)
+        profiles = []
+        for idx, (city, start_hour) in enumerate([('Oran', 9), ('Oran', 8), ('Alger', 7)]):
+            user = User(email=f'c{idx}@s.com', password_hash='x', role='doctor', name=f'Dr C{idx}',
+                        reliability_score=100)
+            db.session.add(user)
+            db.session.flush()
+            profile = DoctorProfile(user_id=user.id, specialty='Cardiologue', city=city)
+            db.session.add(profile)
+            db.session.flush()
+            db.session.add(DoctorAvailability(doctor_id=profile.id, day_of_week=0,
+                                              start_time=datetime.time(start_hour, 0),
+                                              end_time=datetime.time(start_hour + 1, 0)))
+            profiles.append(profile)
+        db.session.commit()
+
+        # Le médecin de 8h a déjà son premier créneau pris
+        db.session.add(Appointment(patient_id=patient.id, doctor_id=profiles[1].id,
+                                   appointment_date=datetime.date(2030, 1, 7),
+                                   appointment_time=datetime.time(8, 0), status='confirmed'))
+        db.session.commit()
+        return profiles
+
+    def test_first_slots_across_doctors(self, app, client, cardiologists, query_budget):
+        with query_budget(4, 'search_slots'):
+            response = client.get('/api/slots/search?specialty=cardio&city=oran&from=2030-01-07&days=1&limit=3')
+
+        data = response.get_json()
+        assert data['doctor_count'] == 2
+        assert [(slot['doctor_name'], slot['time']) for slot in data['slots']] == [
+            ('Dr C1', '08:30'), ('Dr C0', '09:00'), ('Dr C0', '09:15')]
+
+    def test_search_requires_a_filter(self, client, cardiologists):
+        response = client.get('/api/slots/search?specialty=&city=%20&from=2030-01-07')
+        assert response.status_code == 400
+
+    def test_search_caps_doctor_count(self, client, cardiologists, monkeypatch):
+        import routes
+        monkeypatch.setattr(routes, 'SEARCH_MAX_DOCTORS', 2)
+        data = client.get('/api/slots/search?specialty=cardio&from=2030-01-07&days=1').get_json()
+        assert data['doctor_count'] == 2
+        assert {slot['doctor_id'] for slot in data['slots']} <= {profile.id for profile in cardiologists[:2]}
+
+
+class TestDayCalendar:
+    """Requêtes en mémoire du calendrier journalier"""
+
+    @pytest.fixture
+    def calendar(self):
+        from utils.day_calendar import DayCalendar
+        return DayCalendar(
+            1, datetime.date(2030, 1, 7), dt(9), dt(12),
+            appointments=[(dt(9), dt(9, 30), 1), (dt(9, 30), dt(10), 2), (dt(10, 45), dt(11, 15), 3)]
+        )
+
+    def test_overlaps(self, calendar):
+        assert calendar.overlaps(dt(9, 45), dt(10, 15)) is True
+        assert calendar.overlaps(dt(10), dt(10, 45)) is False
+
+    def test_next_gap(self, calendar):
+        assert calendar.next_gap(dt(9), 30) == dt(10)
+        assert calendar.next_gap(dt(9), 45) == dt(10)
+        assert calendar.next_gap(dt(9), 60) is None
+        assert calendar.next_gap(dt(10, 20), 30) == dt(11, 15)
+
+    def test_move_appointment(self, calendar):
+        calendar.remove(2)
+        assert calendar.next_gap(dt(9), 60) == dt(9, 30)
+        calendar.add(2, dt(11, 15), 45)
+        assert calendar.next_gap(dt(10, 20), 30) is None
+
+    def test_find_next_free_slot_skips_to_next_day(self, app):
+        from utils.engine import find_next_free_slot
+        from utils.day_calendar import CalendarBook
+
+        book = CalendarBook(999, datetime.date(2030, 1, 7), datetime.date(2030, 1, 8))
+        book.add(1, dt(9), 8 * 60)  # Lundi complet (fallback 9h-17h)
+        slot = find_next_free_slot(999, dt(9), 30, max_days=1, book=book)
+        assert slot == datetime.datetime(2030, 1, 8, 9, 0)
+
+
+class TestShiftAppointments:
+    """Décalage des RDV du jour après une urgence"""
+
+    def test_shift_back_to_back_appointments(self, app, monkeypatch):
+        from utils import engine
+
+        class FixedDate(datetime.date):
+            @classmethod
+            def today(cls):
+                return datetime.date(2030, 1, 7)
+
+        class FixedDatetime(datetime.datetime):
+            @classmethod
+            def now(cls, tz=None):
+                return dt(8)
+
+        monkeypatch.setattr(engine, 'date', FixedDate)
+        monkeypatch.setattr(engine, 'datetime', FixedDatetime)
+
+        doctor_user = User(email='shift@t.com', password_hash='x', role='doctor', name='Dr', reliability_score=100)
+        patient = User(email='shift-p@t.com', password_hash='x', role='patient', name='Pat', reliability_score=100)
+        db.session.add_all([doctor_user, patient])
+        db.session.flush()
+        profile = DoctorProfile(user_id=doctor_user.id, specialty='X', city='Y')
+        db.session.add(profile)
+        db.session.flush()
+        # Deux RDV accolés : le premier doit prendre la place que le second libère
+        first, second = (Appointment(patient_id=patient.id, doctor_id=profile.id,
+                                     appointment_date=datetime.date(2030, 1, 7),
+                                     appointment_time=start, status='confirmed')
+                         for start in (datetime.time(10, 0), datetime.time(10, 30)))
+        db.session.add_all([first, second])
+        db.session.commit()
+
+        engine.shift_appointments(profile.id, 30)
+
+        db.session.expire_all()
+        assert db.session.get(Appointment, first.id).appointment_time == datetime.time(10, 30)
+        assert db.session.get(Appointment, second.id).appointment_time == datetime.time(11, 0)
+
+
+class TestAbsenceCancellation:
+    """Annulation des RDV couverts par une absence"""
+
+    def test_publishes_once_per_cancelled_day(self, app):
+        from utils.engine import cancel_appointments_in_range
+        from utils.queue_events import queue_events
+
+        doctor_user = User(email='abs@t.com', password_hash='x', role='doctor', name='Dr', reliability_score=100)
+        patient = User(email='abs-p@t.com', password_hash='x', role='patient', name='Pat', reliability_score=100)
+        db.session.add_all([doctor_user, patient])
+        db.session.flush()
+        profile = DoctorProfile(user_id=doctor_user.id, specialty='X', city='Y')
+        db.session.add(profile)
+        db.session.flush()
+        days = [datetime.date(2030, 1, 7), datetime.date(2030, 1, 8)]
+        db.session.add_all([
+            Appointment(patient_id=patient.id, doctor_id=profile.id, appointment_date=day,
+                        appointment_time=start, status='confirmed')
+            for day in days for start in (datetime.time(9, 0), datetime.time(10, 0))
+        ])
+        db.session.commit()
+        before = {day: queue_events.version(profile.id, day) for day in days}
+
+        cancelled = cancel_appointments_in_range(profile.id, dt(0), datetime.datetime(2030, 1, 8, 23, 59),
+                                                 'Congé')
+
+        assert cancelled == 4
+        assert {day: queue_events.version(profile.id, day) - before[day] for day in days} == {
+            days[0]: 1, days[1]: 1
+        }
@@ -0,0 +1,109 @@
+import datetime
+import threading
+import pytest
+from app import create_app, db
+from models import User, DoctorProfile, Appointment, Prescription, PrescriptionDispensation
+from SERVICES.ewassfa import EWassfaService
+
+
+def make_prescription(token, max_usage, expiry_days=30):
+    doctor = User(email=f'd-{token}@t.com', password_hash='x', role='doctor', name='Dr', reliability_score=100)
+    patient = User(email=f'p-{token}@t.com', password_hash='x', role='patient', name='Pat', reliability_score=100)
+    db.session.add_all([doctor, patient])
+    db.session.flush()
+    profile = DoctorProfile(user_id=doctor.id, specialty='X', city='Y')
+    db.session.add(profile)
+    db.session.flush()
+    appt = Appointment(patient_id=patient.id, doctor_id=profile.id, appointment_date=datetime.date.today())
+    db.session.add(appt)
+    db.session.flush()
+    prescription = Prescription(
+        token=token, appointment_id=appt.id, doctor_id=doctor.id, patient_id=patient.id,
+        medications='Meds', security_hash='x', status='pending', usage_count=0, max_usage=max_usage,
+        prescription_type='CHRONIC' if max_usage > 1 else 'ACUTE',
+        expiry_date=datetime.datetime.utcnow() + datetime.timedelta(days=expiry_days)
+    )
+    db.session.add(prescription)
+    db.session.commit()
+    return prescription
+
+
+class TestDispensingLedger:
+    """Délivrance : incrément conditionnel atomique + journal append-only"""
+
+    def test_chronic_until_max_usage(self, app):
+        make_prescription('chronic', max_usage=3)
+
+        assert [EWassfaService.dispense('chronic', pharmacy_ref='PH-1')[0] for _ in range(3)] == [1, 2, 3]
+        assert EWassfaService.dispense('chronic') == (None, 'dispensed')
+        db.session.commit()
+
+        prescription = Prescription.query.filter_by(token='chronic').one()
+        assert (prescription.usage_count, prescription.status) == (3, 'dispensed')
+        assert [d.usage_number for d in prescription.dispensations.order_by(PrescriptionDispensation.id)] == [1, 2, 3]
+
+    def test_refusals(self, app):
+        make_prescription('old', max_usage=1, expiry_days=-1)
+
+        assert EWassfaService.dispense('old') == (None, 'expired')
+        assert EWassfaService.dispense('missing') == (None, 'not_found')
+        assert PrescriptionDispensation.query.count() == 0
+
+    def test_endpoint_reports_usage(self, app, client, monkeypatch):
+        monkeypatch.setenv('PHARMACY_API_KEY', 'TEST-KEY')
+        make_prescription('acute', max_usage=1)
+        headers = {'X-Pharmacy-Key': 'TEST-KEY', 'X-Pharmacy-Id': 'PH-42'}
+
+        response = client.post('/pharmacy/dispense/acute', headers=headers)
+        assert response.get_json()['usage_number'] == 1
+        assert client.post('/pharmacy/dispense/acute', headers=headers).status_code == 400
+        assert PrescriptionDispensation.query.one().pharmacy_ref == 'PH-42'
+
+
+class TestConcurrentDispensing:
+    """Charge : plusieurs terminaux délivrent la même ordonnance en même temps"""
+
+    WORKERS = 8
+    ATTEMPTS = 6
+    MAX_USAGE = 20
+
+    @pytest.fixture
+    def file_app(self, tmp_path, monkeypatch):
+        # Base fichier : chaque thread a sa propre connexion (pas de :memory: partagée)
+        monkeypatch.setenv('DATABASE_URL', f"sqlite:///{tmp_path / 'dispense.db'}")
+        app = create_app()
+        app.config['TESTING'] = True
+        with app.app_context():
+            db.create_all()
+            make_prescription('load', max_usage=self.MAX_USAGE)
+            yield app
+            db.session.remove()
+            db.drop_all()
+
+    def test_no_lost_or_extra_usage(self, file_app):
+        results = []
+        barrier = threading.Barrier(self.WORKERS)
+
+        def dispenser():
+            with file_app.app_context():
+                barrier.wait()
+                for _ in range(self.ATTEMPTS):
+                    usage_number, refusal = EWassfaService.dispense('load')
+                    db.session.commit()
+                    results.append(usage_number or refusal)
+                db.session.remove()
+
+        threads = [threading.Thread(target=dispenser) for _ in range(self.WORKERS)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        db.session.expire_all()
+        numbers = sorted(r for r in results if isinstance(r, int))
+        assert numbers == list(range(1, self.MAX_USAGE + 1))
+        assert results.count('dispensed') == self.WORKERS * self.ATTEMPTS - self.MAX_USAGE
+
+        prescription = Prescription.query.filter_by(token='load').one()
+        assert (prescription.usage_count, prescription.status) == (self.MAX_USAGE, 'dispensed')
+        assert PrescriptionDispensation.query.count() == self.MAX_USAGE
@@ -0,0 +1,102 @@
+import pytest
+from app import db
+from models import User, DoctorProfile, DoctorSearchIndex
+from utils.doctor_search import normalize, search_doctors, reindex_doctors
+from utils.pagination import InvalidCursor
+
+
+@pytest.fixture
+def doctors(app):
+    """Quatre médecins ; l'index est alimenté par les événements ORM."""
+    profiles = []
+    for idx, (name, specialty, city, expertises) in enumerate([
+        ('Amina Kaci', 'Pédiatre', 'Oran', 'Nouveau-nés, vaccination'),
+        ('Karim Haddad', 'Cardiologue', 'Oran', 'Échographie cardiaque'),
+        ('Yacine Bouzid', 'Cardiologue', 'Alger', 'Hypertension'),
+        ('Sarah Mansouri', 'Médecin Généraliste', 'Tizi Ouzou', None),
+    ]):
+        user = User(email=f'ds{idx}@s.com', password_hash='x', role='doctor', name=name, reliability_score=100)
+        db.session.add(user)
+        db.session.flush()
+        profile = DoctorProfile(user_id=user.id, specialty=specialty, city=city,
+                                expertises=expertises, languages='Arabe, Français')
+        db.session.add(profile)
+        profiles.append(profile)
+    db.session.commit()
+    return profiles
+
+
+def names(results):
+    return [doctor.user.name for doctor in results[0]]
+
+
+class TestNormalize:
+    """Même forme normalisée pour les variantes françaises, arabes et sans accents"""
+
+    def test_accents_and_variants(self):
+        assert normalize('Pédiatre') == normalize('pediatrie') == normalize('طبيب أطفال')
+        assert normalize('Cardiologue') == normalize('قلب')
+
+    def test_arabic_city_names(self):
+        assert normalize('وهران') == normalize('Oran')
+        assert normalize('تيزي وزو') == normalize('Tizi Ouzou')
+
+
+class TestDoctorSearch:
+    """Recherche classée via FTS5 (SQLite), synchronisée avec les profils"""
+
+    def test_indexed_on_insert(self, app, doctors):
+        assert db.session.query(DoctorSearchIndex).count() == 4
+
+    def test_structured_filters(self, app, doctors):
+        assert names(search_doctors(specialty='Cardiologue', city='وهران')) == ['Karim Haddad']
+        assert sorted(names(search_doctors(specialty='cardio'))) == ['Karim Haddad', 'Yacine Bouzid']
+
+    def test_free_text_any_field(self, app, doctors):
+        assert names(search_doctors(q='طبيب أطفال')) == ['Amina Kaci']
+        assert names(search_doctors(q='echographie')) == ['Karim Haddad']
+        assert names(search_doctors(q='generaliste tizi')) == ['Sarah Mansouri']
+
+    def test_pagination(self, app, doctors):
+        first, cursor = search_doctors(q='oran', per_page=1)
+        second, end = search_doctors(q='oran', after=cursor, per_page=1)
+        assert cursor is not None and end is None
+        assert len(first) == len(second) == 1
+        assert first[0].id != second[0].id
+
+    def test_cursor_walks_every_result_once(self, app, doctors):
+        # Mot de 2 lettres : hors FTS5, tri par nom
+        seen, cursor = [], None
+        while True:
+            page, cursor = search_doctors(q='ka', city='Oran', after=cursor, per_page=1)
+            seen += [doctor.user.name for doctor in page]
+            if cursor is None:
+                break
+        assert seen == ['Amina Kaci', 'Karim Haddad']
+
+    def test_invalid_cursor(self, app, client, doctors):
+        with pytest.raises(InvalidCursor):
+            search_doctors(q='oran', after='pas-un-curseur')
+        assert client.get('/api/doctors/search?q=oran&after=xyz').status_code == 400
+
+    def test_profile_update_reindexes(self, app, client, doctors):
+        app.config['WTF_CSRF_ENABLED'] = False
+        doctor = doctors[2]
+        with client.session_transaction() as sess:
+            sess['_user_id'] = str(doctor.user_id)
+            sess['_fresh'] = True
+
+        client.post('/doctor/settings/profile', data={
+            'name': 'Yacine Bouzid', 'specialty': 'Cardiologue', 'city': 'Oran'})
+
+        assert sorted(names(search_doctors(specialty='cardiologue', city='oran'))) == ['Karim Haddad', 'Yacine Bouzid']
+
+    def test_reindex_and_api(self, app, client, doctors):
+        db.session.query(DoctorSearchIndex).delete()
+        db.session.commit()
+        assert reindex_doctors() == 4
+        db.session.commit()
+
+        data = client.get('/api/doctors/search?q=hypertension').get_json()
+        assert len(data['doctors']) == 1 and data['next_cursor'] is None
+        assert data['doctors'][0]['name'] == 'Yacine Bouzid'
@@ -0,0 +1,61 @@
+from app import db
+from models import User, DoctorProfile
+from utils.facets import facet_cache
+
+
+def add_doctor(idx, specialty, city):
+    user = User(email=f'f{idx}@f.com', password_hash='x', role='doctor', name=f'Dr F{idx}', reliability_score=100)
+    db.session.add(user)
+    db.session.flush()
+    profile = DoctorProfile(user_id=user.id, specialty=specialty, city=city)
+    db.session.add(profile)
+    db.session.commit()
+    return profile
+
+
+class TestFacetCache:
+    """Spécialités et villes servies depuis la mémoire, invalidées au commit"""
+
+    def test_counts_per_facet(self, app):
+        add_doctor(0, 'Cardiologue', 'Oran')
+        add_doctor(1, 'Cardiologue', 'Alger')
+        add_doctor(2, 'Dentiste', 'Oran')
+
+        facets = facet_cache.get()
+        assert facets.specialties == ['Cardiologue', 'Dentiste']
+        assert facets.city_counts == {'Alger': 1, 'Oran': 2}
+        assert facets.doctor_count == 3
+
+    def test_invalidated_on_city_change_only(self, app):
+        profile = add_doctor(0, 'Cardiologue', 'Oran')
+        facets = facet_cache.get()
+
+        profile.waiting_room_count = 3
+        db.session.commit()
+        assert facet_cache.get() is facets
+
+        profile.city = 'Blida'
+        db.session.commit()
+        assert facet_cache.get().cities == ['Blida']
+
+    def test_rollback_keeps_cache(self, app):
+        add_doctor(0, 'Cardiologue', 'Oran')
+        facets = facet_cache.get()
+
+        user = User(email='r@f.com', password_hash='x', role='doctor', name='Dr R', reliability_score=100)
+        db.session.add(user)
+        db.session.flush()
+        db.session.add(DoctorProfile(user_id=user.id, specialty='Dentiste', city='Oran'))
+        db.session.flush()
+        db.session.rollback()
+
+        assert facet_cache.get() is facets
+
+    def test_home_page_without_queries(self, app, client, query_budget):
+        add_doctor(0, 'Cardiologue', 'Oran')
+        client.get('/')
+
+        with query_budget(0, 'home'):
+            response = client.get('/')
+        assert response.status_code == 200
+        assert b'Cardiologue (1)' in response.data
@@ -0,0 +1,82 @@
+import pytest
+from app import db
+from models import User, DoctorProfile, ConsultationType
+
+
+@pytest.fixture
+def doctor(app):
+    user = User(email='cache@c.com', password_hash='x', role='doctor', name='Dr Cache', reliability_score=100)
+    db.session.add(user)
+    db.session.flush()
+    profile = DoctorProfile(user_id=user.id, specialty='Cardiologue', city='Alger')
+    db.session.add(profile)
+    db.session.flush()
+    db.session.add(ConsultationType(doctor_id=profile.id, name='Suivi', duration=20))
+    db.session.commit()
+    return profile
+
+
+class TestCachePolicy:
+    """Politique de cache par route"""
+
+    def test_default_is_no_store(self, client):
+        response = client.get('/api/doctors/search?q=x')
+        assert 'no-store' in response.headers['Cache-Control']
+
+    def test_public_json_with_etag(self, client, doctor):
+        url = f'/api/doctors/{doctor.id}/consultation-types'
+        response = client.get(url)
+        assert response.status_code == 200
+        assert 'public' in response.headers['Cache-Control']
+        assert 'max-age=300' in response.headers['Cache-Control']
+        etag = response.headers['ETag']
+
+        cached = client.get(url, headers={'If-None-Match': etag})
+        assert cached.status_code == 304
+        assert cached.data == b''
+
+        # Nouveau type : nouvelle version
+        db.session.add(ConsultationType(doctor_id=doctor.id, name='Urgence', duration=10))
+        db.session.commit()
+        assert client.get(url, headers={'If-None-Match': etag}).status_code == 200
+
+    def test_profile_revalidates(self, client, doctor):
+        response = client.get(f'/doctor/{doctor.id}')
+        assert response.status_code == 200
+        cache_control = response.headers['Cache-Control']
+        assert 'private' in cache_control and 'no-cache' in cache_control
+        assert 'no-store' not in cache_control
+
+        cached = client.get(f'/doctor/{doctor.id}', headers={'If-None-Match': response.headers['ETag']})
+        assert cached.status_code == 304
+
+    def test_medical_blueprints_stay_no_store(self, client):
+        response = client.get('/pharmacy/verify/unknown-token')
+        assert 'no-store' in response.headers['Cache-Control']
+
+    def test_not_found_is_no_store(self, client):
+        assert 'no-store' in client.get('/nowhere-at-all').headers['Cache-Control']
+
+
+class TestStaticAssets:
+    """URLs statiques versionnées par contenu"""
+
+    def test_versioned_url_is_immutable(self, app, client):
+        with app.test_request_context():
+            from flask import url_for
+            url = url_for('static', filename='css/style.css')
+            sw_url = url_for('static', filename='sw.js')
+        assert '?v=' in url
+        assert '?v=' not in sw_url
+
+        response = client.get(url)
+        assert response.status_code == 200
+        cache_control = response.headers['Cache-Control']
+        assert 'immutable' in cache_control and 'max-age=31536000' in cache_control
+        response.close()
+
+    def test_unversioned_url_revalidates(self, client):
+        response = client.get('/static/sw.js')
+        assert 'no-cache' in response.headers['Cache-Control']
+        assert 'immutable' not in response.headers['Cache-Control']
+        response.close()
@@ -0,0 +1,50 @@
+import glob
+import os
+import re
+from babel.messages.pofile import read_po
+from utils.i18n import LANGUAGES, TRANSLATIONS_DIR, catalog, missing_keys, translate
+
+TEMPLATES_DIR = os.path.join(os.path.dirname(TRANSLATIONS_DIR), 'templates')
+
+
+class TestCatalogs:
+    """Catalogues compilés ui.mo"""
+
+    def test_no_missing_keys(self):
+        assert missing_keys() == {}
+
+    def test_compiled_catalogs_match_sources(self):
+        # Un .po modifié sans `flask i18n-compile` ferait échouer ce test
+        for lang in LANGUAGES:
+            with open(os.path.join(TRANSLATIONS_DIR, lang, 'LC_MESSAGES', 'ui.po'), 'rb') as handle:
+                source = {message.id: message.string for message in read_po(handle) if message.id}
+            assert dict(catalog(lang)) == source, lang
+
+    def test_template_keys_exist(self):
+        used = set()
+        for path in glob.glob(os.path.join(TEMPLATES_DIR, '**', '*.html'), recursive=True):
+            with open(path, encoding='utf-8') as handle:
+                used |= set(re.findall(r"\bt\('([a-z_]+)'", handle.read()))
+        assert used and used <= set(catalog('fr'))
+
+    def test_fallbacks(self):
+        assert translate('login', lang='ar') == 'تسجيل الدخول'
+        assert translate('login', lang='xx') == 'Se connecter'
+        assert translate('unknown_key', 'Défaut') == 'Défaut'
+        assert translate('unknown_key') == 'unknown_key'
+
+
+class TestTemplateLookup:
+    """t() dans les gabarits, selon la langue de session"""
+
+    def test_language_switch(self, client):
+        assert 'Se connecter' in client.get('/login').get_data(as_text=True)
+        client.get('/set_language/en')
+        assert 'Log in' in client.get('/login').get_data(as_text=True)
+        client.get('/set_language/ar')
+        assert 'تسجيل الدخول' in client.get('/login').get_data(as_text=True)
+
+    def test_check_command(self, runner):
+        result = runner.invoke(args=['i18n-check'])
+        assert result.exit_code == 0
+        assert 'Aucune clé manquante' in result.output
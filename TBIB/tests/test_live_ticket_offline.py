@@ -0,0 +1,92 @@
+import datetime
+import pytest
+from app import db
+from models import User, DoctorProfile, Appointment
+from routes import get_serializer
+
+
+@pytest.fixture
+def ticket(app):
+    app.config['WTF_CSRF_ENABLED'] = False
+    doctor_user = User(email='live@l.com', password_hash='x', role='doctor', name='Dr Live', reliability_score=100)
+    patient = User(email='live-p@l.com', password_hash='x', role='patient', name='Patient Live', reliability_score=100)
+    db.session.add_all([doctor_user, patient])
+    db.session.flush()
+    profile = DoctorProfile(user_id=doctor_user.id, specialty='X', city='Y')
+    db.session.add(profile)
+    db.session.flush()
+    appointment = Appointment(patient_id=patient.id, doctor_id=profile.id, status='confirmed',
+                              appointment_date=datetime.date.today())
+    db.session.add(appointment)
+    db.session.commit()
+    return appointment, get_serializer().dumps(appointment.id)
+
+
+class TestOfflineLiveTicket:
+    """Ticket live hors ligne : service worker à la racine, check-in rejouable"""
+
+    def test_service_worker_served_at_root(self, client):
+        response = client.get('/sw.js')
+        assert response.status_code == 200
+        assert response.mimetype in ('application/javascript', 'text/javascript')
+        assert 'no-cache' in response.headers['Cache-Control']
+        assert 'immutable' not in response.headers['Cache-Control']
+        assert b'tbib-live-confirm' in response.get_data()
+        response.close()
+
+    def test_worker_only_keeps_shareable_pages(self, client, ticket):
+        # Portée racine : le cache HTML s'appuie sur Cache-Control (utils/http_cache)
+        response = client.get('/sw.js')
+        source = response.get_data(as_text=True)
+        response.close()
+        assert "includes('no-store')" in source and "includes('private')" in source
+        assert "LOGOUT_PATH = '/logout'" in source
+
+        _, token = ticket
+        for path in (f'/patient/live/{token}', '/legal/cgu'):
+            cache_control = client.get(path).headers['Cache-Control']
+            assert 'no-store' in cache_control or 'private' in cache_control, path
+
+    def test_page_registers_root_worker(self, client, ticket):
+        _, token = ticket
+        html = client.get(f'/patient/live/{token}').get_data(as_text=True)
+        assert 'serviceWorker.register("/sw.js")' in html
+
+    def test_replayed_confirm_is_idempotent(self, client, ticket):
+        # Background Sync peut rejouer un check-in déjà arrivé au serveur
+        appointment, token = ticket
+        first = client.post(f'/patient/live/confirm/{token}').get_json()
+        replay = client.post(f'/patient/live/confirm/{token}').get_json()
+        assert first['success'] and replay['success']
+
+        db.session.expire_all()
+        stored = db.session.get(Appointment, appointment.id)
+        assert stored.status == 'waiting'
+        assert stored.queue_number == first['queue_number']
+
+    @pytest.mark.parametrize('status', ['completed', 'no_show', 'cancelled'])
+    def test_confirm_rejects_closed_appointment(self, client, ticket, status):
+        appointment, token = ticket
+        appointment.status = status
+        appointment.queue_number = 4
+        db.session.commit()
+
+        response = client.post(f'/patient/live/confirm/{token}')
+        assert response.status_code == 409
+        db.session.expire_all()
+        assert db.session.get(Appointment, appointment.id).status == status
+
+    def test_confirm_rejects_other_day(self, client, ticket):
+        appointment, token = ticket
+        appointment.appointment_date = datetime.date.today() - datetime.timedelta(days=1)
+        db.session.commit()
+
+        assert client.post(f'/patient/live/confirm/{token}').status_code == 409
+        db.session.expire_all()
+        assert db.session.get(Appointment, appointment.id).status == 'confirmed'
+
+    def test_worker_drops_confirmations_from_previous_days(self, client):
+        response = client.get('/sw.js')
+        source = response.get_data(as_text=True)
+        response.close()
+        assert 'if (!queuedToday(item))' in source
@@ -0,0 +1,164 @@
+import datetime
+import pytest
+from app import db
+from sqlalchemy import text
+from models import User, DoctorProfile, Appointment, DoctorPatientStats
+from utils.pagination import InvalidCursor
+from utils.patient_roster import patient_page, patient_count, rebuild_patient_stats
+
+DAY = datetime.date(2030, 1, 7)
+
+
+@pytest.fixture
+def roster(app):
+    """Un médecin et cinq patients ; deux patients partagent la même dernière visite."""
+    doctor_user = User(email='roster@r.com', password_hash='x', role='doctor', name='Dr R', reliability_score=100)
+    db.session.add(doctor_user)
+    db.session.flush()
+    profile = DoctorProfile(user_id=doctor_user.id, specialty='X', city='Y')
+    db.session.add(profile)
+    db.session.flush()
+
+    for idx, offset in enumerate([0, 3, 3, 7, 10]):
+        patient = User(email=f'rp{idx}@r.com', password_hash='x', role='patient',
+                       name=f'Patient {idx}', reliability_score=100)
+        db.session.add(patient)
+        db.session.flush()
+        for visit in range(idx + 1):
+            db.session.add(Appointment(patient_id=patient.id, doctor_id=profile.id, status='completed',
+                                       appointment_date=DAY - datetime.timedelta(days=offset + visit)))
+    db.session.commit()
+    return profile
+
+
+def login(client, user_id):
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user_id)
+        sess['_fresh'] = True
+
+
+class TestPatientRoster:
+    """Liste des patients paginée par curseur (dernière visite, id)"""
+
+    def test_cursor_walks_every_patient_once(self, app, roster):
+        seen, cursor = [], None
+        while True:
+            page, cursor = patient_page(roster.id, after=cursor, per_page=2)
+            seen += [(p['user'].name, p['last_visit'], p['visit_count']) for p in page]
+            if cursor is None:
+                break
+
+        assert [name for name, _, _ in seen] == ['Patient 0', 'Patient 2', 'Patient 1', 'Patient 3', 'Patient 4']
+        assert seen[0][1] == DAY and seen[0][2] == 1
+        assert patient_count(roster.id) == 5
+
+    def test_booked_patients_listed_after_visited(self, app, roster):
+        # Patients seulement réservés (ou absents) : dans la liste, après ceux déjà vus
+        for idx, status in enumerate(['confirmed', 'no_show']):
+            patient = User(email=f'rb{idx}@r.com', password_hash='x', role='patient',
+                           name=f'Booked {idx}', reliability_score=100)
+            db.session.add(patient)
+            db.session.flush()
+            db.session.add(Appointment(patient_id=patient.id, doctor_id=roster.id, status=status,
+                                       appointment_date=DAY + datetime.timedelta(days=idx)))
+        db.session.commit()
+
+        seen, cursor = [], None
+        while True:
+            page, cursor = patient_page(roster.id, after=cursor, per_page=3)
+            seen += [p['user'].name for p in page]
+            if cursor is None:
+                break
+        assert seen == ['Patient 0', 'Patient 2', 'Patient 1', 'Patient 3', 'Patient 4', 'Booked 1', 'Booked 0']
+        assert patient_count(roster.id) == 7
+
+    def test_search_and_invalid_cursor(self, app, roster):
+        page, cursor = patient_page(roster.id, search='patient 3')
+        assert [p['user'].name for p in page] == ['Patient 3'] and cursor is None
+        assert patient_count(roster.id, 'patient 3') == 1
+
+        with pytest.raises(InvalidCursor):
+            patient_page(roster.id, after='bm9u')
+
+    def test_api_and_htmx_rows(self, app, client, roster):
+        login(client, roster.user_id)
+
+        data = client.get('/api/doctor/patients?per_page=3').get_json()
+        assert [p['name'] for p in data['patients']] == ['Patient 0', 'Patient 2', 'Patient 1']
+        rest = client.get(f"/api/doctor/patients?per_page=3&after={data['next_cursor']}").get_json()
+        assert [p['name'] for p in rest['patients']] == ['Patient 3', 'Patient 4']
+        assert rest['next_cursor'] is None
+        assert client.get('/api/doctor/patients?after=xyz').status_code == 400
+
+        rows = client.get('/doctor/patients', headers={'HX-Request': 'true'}).get_data(as_text=True)
+        assert 'Patient 4' in rows and 'hx-trigger="revealed"' not in rows
+
+
+def stats_row(doctor_id, patient_id):
+    row = db.session.get(DoctorPatientStats, (doctor_id, patient_id))
+    return row and (row.first_visit, row.last_visit, row.visit_count, row.no_show_count)
+
+
+class TestPatientStats:
+    """doctor_patient_stats suit les changements de statut des RDV"""
+
+    def test_status_transitions(self, app, roster):
+        patient = User(email='rt@r.com', password_hash='x', role='patient', name='T', reliability_score=100)
+        db.session.add(patient)
+        db.session.flush()
+        first = Appointment(patient_id=patient.id, doctor_id=roster.id, status='confirmed', appointment_date=DAY)
+        second = Appointment(patient_id=patient.id, doctor_id=roster.id, status='confirmed',
+                             appointment_date=DAY + datetime.timedelta(days=7))
+        db.session.add_all([first, second])
+        db.session.commit()
+        # Réservé seulement : dans la liste, sans consultation
+        assert stats_row(roster.id, patient.id) == (None, None, 0, 0)
+
+        first.status = 'completed'
+        second.status = 'no_show'
+        db.session.commit()
+        assert stats_row(roster.id, patient.id) == (DAY, DAY, 1, 1)
+
+        # Absence corrigée : le patient est finalement venu
+        second.status = 'completed'
+        db.session.commit()
+        assert stats_row(roster.id, patient.id) == (DAY, DAY + datetime.timedelta(days=7), 2, 0)
+
+        db.session.delete(second)
+        db.session.commit()
+        assert stats_row(roster.id, patient.id) == (DAY, DAY, 1, 0)
+
+        first.status = 'cancelled'
+        db.session.commit()
+        assert stats_row(roster.id, patient.id) == (None, None, 0, 0)
+
+        db.session.delete(first)
+        db.session.commit()
+        assert stats_row(roster.id, patient.id) is None
+
+    def test_rebuild_matches_incremental(self, app, roster):
+        incremental = sorted((r.patient_id, r.first_visit, r.last_visit, r.visit_count)
+                             for r in DoctorPatientStats.query.all())
+        assert rebuild_patient_stats() == 5
+        db.session.commit()
+        rebuilt = sorted((r.patient_id, r.first_visit, r.last_visit, r.visit_count)
+                         for r in DoctorPatientStats.query.all())
+        assert rebuilt == incremental
+
+    def test_roster_page_is_an_index_range(self, app, roster):
+        stats = DoctorPatientStats
+        query = db.session.query(stats.patient_id).filter(
+            stats.doctor_id == roster.id, stats.last_visit.isnot(None)
+        ).order_by(stats.last_visit.desc(), stats.patient_id.desc()).limit(26)
+        sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        plan = ' | '.join(row[3] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)))
+        assert 'ix_doctor_patient_stats_roster' in plan and 'TEMP B-TREE' not in plan, plan
+
+    def test_booked_range_is_an_index_range(self, app, roster):
+        stats = DoctorPatientStats
+        query = db.session.query(stats.patient_id).filter(
+            stats.doctor_id == roster.id, stats.last_visit.is_(None)
+        ).order_by(stats.patient_id.desc()).limit(26)
+        sql = str(query.statement.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        plan = ' | '.join(row[3] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)))
+        assert 'ix_doctor_patient_stats_roster' in plan and 'TEMP B-TREE' not in plan, plan
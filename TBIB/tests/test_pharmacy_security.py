@@ -167,3 +167,30 @@ class TestPharmacyEndpointsSecurity:
         # Expect 400 per prompt instructions
         assert response.status_code == 400
         assert response.get_json()['status'] == 'expired'
+
+    def test_batch_verify_requires_api_key(self, client):
+        """La vérification groupée exige la même clé que dispense"""
+        response = client.post('/pharmacy/verify', json={'tokens': ['validtoken']})
+        assert response.status_code == 401
+
+    def test_batch_verify_per_token_results(self, client, valid_prescription, monkeypatch, query_budget):
+        """Résultats par token, dans l'ordre : une requête IN, plus l'archive pour les inconnus"""
+        monkeypatch.setenv('PHARMACY_API_KEY', 'TEST-KEY')
+
+        with query_budget(2, 'vérification groupée'):
+            response = client.post('/pharmacy/verify', json={'tokens': ['validtoken', 'FAKETOKEN', 'validtoken']},
+                                   headers={'X-Pharmacy-Key': 'TEST-KEY'})
+        assert response.status_code == 200
+        data = response.get_json()
+        assert [r['token'] for r in data['results']] == ['validtoken', 'FAKETOKEN', 'validtoken']
+        assert [r['status'] for r in data['results']] == ['pending', 'not_found', 'pending']
+        assert data['valid_count'] == 2
+
+    def test_batch_verify_rejects_oversized_batch(self, client, monkeypatch):
+        """Au-delà de MAX_BATCH_TOKENS, la requête est refusée"""
+        from pharmacy_routes import MAX_BATCH_TOKENS
+        monkeypatch.setenv('PHARMACY_API_KEY', 'TEST-KEY')
+
+        response = client.post('/pharmacy/verify', json={'tokens': ['t'] * (MAX_BATCH_TOKENS + 1)},
+                               headers={'X-Pharmacy-Key': 'TEST-KEY'})
+        assert response.status_code == 400
@@ -74,11 +74,11 @@ class TestSecureQRCode:
         assert expected == "abc|def|123456"
 
     def test_view_prescription_qr_content(self, client, app, appointment, monkeypatch):
-        """Test that the view calls EWassfaService.generate_qr_code with correct URL"""
+        """The view links a separate QR image, rendered from the verify URL and cacheable"""
 
-        # Mock EWassfaService.generate_qr_code
-        mock_generate_qr = MagicMock(return_value="fake_base64_qr")
-        monkeypatch.setattr('SERVICES.ewassfa.EWassfaService.generate_qr_code', mock_generate_qr)
+        # Mock EWassfaService.render_qr
+        mock_render_qr = MagicMock(return_value=(b"<svg>fake_qr</svg>", "fake-etag"))
+        monkeypatch.setattr('SERVICES.ewassfa.EWassfaService.render_qr', mock_render_qr)
 
         with app.app_context():
             appt = db.session.merge(appointment)
@@ -102,13 +102,41 @@ class TestSecureQRCode:
 
             resp = client.get(f'/prescription/view/{token}')
             assert resp.status_code == 200
+            # No base64 QR inlined: the page points to the image endpoint
+            assert b'/prescription/qr/testtoken.svg' in resp.data
+            assert not mock_render_qr.called
 
-            # Verify that generate_qr_code was called with the correct URL
-            # Expected URL end with /prescription/verify/testtoken
-            args, _ = mock_generate_qr.call_args
+            qr = client.get(f'/prescription/qr/{token}.svg')
+            assert qr.status_code == 200
+            assert qr.mimetype == 'image/svg+xml'
+            assert qr.data == b"<svg>fake_qr</svg>"
+            assert 'max-age' in qr.headers['Cache-Control']
+
+            # Verify that render_qr was called with the correct URL
+            args, _ = mock_render_qr.call_args
             verify_url = args[0]
             assert verify_url.endswith('/prescription/verify/testtoken')
             assert 'http' in verify_url
 
-            # Verify that the response contains the mock QR code data
-            assert b'fake_base64_qr' in resp.data
+            # Same ETag: 304 without body
+            cached = client.get(f'/prescription/qr/{token}.svg', headers={'If-None-Match': '"fake-etag"'})
+            assert cached.status_code == 304
+
+    def test_verify_url_ignores_host_header(self, client, app, appointment, monkeypatch):
+        """With PUBLIC_BASE_URL, the encoded URL does not depend on the request Host"""
+        mock_render_qr = MagicMock(return_value=(b"<svg/>", "etag"))
+        monkeypatch.setattr('SERVICES.ewassfa.EWassfaService.render_qr', mock_render_qr)
+        app.config['PUBLIC_BASE_URL'] = 'https://tbib.dz/'
+
+        with app.app_context():
+            appt = db.session.merge(appointment)
+            db.session.add(Prescription(token='hosttoken', appointment_id=appt.id,
+                                        doctor_id=appt.doctor_profile.user_id, patient_id=appt.patient_id,
+                                        medications="Meds", security_hash="h", status='pending',
+                                        expiry_date=datetime.datetime.utcnow() + datetime.timedelta(days=90)))
+            db.session.commit()
+
+            for host in ('evil.example', 'other.example'):
+                assert client.get('/prescription/qr/hosttoken.svg', headers={'Host': host}).status_code == 200
+            urls = {call.args[0] for call in mock_render_qr.call_args_list}
+            assert urls == {'https://tbib.dz/prescription/verify/hosttoken'}
@@ -0,0 +1,48 @@
+import datetime
+from sqlalchemy import text
+from app import db
+from models import Prescription, PrescriptionArchive, PrescriptionDispensation
+from utils.prescription_sweeper import expire_prescriptions, archive_expired
+from tests.test_dispensing import make_prescription
+
+NOW = datetime.datetime.utcnow()
+
+
+class TestPrescriptionSweeper:
+    """Ordonnances périmées : marquées par lots, puis sorties de la table chaude"""
+
+    def test_expire_in_batches(self, app):
+        for idx in range(5):
+            make_prescription(f'old{idx}', max_usage=1, expiry_days=-1)
+        make_prescription('live', max_usage=1)
+
+        assert expire_prescriptions(batch_size=2) == 5
+        statuses = dict(db.session.query(Prescription.token, Prescription.status))
+        assert statuses.pop('live') == 'pending'
+        assert set(statuses.values()) == {'expired'}
+        assert expire_prescriptions() == 0
+
+    def test_archive_old_expired(self, app, client):
+        make_prescription('ancient', max_usage=1, expiry_days=-200)
+        make_prescription('recent', max_usage=1, expiry_days=-10)
+        used = make_prescription('used', max_usage=3, expiry_days=-200)
+        db.session.add(PrescriptionDispensation(prescription_id=used.id, usage_number=1))
+        db.session.commit()
+
+        expire_prescriptions()
+        assert archive_expired(older_than_days=90, batch_size=1) == 1
+
+        assert {p.token for p in Prescription.query} == {'recent', 'used'}
+        archived = PrescriptionArchive.query.one()
+        assert (archived.token, archived.status) == ('ancient', 'expired')
+
+        # La pharmacie voit toujours une ordonnance périmée, pas « introuvable »
+        response = client.get('/pharmacy/verify/ancient')
+        assert response.status_code == 400 and response.get_json()['status'] == 'expired'
+
+    def test_sweep_uses_partial_index(self, app):
+        table = Prescription.__table__
+        query = db.select(table.c.id).where(table.c.status == 'pending', table.c.expiry_date <= NOW).limit(1000)
+        sql = str(query.compile(db.engine, compile_kwargs={'literal_binds': True}))
+        plan = ' | '.join(row[3] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql)))
+        assert 'ix_prescriptions_active_expiry' in plan, plan
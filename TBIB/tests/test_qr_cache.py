@@ -0,0 +1,71 @@
+import os
+import pytest
+from utils import qr_cache as qr_module
+from utils.qr_cache import QRCache, qr_matrix, render_svg
+
+URL = 'https://tbib.dz/prescription/verify/abcd1234'
+
+
+class TestQRCache:
+    """QR codes rendus une fois par (format, URL), LRU en mémoire et disque optionnel"""
+
+    def test_svg_matches_matrix(self):
+        matrix = qr_matrix(URL)
+        svg = render_svg(URL).decode()
+        assert svg.startswith('<svg') and f'viewBox="0 0 {len(matrix)} {len(matrix)}"' in svg
+        # Un segment "M x y" par suite de modules noirs
+        runs = sum(1 for row in matrix for x, dark in enumerate(row) if dark and (x == 0 or not row[x - 1]))
+        assert svg.count('M') == runs
+
+    def test_content_addressed_lru(self, monkeypatch):
+        cache = QRCache(max_entries=2)
+        calls = []
+        monkeypatch.setitem(qr_module._RENDERERS, 'svg', lambda data: calls.append(data) or data.encode())
+
+        first, etag = cache.get('a')
+        assert cache.get('a') == (first, etag) and calls == ['a']
+        cache.get('b')
+        cache.get('c')  # évince 'a', le moins récemment utilisé
+        assert len(cache) == 2
+        cache.get('a')
+        assert calls == ['a', 'b', 'c', 'a']
+        assert cache.get('a', 'png')[1] != etag
+
+    def test_disk_persistence(self, tmp_path):
+        content, etag = QRCache(directory=str(tmp_path)).get(URL, 'png')
+        assert (tmp_path / f'{etag}.png').read_bytes() == content
+
+        # Nouveau processus (cache mémoire vide) : relu depuis le disque
+        assert QRCache(directory=str(tmp_path)).get(URL, 'png') == (content, etag)
+
+    def test_unknown_format(self):
+        with pytest.raises(KeyError):
+            QRCache().get(URL, 'gif')
+
+    def test_disk_is_bounded(self, tmp_path):
+        cache = QRCache(directory=str(tmp_path), max_files=2)
+        digests = []
+        for idx in range(3):
+            digests.append(cache.get(f'{URL}/{idx}')[1])
+            # Dernier accès distinct par fichier, quelle que soit la résolution du système de fichiers
+            os.utime(tmp_path / f'{digests[-1]}.svg', (idx + 1, idx + 1))
+        assert sorted(path.name for path in tmp_path.iterdir()) == sorted(f'{d}.svg' for d in digests[1:])
+
+    def test_failed_write_leaves_no_temp_file(self, tmp_path, monkeypatch):
+        def fail(*args):
+            raise OSError('disque plein')
+        monkeypatch.setattr(qr_module.os, 'replace', fail)
+        content, _ = QRCache(directory=str(tmp_path)).get(URL)
+        assert content.startswith(b'<svg')
+        assert list(tmp_path.iterdir()) == []
+
+    def test_disk_requires_public_base_url(self, app, tmp_path):
+        # Sans adresse publique, l'URL encodée suivrait l'en-tête Host de la requête
+        app.config.update(QR_CACHE_DIR=str(tmp_path), PUBLIC_BASE_URL=None, SERVER_NAME=None)
+        cache = QRCache()
+        cache.init_app(app)
+        assert cache.directory is None
+
+        app.config['PUBLIC_BASE_URL'] = 'https://tbib.dz'
+        cache.init_app(app)
+        assert cache.directory == str(tmp_path)
@@ -0,0 +1,76 @@
+import pytest
+import datetime
+from app import db
+from models import User, DoctorProfile, Appointment, ConsultationType, HealthRecord
+from utils.query_options import QueryBudgetExceeded
+
+
+@pytest.fixture
+def busy_calendar(app):
+    """Un médecin avec 12 RDV, chacun pour un patient différent avec dossier médical."""
+    doctor_user = User(email='doc@b.com', password_hash='x', role='doctor', name='Dr B', reliability_score=100)
+    db.session.add(doctor_user)
+    db.session.commit()
+    profile = DoctorProfile(user_id=doctor_user.id, specialty='X', city='Y')
+    db.session.add(profile)
+    db.session.commit()
+    ctype = ConsultationType(doctor_id=profile.id, name='Suivi', duration=20, color='#123456')
+    db.session.add(ctype)
+    db.session.commit()
+
+    patients = []
+    for idx in range(12):
+        patient = User(email=f'b{idx}@b.com', password_hash='x', role='patient',
+                       name=f'B{idx}', reliability_score=100, birth_date=datetime.date(1990, 1, 1))
+        db.session.add(patient)
+        db.session.flush()
+        db.session.add(HealthRecord(patient_id=patient.id, blood_type='O+'))
+        db.session.add(Appointment(
+            patient_id=patient.id, doctor_id=profile.id,
+            appointment_date=datetime.date.today() + datetime.timedelta(days=idx % 3),
+            appointment_time=datetime.time(9 + idx // 3, 0), status='confirmed',
+            consultation_type_id=ctype.id
+        ))
+        patients.append(patient)
+    db.session.commit()
+    return doctor_user, patients
+
+
+def login(client, user):
+    with client.session_transaction() as sess:
+        sess['_user_id'] = str(user.id)
+        sess['_fresh'] = True
+
+
+class TestQueryBudget:
+    """Les endpoints qui sérialisent des RDV ne font pas une requête par ligne"""
+
+    def test_budget_exceeded_fails(self, app, query_budget):
+        with pytest.raises(QueryBudgetExceeded):
+            with query_budget(1, 'test'):
+                User.query.all()
+                User.query.all()
+
+    def test_doctor_calendar(self, app, client, busy_calendar, query_budget):
+        doctor_user, _ = busy_calendar
+        login(client, doctor_user)
+        db.session.expunge_all()
+
+        with query_budget(5, 'api_doctor_appointments'):
+            events = client.get('/api/doctor/appointments').get_json()
+
+        assert len(events) == 12
+        assert events[0]['color'] == '#123456'
+        assert events[0]['extendedProps']['blood_type'] == 'O+'
+
+    def test_patient_history(self, app, client, busy_calendar, query_budget):
+        doctor_user, patients = busy_calendar
+        patient_id = patients[0].id
+        login(client, doctor_user)
+        db.session.expunge_all()
+
+        with query_budget(5, 'get_patient_history'):
+            data = client.get(f'/api/doctor/patient/{patient_id}/history').get_json()
+
+        assert data['patient']['blood_type'] == 'O+'
+        assert len(data['history']) == 1
@@ -0,0 +1,95 @@
+import os
+import pytest
+import datetime
+from sqlalchemy import create_engine, text
+from sqlalchemy.dialects import postgresql
+from sqlalchemy.orm import joinedload
+from app import db
+from models import User, DoctorProfile, Appointment, DoctorAvailability, DoctorAbsence
+
+DAY = datetime.date(2030, 1, 7)
+
+
+def hot_queries():
+    """Requêtes les plus fréquentes de routes.py, utils/engine.py et utils/smart_engine.py."""
+    today = (Appointment.doctor_id == 1, Appointment.appointment_date == DAY)
+    return {
+        'queue_by_status': Appointment.query.filter(
+            *today, Appointment.status.in_(['waiting', 'checked_in'])),
+        'count_by_status': db.session.query(db.func.count(Appointment.id)).filter(
+            *today, Appointment.status == 'confirmed'),
+        'status_counters': db.session.query(Appointment.id, Appointment.status).filter(*today),
+        'current_serving': Appointment.query.filter(*today, Appointment.queue_number == 3),
+        'max_queue_number': db.session.query(db.func.max(Appointment.queue_number)).filter(*today),
+        'ahead_by_queue': Appointment.query.filter(
+            *today, Appointment.status.in_(['waiting', 'confirmed']), Appointment.queue_number < 5),
+        'next_scheduled': Appointment.query.filter(
+            *today, Appointment.status.in_(['confirmed', 'waiting', 'checked_in']),
+            Appointment.appointment_time != None).order_by(Appointment.appointment_time),
+        'last_completed': Appointment.query.filter(
+            *today, Appointment.status == 'completed').order_by(Appointment.appointment_time.desc()),
+        'day_agenda': Appointment.query.options(joinedload(Appointment.patient)).filter(
+            *today).order_by(Appointment.appointment_time),
+        'booked_window': Appointment.query.filter(
+            Appointment.doctor_id == 1,
+            Appointment.appointment_date >= DAY,
+            Appointment.appointment_date <= DAY + datetime.timedelta(days=14),
+            Appointment.status.in_(['confirmed', 'waiting'])),
+        'revenue': db.session.query(db.func.sum(Appointment.price_paid)).filter(
+            *today, Appointment.status == 'completed'),
+        'patient_history': Appointment.query.filter(Appointment.patient_id == 7),
+        'patient_by_phone': User.query.filter(User.phone == '0550000000'),
+        'doctors_by_city': DoctorProfile.query.filter(DoctorProfile.city == 'Alger'),
+        'specialty_facets': db.session.query(DoctorProfile.specialty).distinct(),
+        'working_hours': DoctorAvailability.query.filter(
+            DoctorAvailability.doctor_id == 1, DoctorAvailability.day_of_week == 0),
+        'absences': DoctorAbsence.query.filter(
+            DoctorAbsence.doctor_id == 1, DoctorAbsence.start_date <= datetime.datetime(2030, 1, 8)),
+    }
+
+
+QUERY_NAMES = [
+    'queue_by_status', 'count_by_status', 'status_counters', 'current_serving',
+    'max_queue_number', 'ahead_by_queue', 'next_scheduled', 'last_completed',
+    'day_agenda', 'booked_window', 'revenue', 'patient_history', 'patient_by_phone',
+    'doctors_by_city', 'specialty_facets', 'working_hours', 'absences',
+]
+
+
+def compile_sql(query, dialect):
+    return str(query.statement.compile(dialect=dialect, compile_kwargs={'literal_binds': True}))
+
+
+class TestHotQueryPlans:
+    """Chaque requête du chemin critique passe par un index, jamais par un parcours complet"""
+
+    @pytest.mark.parametrize('name', QUERY_NAMES)
+    def test_sqlite_uses_index(self, app, name):
+        sql = compile_sql(hot_queries()[name], db.engine.dialect)
+        plan = [row[3] for row in db.session.execute(text('EXPLAIN QUERY PLAN ' + sql))]
+
+        # SEARCH = accès par index ; un SCAN n'est accepté que sur un index couvrant
+        table_steps = [step for step in plan if step.startswith(('SCAN', 'SEARCH'))]
+        assert table_steps, plan
+        for step in table_steps:
+            assert step.startswith('SEARCH') or 'COVERING INDEX' in step, f"{name}: {plan}"
+
+    @pytest.mark.parametrize('name', QUERY_NAMES)
+    def test_postgresql_uses_index(self, app, name):
+        url = os.environ.get('TEST_POSTGRES_URL')
+        if not url:
+            pytest.skip('TEST_POSTGRES_URL non défini')
+
+        engine = create_engine(url)
+        db.metadata.create_all(engine)
+        try:
+            with engine.connect() as conn:
+                # Sur des tables presque vides, le planner préfère toujours un Seq Scan
+                conn.execute(text('SET enable_seqscan = off'))
+                sql = compile_sql(hot_queries()[name], postgresql.dialect())
+                plan = '\n'.join(row[0] for row in conn.execute(text('EXPLAIN ' + sql)))
+            assert 'Seq Scan' not in plan, f"{name}:\n{plan}"
+            assert 'Index' in plan, f"{name}:\n{plan}"
+        finally:
+            db.metadata.drop_all(engine)
+            engine.dispose()
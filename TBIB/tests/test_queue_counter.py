@@ -0,0 +1,58 @@
+import datetime
+from app import db
+from models import User, DoctorProfile, Appointment, QueueCounter
+from SERVICES.smartflow import SmartFlowService
+from utils.queue_counter import next_queue_number
+
+DAY = datetime.date(2030, 1, 7)
+
+
+def make_doctor(email):
+    doctor_user = User(email=email, password_hash='x', role='doctor', name='Dr Q', reliability_score=100)
+    db.session.add(doctor_user)
+    db.session.commit()
+    profile = DoctorProfile(user_id=doctor_user.id, specialty='X', city='Y')
+    db.session.add(profile)
+    db.session.commit()
+    return profile
+
+
+class TestQueueCounter:
+    """Numéros de passage attribués par un compteur atomique par (médecin, jour)"""
+
+    def test_sequential_numbers(self, app):
+        profile = make_doctor('q1@q.com')
+
+        assert [next_queue_number(profile.id, DAY) for _ in range(3)] == [1, 2, 3]
+        assert db.session.get(QueueCounter, (profile.id, DAY)).next_value == 4
+
+    def test_seeded_from_existing_tickets(self, app):
+        profile = make_doctor('q2@q.com')
+        patient = User(email='p@q.com', password_hash='x', role='patient', name='P', reliability_score=100)
+        db.session.add(patient)
+        db.session.flush()
+        db.session.add(Appointment(patient_id=patient.id, doctor_id=profile.id,
+                                   appointment_date=DAY, status='waiting', queue_number=7))
+        db.session.commit()
+
+        assert SmartFlowService.assign_queue_number(profile.id, DAY) == 8
+        assert SmartFlowService.assign_queue_number(profile.id, DAY) == 9
+
+    def test_counters_are_per_doctor_and_day(self, app):
+        first = make_doctor('q3@q.com')
+        second = make_doctor('q4@q.com')
+
+        assert next_queue_number(first.id, DAY) == 1
+        assert next_queue_number(second.id, DAY) == 1
+        assert next_queue_number(first.id, DAY + datetime.timedelta(days=1)) == 1
+        assert next_queue_number(first.id, DAY) == 2
+
+    def test_rollback_releases_number(self, app):
+        profile = make_doctor('q5@q.com')
+        assert next_queue_number(profile.id, DAY) == 1
+        db.session.commit()
+
+        assert next_queue_number(profile.id, DAY) == 2
+        db.session.rollback()
+
+        assert next_queue_number(profile.id, DAY) == 2
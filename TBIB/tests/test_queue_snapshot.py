@@ -0,0 +1,123 @@
+import pytest
+import json
+import datetime
+from app import db
+from models import User, DoctorProfile, Appointment, ConsultationType
+from routes import get_serializer
+from utils.queue_events import queue_events, COMPLETED
+from utils.queue_snapshot import get_queue_snapshot
+from utils.smart_engine import notify_queue_change
+
+
+@pytest.fixture(autouse=True)
+def clear_cache():
+    queue_events.backend.clear()
+    yield
+    queue_events.backend.clear()
+
+
+@pytest.fixture
+def waiting_room(app):
+    """Trois tickets du jour ; le premier est une consultation longue (45 min)."""
+    doctor_user = User(email='doc@l.com', password_hash='x', role='doctor', name='Dr L', reliability_score=100)
+    db.session.add(doctor_user)
+    db.session.commit()
+    profile = DoctorProfile(user_id=doctor_user.id, specialty='X', city='Y')
+    db.session.add(profile)
+    db.session.commit()
+    long_type = ConsultationType(doctor_id=profile.id, name='Long', duration=45)
+    db.session.add(long_type)
+    db.session.commit()
+
+    appointments = []
+    for idx in range(3):
+        patient = User(email=f'l{idx}@l.com', password_hash='x', role='patient',
+                       name=f'L{idx}', reliability_score=100)
+        db.session.add(patient)
+        db.session.flush()
+        appointments.append(Appointment(
+            patient_id=patient.id, doctor_id=profile.id,
+            appointment_date=datetime.date.today(), status='waiting', queue_number=idx + 1,
+            consultation_type_id=long_type.id if idx == 0 else None
+        ))
+    db.session.add_all(appointments)
+    db.session.commit()
+    return profile, appointments
+
+
+class TestQueueSnapshot:
+    """Un seul calcul par (médecin, jour), partagé par tous les lecteurs"""
+
+    def test_positions_and_wait(self, app, waiting_room):
+        profile, (first, second, third) = waiting_room
+        snapshot = get_queue_snapshot(profile.id)
+
+        assert snapshot.ticket(first.id)['waiting_ahead'] == 0
+        assert snapshot.ticket(third.id)['waiting_ahead'] == 2
+        assert snapshot.position(3, None) == (2, 45 + 30)
+        assert snapshot.count(['waiting']) == 3
+
+    def test_snapshot_shared_until_event(self, app, waiting_room):
+        profile, (first, second, third) = waiting_room
+        snapshot = get_queue_snapshot(profile.id)
+        assert get_queue_snapshot(profile.id) is snapshot
+
+        first.status = 'completed'
+        first.price_paid = 2000
+        db.session.commit()
+        notify_queue_change(first, COMPLETED)
+
+        refreshed = get_queue_snapshot(profile.id)
+        assert refreshed is not snapshot
+        assert refreshed.ticket(third.id)['waiting_ahead'] == 1
+        assert refreshed.revenue() == 2000
+
+    def test_other_days_are_separate(self, app, waiting_room):
+        profile, _ = waiting_room
+        tomorrow = datetime.date.today() + datetime.timedelta(days=1)
+        today_snapshot = get_queue_snapshot(profile.id)
+
+        queue_events.publish(COMPLETED, profile.id, tomorrow)
+
+        assert get_queue_snapshot(profile.id) is today_snapshot
+        assert get_queue_snapshot(profile.id, tomorrow).rows == []
+
+    def test_stream_sends_ticket_event(self, app, client, waiting_room):
+        profile, (first, second, third) = waiting_room
+        token = get_serializer(app.secret_key).dumps(third.id)
+
+        # Serveur multithread (gthread, serveur de dev) : le flux est servi
+        response = client.get(f'/patient/live/stream/{token}', buffered=False,
+                              environ_overrides={'wsgi.multithread': True})
+        assert response.status_code == 200
+        assert response.mimetype == 'text/event-stream'
+
+        chunk = next(response.response)
+        chunk = chunk.decode() if isinstance(chunk, bytes) else chunk
+        assert chunk.startswith('data: ')
+        assert json.loads(chunk[len('data: '):])['waiting_ahead'] == 2
+        response.close()
+
+    def test_sync_worker_falls_back_to_polling(self, app, client, waiting_room):
+        # Worker synchrone : un flux de 5 minutes bloquerait toute l'application
+        profile, (first, second, third) = waiting_room
+        token = get_serializer(app.secret_key).dumps(third.id)
+
+        assert client.get(f'/patient/live/stream/{token}').status_code == 204
+        html = client.get(f'/patient/live/{token}').get_data(as_text=True)
+        assert 'const STREAM_ENABLED = false;' in html
+
+        app.config['LIVE_STREAM_ENABLED'] = True  # Worker asynchrone (gevent) déclaré
+        html = client.get(f'/patient/live/{token}').get_data(as_text=True)
+        assert 'const STREAM_ENABLED = true;' in html
+
+    def test_polling_and_queue_status_use_snapshot(self, app, client, waiting_room):
+        profile, (first, second, third) = waiting_room
+        token = get_serializer(app.secret_key).dumps(second.id)
+
+        data = client.get(f'/patient/live/status/{token}').get_json()
+        assert data['waiting_ahead'] == 1
+        assert data['queue_number'] == 2
+
+        status = client.get(f'/api/queue_status/{profile.id}').get_json()
+        assert status['checked_in_count'] == 3
@@ -0,0 +1,157 @@
+import pytest
+import datetime
+from app import db
+from models import User, DoctorProfile, Appointment
+from utils import smart_engine
+from utils.smart_engine import QueueOptimizer, get_queue_state, notify_queue_change, process_checkin
+
+
+@pytest.fixture(autouse=True)
+def clear_queue_states():
+    smart_engine._queue_states.clear()
+    yield
+    smart_engine._queue_states.clear()
+
+
+@pytest.fixture
+def queue(app):
+    """Un médecin, trois patients du jour : deux en attente, un confirmé."""
+    doctor_user = User(email='doc@q.com', password_hash='x', role='doctor', name='Dr Q', reliability_score=100)
+    db.session.add(doctor_user)
+    db.session.commit()
+    profile = DoctorProfile(user_id=doctor_user.id, specialty='X', city='Y')
+    db.session.add(profile)
+    db.session.commit()
+
+    today = datetime.date.today()
+    appointments = []
+    for idx, (status, urgency) in enumerate([('waiting', 1), ('waiting', 3), ('confirmed', 1)]):
+        patient = User(email=f'p{idx}@q.com', password_hash='x', role='patient',
+                       name=f'P{idx}', reliability_score=100)
+        db.session.add(patient)
+        db.session.flush()
+        appointments.append(Appointment(patient_id=patient.id, doctor_id=profile.id,
+                                        appointment_date=today, status=status,
+                                        urgency_level=urgency, queue_number=idx + 1))
+    db.session.add_all(appointments)
+    db.session.commit()
+    return profile, appointments
+
+
+class TestQueueState:
+    """File SmartFlow tenue à jour en mémoire"""
+
+    def test_ordered_by_priority(self, app, queue):
+        profile, (low, high, _) = queue
+        state = get_queue_state(profile.id)
+        assert [item['appointment_id'] for item in state.ordered()] == [high.id, low.id]
+        assert state.peek()['appointment_id'] == high.id
+        assert state.counts['waiting'] == 2
+        assert state.counts['confirmed'] == 1
+
+    def test_get_queue_status_does_not_write(self, app, queue):
+        profile, (low, high, _) = queue
+        status = QueueOptimizer().get_queue_status(profile.id)
+
+        assert [item['appointment_id'] for item in status['ordered_queue']] == [high.id, low.id]
+        assert status['statistics']['waiting_count'] == 2
+        assert not db.session.dirty
+        # Les numéros en base ne sont pas réécrits par une lecture
+        assert db.session.get(Appointment, low.id).queue_number == 1
+
+    def test_events_update_counters(self, app, queue):
+        profile, (low, high, confirmed) = queue
+        state = get_queue_state(profile.id)
+
+        high.status = 'completed'
+        notify_queue_change(high)
+        confirmed.status = 'no_show'
+        notify_queue_change(confirmed)
+
+        assert state.counts['waiting'] == 1
+        assert state.counts['completed'] == 1
+        assert state.counts['no_show'] == 1
+        assert [item['appointment_id'] for item in state.ordered()] == [low.id]
+
+    def test_missed_version_reloads_state(self, app, queue):
+        # Un autre worker (backend Redis partagé) a changé la file sans que ce processus le voie
+        from utils.queue_events import queue_events
+        profile, (low, high, confirmed) = queue
+        state = get_queue_state(profile.id)
+
+        confirmed.status = 'no_show'
+        db.session.commit()
+        queue_events.backend.bump((profile.id, datetime.date.today()))
+
+        high.status = 'completed'
+        db.session.commit()
+        notify_queue_change(high)
+
+        reloaded = get_queue_state(profile.id)
+        assert reloaded is not state
+        assert reloaded.counts['no_show'] == 1
+        assert reloaded.counts['completed'] == 1
+
+    def test_checkin_persists_changed_numbers_only(self, app, queue):
+        profile, (low, high, confirmed) = queue
+        get_queue_state(profile.id)
+
+        process_checkin(confirmed.id)
+
+        state = get_queue_state(profile.id)
+        assert state.counts['checked_in'] == 1
+        assert db.session.get(Appointment, high.id).queue_number == 1
+        assert db.session.get(Appointment, low.id).queue_number == 2
+        assert db.session.get(Appointment, confirmed.id).queue_number == 3
+        assert state.sync_queue_numbers() is False
+
+    def test_local_state_expires_without_shared_backend(self, app, queue, monkeypatch):
+        # Backend mémoire : le check-in d'une autre instance ne change pas la version locale
+        profile, (low, high, confirmed) = queue
+        state = get_queue_state(profile.id)
+        confirmed.status = 'checked_in'
+        db.session.commit()
+        assert get_queue_state(profile.id) is state
+
+        monkeypatch.setattr(state, 'loaded_at', state.loaded_at - smart_engine.LOCAL_STATE_MAX_AGE_SECONDS)
+        reloaded = get_queue_state(profile.id)
+        assert reloaded is not state
+        assert reloaded.counts['checked_in'] == 1
+
+    def test_checkin_numbers_from_fresh_state(self, app, queue):
+        profile, (low, high, confirmed) = queue
+        get_queue_state(profile.id)
+        # Patient passé sur une autre instance : l'état local ne le sait pas encore
+        high.status = 'completed'
+        db.session.commit()
+
+        process_checkin(confirmed.id)
+
+        assert db.session.get(Appointment, low.id).queue_number == 1
+        assert db.session.get(Appointment, confirmed.id).queue_number == 2
+
+    def test_concurrent_events_and_reads(self, app, queue):
+        import threading
+        profile, (low, high, confirmed) = queue
+        state = get_queue_state(profile.id)
+        errors = []
+
+        def read():
+            try:
+                for _ in range(200):
+                    state.ordered()
+                    state.peek()
+            except Exception as exc:  # pragma: no cover - échec du test
+                errors.append(exc)
+
+        readers = [threading.Thread(target=read) for _ in range(4)]
+        for thread in readers:
+            thread.start()
+        for _ in range(100):
+            for appointment, status in ((low, 'checked_in'), (low, 'waiting')):
+                appointment.status = status
+                state.apply(appointment)
+        for thread in readers:
+            thread.join()
+        assert errors == []
+        assert state.counts['waiting'] == 2
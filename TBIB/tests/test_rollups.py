@@ -0,0 +1,159 @@
+import datetime
+import pytest
+from app import db
+from models import (User, DoctorProfile, Appointment, EpidemiologyData, RollupDoctorsByCity,
+                    RollupDailyAppointments, RollupDailyEpidemiology)
+from utils.rollups import (rebuild_rollups, doctors_per_city, health_trends, appointments_per_specialty,
+                           format_trend)
+
+TODAY = datetime.date.today()
+
+
+def add_doctor(idx, city, specialty='Cardiologue'):
+    user = User(email=f'rollup{idx}@r.com', password_hash='x', role='doctor', name=f'Dr {idx}',
+                reliability_score=100)
+    db.session.add(user)
+    db.session.flush()
+    profile = DoctorProfile(user_id=user.id, specialty=specialty, city=city)
+    db.session.add(profile)
+    db.session.flush()
+    return profile
+
+
+def add_cases(pathology, day, count, wilaya='Alger'):
+    for _ in range(count):
+        db.session.add(EpidemiologyData(city=wilaya, wilaya=wilaya, pathology_tag=pathology, age_group='18-35',
+                                        gender='F', timestamp=datetime.datetime.combine(day, datetime.time(10))))
+
+
+def snapshot():
+    return (
+        sorted((r.city, r.doctor_count) for r in RollupDoctorsByCity.query if r.doctor_count),
+        sorted((r.day, r.specialty, r.appointment_count) for r in RollupDailyAppointments.query
+               if r.appointment_count),
+        sorted((r.day, r.pathology_tag, r.age_group, r.gender, r.wilaya, r.case_count)
+               for r in RollupDailyEpidemiology.query if r.case_count),
+    )
+
+
+@pytest.fixture
+def activity(app):
+    """Trois médecins dans deux villes, des RDV et des cas sur deux semaines."""
+    doctors = [add_doctor(0, 'Alger'), add_doctor(1, 'Alger', 'Pédiatre'), add_doctor(2, 'Oran')]
+    patient = User(email='rollup-p@r.com', password_hash='x', role='patient', name='P', reliability_score=100)
+    db.session.add(patient)
+    db.session.flush()
+    for offset in range(10):
+        db.session.add(Appointment(patient_id=patient.id, doctor_id=doctors[offset % 3].id,
+                                   appointment_date=TODAY - datetime.timedelta(days=offset)))
+
+    add_cases('Grippe', TODAY, 6)
+    add_cases('Grippe', TODAY - datetime.timedelta(days=9), 4, wilaya='Oran')
+    add_cases('Asthme', TODAY - datetime.timedelta(days=2), 3)
+    add_cases('Asthme', TODAY - datetime.timedelta(days=8), 3)
+    add_cases('Rougeole', TODAY - datetime.timedelta(days=1), 2)
+    db.session.commit()
+    return doctors
+
+
+class TestIncrementalRollups:
+    """Les agrégats tenus par événements égalent un recalcul complet"""
+
+    def test_counts_follow_writes(self, app, activity):
+        assert doctors_per_city() == [('Alger', 2), ('Oran', 1)]
+
+        # Déménagement, RDV déplacé et supprimé, cas supprimé
+        activity[2].city = 'Alger'
+        appointment = Appointment.query.filter_by(appointment_date=TODAY).one()
+        appointment.appointment_date = TODAY - datetime.timedelta(days=20)
+        db.session.delete(Appointment.query.filter_by(appointment_date=TODAY - datetime.timedelta(days=1)).one())
+        db.session.delete(EpidemiologyData.query.filter_by(pathology_tag='Rougeole').first())
+        db.session.commit()
+        assert doctors_per_city() == [('Alger', 3)]
+
+        incremental = snapshot()
+        rebuild_rollups()
+        db.session.commit()
+        assert snapshot() == incremental
+
+    def test_specialty_change_moves_appointments(self, app, activity):
+        # RDV compté en Cardiologue, puis le médecin devient Dentiste, puis le RDV est supprimé
+        cardiologist = activity[0]
+        cardiologist.specialty = 'Dentiste'
+        db.session.commit()
+        db.session.delete(Appointment.query.filter_by(doctor_id=cardiologist.id, appointment_date=TODAY).one())
+        db.session.commit()
+
+        counts = {specialty: current for specialty, current, _ in appointments_per_specialty()}
+        assert 'Dentiste' in counts and 'Cardiologue' in counts  # Le médecin d'Oran reste cardiologue
+        assert all(count >= 0 for count in counts.values())
+        incremental = snapshot()
+        rebuild_rollups()
+        db.session.commit()
+        assert snapshot() == incremental
+
+    def test_attribute_expired_after_commit(self, app, activity):
+        # Valeur précédente chargée même après expiration (commit)
+        profile = db.session.get(DoctorProfile, activity[0].id)
+        db.session.expire(profile)
+        profile.city = 'Blida'
+        db.session.commit()
+        assert dict(doctors_per_city()) == {'Alger': 1, 'Oran': 1, 'Blida': 1}
+
+    def test_doctor_deleted(self, app):
+        profile = add_doctor(9, 'Tlemcen')
+        db.session.commit()
+        db.session.delete(profile)
+        db.session.commit()
+        assert doctors_per_city() == []
+
+
+class TestTrends:
+    """Tendances semaine sur semaine"""
+
+    def test_format_trend(self):
+        assert format_trend(6, 4) == '+50%'
+        assert format_trend(3, 4) == '-25%'
+        assert format_trend(100, 101) == 'Stable'
+        assert format_trend(2, 0) == 'Nouveau'
+        assert format_trend(0, 0) == 'Stable'
+
+    def test_health_trends(self, app, activity):
+        assert health_trends(TODAY) == {'Grippe': '+50%', 'Asthme': 'Stable', 'Rougeole': 'Nouveau'}
+
+    def test_appointments_per_specialty(self, app, activity):
+        # 7 derniers jours : offsets 0..6 ; semaine précédente : 7..9
+        assert appointments_per_specialty(TODAY) == [('Cardiologue', 5, '+150%'), ('Pédiatre', 2, '+100%')]
+
+
+class TestMinistryDashboard:
+    """Le tableau de bord lit les agrégats"""
+
+    def test_dashboard_reads_rollups(self, client, activity, query_budget):
+        with query_budget(4, 'tableau de bord ministère'):
+            response = client.get('/admin/ministry')
+        assert response.status_code == 200
+        html = response.get_data(as_text=True)
+        assert '3 médecins actifs couvrant 2 villes' in html
+        assert 'Rougeole' in html and 'Nouveau' in html
+
+
+class TestSeedReset:
+    """Réinitialisation des médecins de démonstration (suppressions en masse)"""
+
+    def test_reset_clears_derived_tables(self, app, activity, monkeypatch):
+        from models import DoctorPatientStats
+        from seed_data import seed_50_doctors
+        # Hachage des mots de passe hors sujet ici (et lent)
+        monkeypatch.setattr(User, 'set_password', lambda user, password: setattr(user, 'password_hash', 'x'))
+        assert DoctorPatientStats.query.count() > 0
+
+        seed_50_doctors(reset=True)
+
+        incremental = snapshot()
+        assert incremental[1] == []  # Plus aucun RDV
+        assert sum(count for _, count in incremental[0]) == 50
+        rebuild_rollups()
+        db.session.commit()
+        assert snapshot() == incremental
+        assert DoctorPatientStats.query.count() == 0
@@ -0,0 +1,60 @@
+import datetime
+from app import db
+from SERVICES.ewassfa import EWassfaService
+from utils import signing
+from utils.signing import parse_keys
+from tests.test_dispensing import make_prescription
+
+
+def sign(prescription, medications='Amoxicilline 1g'):
+    signature, key_id, header = EWassfaService.sign_prescription(
+        prescription.doctor_id, prescription.patient_id, medications, 1700000000)
+    prescription.medications = medications
+    prescription.security_hash, prescription.key_id, prescription.signed_header = signature, key_id, header
+    db.session.commit()
+    return prescription
+
+
+class TestSigningKeys:
+    """Signature par clé versionnée : en-tête stocké, rotation, comparaison en temps constant"""
+
+    def test_parse_keys(self):
+        assert parse_keys('k1:a, k2:b:c,bad,') == {'k1': 'a', 'k2': 'b:c'}
+        assert parse_keys(None) == {}
+
+    def test_default_key_from_secret(self, app):
+        prescription = sign(make_prescription('s1', max_usage=1))
+        assert prescription.key_id == signing.DEFAULT_KEY_ID
+        assert EWassfaService.verify_signature(prescription)
+
+        # created_at ne sert plus : le timestamp signé est dans l'en-tête stocké
+        prescription.created_at = datetime.datetime(2000, 1, 1)
+        assert EWassfaService.verify_signature(prescription)
+
+    def test_tampering_detected(self, app):
+        prescription = sign(make_prescription('s2', max_usage=1))
+
+        prescription.medications = 'Morphine'
+        assert not EWassfaService.verify_signature(prescription)
+        prescription.medications = 'Amoxicilline 1g'
+        prescription.patient_id = prescription.doctor_id
+        assert not EWassfaService.verify_signature(prescription)
+
+    def test_rotation(self, app):
+        app.config['EWASSFA_SIGNING_KEYS'] = {'k1': 'ancienne', 'k2': 'nouvelle'}
+        app.config['EWASSFA_ACTIVE_KEY_ID'] = 'k1'
+        old = sign(make_prescription('s3', max_usage=1))
+
+        app.config['EWASSFA_ACTIVE_KEY_ID'] = 'k2'
+        new = sign(make_prescription('s4', max_usage=1))
+        assert (old.key_id, new.key_id) == ('k1', 'k2')
+        assert EWassfaService.verify_signature(old) and EWassfaService.verify_signature(new)
+
+        # Clé retirée du trousseau : ses ordonnances ne sont plus acceptées
+        app.config['EWASSFA_SIGNING_KEYS'] = {'k2': 'nouvelle'}
+        assert not EWassfaService.verify_signature(old)
+        assert EWassfaService.verify_signature(new)
+
+    def test_pharmacy_verify_uses_stored_header(self, app, client):
+        sign(make_prescription('s5', max_usage=1))
+        assert client.get('/pharmacy/verify/s5').get_json()['valid'] is True
@@ -0,0 +1,78 @@
+import builtins
+import os
+import subprocess
+import sys
+from flask import Flask
+from utils.startup_profile import ENV_FLAG, StartupProfile
+
+TBIB_DIR = os.path.abspath(os.path.join(os.path.dirname(__file__), '..'))
+
+
+class TestStartupProfile:
+    """Profil de démarrage : imports et étapes d'initialisation"""
+
+    def test_imports_and_steps(self, tmp_path, monkeypatch, capsys):
+        (tmp_path / 'profiled_parent.py').write_text('import profiled_child\n')
+        (tmp_path / 'profiled_child.py').write_text('VALUE = sum(range(10000))\n')
+        monkeypatch.syspath_prepend(str(tmp_path))
+        original_import = builtins.__import__
+
+        profile = StartupProfile(enabled=True)
+        profile.start()
+        try:
+            with profile.step('fixture'):
+                # Passe par builtins.__import__, donc par le crochet du profil
+                __import__('profiled_parent')
+        finally:
+            report = profile.finish(Flask(__name__))
+            sys.modules.pop('profiled_parent', None)
+            sys.modules.pop('profiled_child', None)
+
+        assert builtins.__import__ is original_import
+        assert [step['name'] for step in report['steps']] == ['fixture']
+        imports = {entry['module']: entry for entry in report['imports']}
+        parent, child = imports['profiled_parent'], imports['profiled_child']
+        assert parent['inclusive'] >= child['inclusive']
+        assert parent['self'] <= parent['inclusive'] - child['inclusive'] + 1e-6
+        assert 'profiled_parent' in capsys.readouterr().err
+
+    def test_disabled_is_inert(self):
+        original_import = builtins.__import__
+        profile = StartupProfile(enabled=False)
+        profile.start()
+        assert builtins.__import__ is original_import
+        with profile.step('rien'):
+            pass
+        assert profile.steps == []
+        assert profile.finish(Flask(__name__)) is None
+
+
+class TestDeferredImports:
+    """Dépendances lourdes chargées au premier usage, pas au démarrage"""
+
+    def _startup_modules(self, **env):
+        script = (
+            "import sys, app; app.create_app(); "
+            "print(' '.join(name for name in ('qrcode', 'PIL', 'seed_data') if name in sys.modules))"
+        )
+        environment = dict(os.environ, DEBUG='True', DATABASE_URL='sqlite:///:memory:')
+        environment.pop(ENV_FLAG, None)
+        environment.update(env)
+        result = subprocess.run([sys.executable, '-c', script], cwd=TBIB_DIR, env=environment,
+                                capture_output=True, text=True, check=True)
+        return result
+
+    def test_create_app_skips_heavy_modules(self):
+        assert self._startup_modules().stdout.strip() == ''
+
+    def test_profile_report(self):
+        result = self._startup_modules(**{ENV_FLAG: '1'})
+        assert 'blueprint main' in result.stderr
+        assert 'Imports (' in result.stderr
+
+    def test_serializer_built_once_per_key(self, app):
+        from routes import get_serializer
+        with app.test_request_context():
+            assert get_serializer() is get_serializer()
+            assert get_serializer('autre') is not get_serializer()
+            assert get_serializer().loads(get_serializer().dumps(42)) == 42
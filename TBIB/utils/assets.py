@@ -0,0 +1,259 @@
+"""
+TBIB - Fichiers statiques empreintés et précompressés
+
+`flask assets-build` (au déploiement) copie chaque fichier de static/ vers
+static/dist/ sous un nom qui contient l'empreinte de son contenu
+(css/style.css -> dist/css/style.3f2ab9c1d0e4.css), écrit à côté les variantes
+.gz et .br des formats texte, puis :
+
+- dist/assets.json : manifeste {fichier source: fichier empreinté, encodages}
+- dist/precache.js : liste de préchargement importée par static/sw.js, avec
+  une version qui change dès qu'un fichier change
+- dist/builds/<version>.json : copie du manifeste de chaque build
+
+Le build n'efface rien : les pages déjà servies (workers pas encore
+redémarrés, onglets ouverts, service workers) gardent leurs fichiers.
+`flask assets-prune` supprime ensuite les fichiers qu'aucun des KEEP_BUILDS
+derniers builds ne référence.
+
+Dans les gabarits, `asset_url('css/style.css')` rend l'URL empreintée (servie
+'immutable' par utils/http_cache) ; sans build, l'URL classique ?v=<empreinte>.
+
+Le fichier servi est la variante .br ou .gz quand le navigateur l'accepte
+(Content-Encoding, Vary: Accept-Encoding). Brotli est optionnel : sans le
+paquet `brotli`, seules les variantes gzip sont produites.
+"""
+
+import gzip
+import hashlib
+import json
+import mimetypes
+import os
+import shutil
+from typing import Dict, List, Optional
+
+import click
+from flask import request, send_from_directory, url_for
+
+try:
+    import brotli
+except ImportError:  # Paquet optionnel
+    brotli = None
+
+DIST_DIR = 'dist'
+MANIFEST_NAME = 'assets.json'
+PRECACHE_NAME = 'precache.js'
+BUILDS_DIR = 'builds'
+
+# Builds dont les fichiers survivent à `flask assets-prune` (le courant compris)
+KEEP_BUILDS = 3
+
+# Fichiers du build à nom fixe (réécrits à chaque déploiement)
+BUILD_FILES = {f"{DIST_DIR}/{MANIFEST_NAME}", f"{DIST_DIR}/{PRECACHE_NAME}"}
+
+# Jamais empreintés : le service worker et le manifeste PWA gardent leur URL
+UNVERSIONED_ASSETS = {'sw.js', 'manifest.json'}
+
+COMPRESSIBLE_EXTENSIONS = {'.css', '.js', '.svg', '.json', '.txt', '.html'}
+
+# Les fichiers plus lourds (logos PNG) sont mis en cache au premier usage, pas à l'installation
+PRECACHE_MAX_BYTES = 64 * 1024
+
+# Ordre de préférence quand le navigateur accepte plusieurs encodages
+ENCODINGS = (('br', '.br'), ('gzip', '.gz'))
+
+
+# ========================================
+# BUILD
+# ========================================
+
+def _digest(path: str) -> str:
+    with open(path, 'rb') as handle:
+        return hashlib.sha256(handle.read()).hexdigest()[:12]
+
+
+def _fingerprinted_name(relative: str, digest: str) -> str:
+    stem, ext = os.path.splitext(relative)
+    return f"{DIST_DIR}/{stem}.{digest}{ext}"
+
+
+def _source_files(static_folder: str) -> List[str]:
+    files = []
+    for root, dirs, names in os.walk(static_folder):
+        dirs[:] = sorted(d for d in dirs if os.path.relpath(os.path.join(root, d), static_folder) != DIST_DIR)
+        for name in sorted(names):
+            relative = os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/')
+            if relative not in UNVERSIONED_ASSETS:
+                files.append(relative)
+    return files
+
+
+def _compress(path: str) -> List[str]:
+    """Écrit les variantes .gz (et .br) plus petites que l'original ; retourne leurs encodages."""
+    with open(path, 'rb') as handle:
+        content = handle.read()
+
+    variants = {'gzip': gzip.compress(content, compresslevel=9, mtime=0)}
+    if brotli is not None:
+        variants['br'] = brotli.compress(content, quality=11)
+
+    encodings = []
+    for encoding, suffix in ENCODINGS:
+        compressed = variants.get(encoding)
+        if compressed is not None and len(compressed) < len(content):
+            with open(path + suffix, 'wb') as handle:
+                handle.write(compressed)
+            encodings.append(encoding)
+    return encodings
+
+
+def _write_atomic(path: str, content: str):
+    """Remplace le fichier d'un coup : un worker ne lit jamais un fichier à moitié écrit."""
+    temporary = f"{path}.{os.getpid()}.tmp"
+    with open(temporary, 'w') as handle:
+        handle.write(content)
+    os.replace(temporary, path)
+
+
+def build_assets(static_folder: str, static_url_path: str = '/static') -> Dict:
+    """Écrit un nouveau build dans static/dist/, à côté des précédents ; retourne le manifeste."""
+    dist = os.path.join(static_folder, DIST_DIR)
+
+    assets = {}
+    precache = []
+    for relative in _source_files(static_folder):
+        source = os.path.join(static_folder, relative)
+        target = _fingerprinted_name(relative, _digest(source))
+        target_path = os.path.join(static_folder, target)
+        os.makedirs(os.path.dirname(target_path), exist_ok=True)
+        shutil.copyfile(source, target_path)
+
+        encodings = []
+        if os.path.splitext(relative)[1].lower() in COMPRESSIBLE_EXTENSIONS:
+            encodings = _compress(target_path)
+        assets[relative] = {'path': target, 'encodings': encodings}
+        if os.path.getsize(source) <= PRECACHE_MAX_BYTES:
+            precache.append(f"{static_url_path}/{target}")
+
+    version = hashlib.sha256(json.dumps(assets, sort_keys=True).encode()).hexdigest()[:12]
+    manifest = {'version': version, 'assets': assets}
+    content = json.dumps(manifest, indent=2, sort_keys=True)
+    os.makedirs(os.path.join(dist, BUILDS_DIR), exist_ok=True)
+    _write_atomic(os.path.join(dist, BUILDS_DIR, f"{version}.json"), content)
+    _write_atomic(os.path.join(dist, PRECACHE_NAME),
+                  "// Généré par `flask assets-build` : ne pas modifier\n"
+                  f"self.TBIB_PRECACHE = {json.dumps({'version': version, 'urls': precache}, indent=2)};\n")
+    _write_atomic(os.path.join(dist, MANIFEST_NAME), content)
+    return manifest
+
+
+def prune_assets(static_folder: str, keep: int = KEEP_BUILDS) -> List[str]:
+    """
+    Supprime les fichiers de static/dist/ qu'aucun des `keep` derniers builds
+    ne référence (le build courant est toujours gardé).
+
+    Returns:
+        Les chemins supprimés, relatifs à static/
+    """
+    dist = os.path.join(static_folder, DIST_DIR)
+    builds_dir = os.path.join(dist, BUILDS_DIR)
+    try:
+        builds = sorted((os.path.join(builds_dir, name) for name in os.listdir(builds_dir)),
+                        key=os.path.getmtime, reverse=True)
+    except OSError:
+        return []
+
+    kept = [os.path.join(dist, MANIFEST_NAME)] + builds[:max(keep, 1)]
+    referenced = set(BUILD_FILES)
+    for path in kept:
+        try:
+            with open(path) as handle:
+                entries = json.load(handle).get('assets', {}).values()
+        except (OSError, ValueError):
+            continue
+        for entry in entries:
+            referenced.add(entry['path'])
+            referenced.update(entry['path'] + suffix for _, suffix in ENCODINGS)
+
+    removed = []
+    for path in builds[max(keep, 1):]:
+        os.remove(path)
+        removed.append(os.path.relpath(path, static_folder).replace(os.sep, '/'))
+    for root, dirs, names in os.walk(dist):
+        dirs[:] = [d for d in dirs if os.path.join(root, d) != builds_dir]
+        for name in names:
+            relative = os.path.relpath(os.path.join(root, name), static_folder).replace(os.sep, '/')
+            if relative not in referenced:
+                os.remove(os.path.join(root, name))
+                removed.append(relative)
+    return removed
+
+
+# ========================================
+# EXÉCUTION
+# ========================================
+
+class AssetManifest:
+    """Manifeste chargé au démarrage : URLs empreintées et variantes compressées."""
+
+    def __init__(self):
+        self.static_folder: Optional[str] = None
+        self.version: Optional[str] = None
+        self.assets: Dict[str, Dict] = {}
+        self._encodings: Dict[str, List[str]] = {}
+
+    def load(self, static_folder: str):
+        self.static_folder = static_folder
+        try:
+            with open(os.path.join(static_folder, DIST_DIR, MANIFEST_NAME)) as handle:
+                manifest = json.load(handle)
+        except (OSError, ValueError):
+            manifest = {}
+        self.version = manifest.get('version')
+        self.assets = manifest.get('assets', {})
+        self._encodings = {entry['path']: entry['encodings'] for entry in self.assets.values()}
+
+    def url(self, filename: str) -> str:
+        entry = self.assets.get(filename)
+        return url_for('static', filename=entry['path'] if entry else filename)
+
+    def send_static(self, filename: str):
+        """Vue 'static' : variante précompressée acceptée par le client, sinon le fichier."""
+        available = self._encodings.get(filename, ())
+        accepted = request.accept_encodings
+        for encoding, suffix in ENCODINGS:
+            if encoding in available and accepted[encoding]:
+                response = send_from_directory(self.static_folder, filename + suffix,
+                                               mimetype=mimetypes.guess_type(filename)[0])
+                response.headers['Content-Encoding'] = encoding
+                response.vary.add('Accept-Encoding')
+                return response
+
+        response = send_from_directory(self.static_folder, filename)
+        if available:
+            response.vary.add('Accept-Encoding')
+        return response
+
+    def init_app(self, app):
+        self.load(app.static_folder)
+        app.view_functions['static'] = self.send_static
+        app.jinja_env.globals['asset_url'] = self.url
+
+        @app.cli.command('assets-build')
+        def assets_build_command():
+            """Empreinte et précompresse static/ vers static/dist/."""
+            manifest = build_assets(app.static_folder, app.static_url_path)
+            self.load(app.static_folder)
+            compressed = sum(1 for entry in manifest['assets'].values() if entry['encodings'])
+            click.echo(f"{len(manifest['assets'])} fichiers, {compressed} précompressés, "
+                       f"version {manifest['version']}" + ("" if brotli else " (brotli absent : gzip seul)"))
+
+        @app.cli.command('assets-prune')
+        @click.option('--keep', default=KEEP_BUILDS, show_default=True, help='Builds à conserver.')
+        def assets_prune_command(keep):
+            """Supprime de static/dist/ les fichiers des anciens builds."""
+            removed = prune_assets(app.static_folder, keep)
+            click.echo(f"{len(removed)} fichiers supprimés, {keep} builds conservés")
+
+
+assets = AssetManifest()
@@ -0,0 +1,427 @@
+"""
+TBIB - Moteur de disponibilités
+
+Les horaires et absences (en cours ou à venir) d'un médecin sont compilés
+une fois en un modèle hebdomadaire (WeeklyTemplate), gardé en cache dans le
+processus jusqu'à ce que les réglages d'un médecin changent (version partagée
+via le backend du bus de la file). Une fenêtre de dates ne charge plus que
+les RDV (une requête, types de consultation préchargés), puis calcule les
+créneaux libres de chaque jour par balayage linéaire des intervalles occupés.
+"""
+
+import heapq
+import threading
+import time as clock
+from bisect import bisect_right
+from datetime import datetime, date, timedelta, time
+from typing import Dict, List, Optional, Sequence, Tuple
+
+from sqlalchemy.orm import joinedload
+
+from models import Appointment, DoctorAvailability, DoctorAbsence
+from utils.queue_events import queue_events
+
+# Horaires par défaut si aucun DoctorAvailability n'est défini pour le jour
+DEFAULT_WORK_START = time(9, 0)
+DEFAULT_WORK_END = time(17, 0)
+
+# Durée par défaut d'un RDV sans type de consultation (minutes)
+DEFAULT_DURATION = 30
+
+# Statuts qui occupent réellement un créneau
+BLOCKING_STATUSES = ('confirmed', 'waiting')
+
+# Médecins examinés au plus par une recherche de créneaux (route publique)
+SEARCH_MAX_DOCTORS = 200
+
+# Filet de sécurité : un modèle est recompilé au plus tard après N secondes
+TEMPLATE_MAX_AGE_SECONDS = 300
+
+# Version des réglages, tenue par le backend du bus de la file (Redis si
+# QUEUE_CACHE_URL) : une modification sur un worker invalide les modèles de tous
+TEMPLATES_VERSION_KEY = (0, date.min)
+
+Interval = Tuple[datetime, datetime]
+
+
+def merge_intervals(intervals: Sequence[Interval]) -> List[Interval]:
+    """
+    Fusionne des intervalles [début, fin) triés par début (sweep line).
+
+    Deux intervalles qui se chevauchent ou se touchent n'en forment plus qu'un,
+    ce qui donne une liste disjointe et triée exploitable par deux pointeurs.
+    """
+    merged: List[Interval] = []
+    for start, end in intervals:
+        if merged and start <= merged[-1][1]:
+            if end > merged[-1][1]:
+                merged[-1] = (merged[-1][0], end)
+        else:
+            merged.append((start, end))
+    return merged
+
+
+def free_starts(
+    work_start: datetime,
+    work_end: datetime,
+    busy: Sequence[Interval],
+    duration: int,
+    step: int = 15,
+    not_before: Optional[datetime] = None
+) -> List[datetime]:
+    """
+    Retourne les débuts de créneaux libres d'une journée en temps linéaire.
+
+    Args:
+        work_start / work_end: Bornes de la journée de travail
+        busy: Intervalles occupés, fusionnés (voir merge_intervals)
+        duration: Durée du créneau recherché (minutes)
+        step: Pas entre deux créneaux candidats (minutes)
+        not_before: Ignore les candidats <= à cet instant (créneaux passés)
+    """
+    span = timedelta(minutes=duration)
+    stride = timedelta(minutes=step)
+    slots = []
+    i = 0
+    current = work_start
+
+    while current + span <= work_end:
+        if not_before is not None and current <= not_before:
+            current += stride
+            continue
+
+        # Avancer jusqu'au premier intervalle occupé qui finit après le candidat
+        while i < len(busy) and busy[i][1] <= current:
+            i += 1
+
+        if i == len(busy) or busy[i][0] >= current + span:
+            slots.append(current)
+
+        current += stride
+
+    return slots
+
+
+class WeeklyTemplate:
+    """
+    Horaires compilés d'un médecin : sept listes de plages de travail
+    (lundi = 0) et un calendrier d'exceptions (absences découpées par jour).
+
+    Deux requêtes à la construction, aucune ensuite. Un jour sans plage
+    définie garde les horaires par défaut (9h-17h).
+    """
+
+    def __init__(
+        self,
+        doctor_id: int,
+        days: List[List[Tuple[time, time]]],
+        absences: Sequence[Interval] = ()
+    ):
+        self.doctor_id = doctor_id
+        self.days = days
+        self.built_at = clock.time()
+        self.version = 0
+
+        self._exceptions: Dict[date, List[Interval]] = {}
+        for abs_start, abs_end in absences:
+            day = abs_start.date()
+            while datetime.combine(day, time(0, 0)) < abs_end:
+                day_start = datetime.combine(day, time(0, 0))
+                day_end = day_start + timedelta(days=1)
+                self._exceptions.setdefault(day, []).append(
+                    (max(abs_start, day_start), min(abs_end, day_end))
+                )
+                day += timedelta(days=1)
+        for day, intervals in self._exceptions.items():
+            self._exceptions[day] = merge_intervals(sorted(intervals))
+
+    @classmethod
+    def load(cls, doctor_id: int) -> 'WeeklyTemplate':
+        return cls.load_many([doctor_id])[doctor_id]
+
+    @classmethod
+    def load_many(cls, doctor_ids: Sequence[int]) -> Dict[int, 'WeeklyTemplate']:
+        """Compile les modèles de plusieurs médecins : deux requêtes pour tout le lot."""
+        doctor_ids = list(doctor_ids)
+        days: Dict[int, List[List[Tuple[time, time]]]] = {
+            doctor_id: [[] for _ in range(7)] for doctor_id in doctor_ids
+        }
+        absences: Dict[int, List[Interval]] = {doctor_id: [] for doctor_id in doctor_ids}
+        if not doctor_ids:
+            return {}
+
+        rows = DoctorAvailability.query.filter(
+            DoctorAvailability.doctor_id.in_(doctor_ids),
+            DoctorAvailability.is_available == True
+        ).order_by(DoctorAvailability.id).all()
+        for row in rows:
+            if row.start_time and row.end_time and row.start_time < row.end_time:
+                days[row.doctor_id][row.day_of_week].append((row.start_time, row.end_time))
+
+        # Les absences terminées ne bloquent plus aucun créneau
+        rows = DoctorAbsence.query.filter(
+            DoctorAbsence.doctor_id.in_(doctor_ids),
+            DoctorAbsence.end_date >= datetime.combine(date.today(), time(0, 0))
+        ).order_by(DoctorAbsence.start_date).all()
+        for row in rows:
+            absences[row.doctor_id].append((row.start_date, row.end_date))
+
+        templates = {}
+        for doctor_id in doctor_ids:
+            for hours in days[doctor_id]:
+                hours.sort()
+            templates[doctor_id] = cls(doctor_id, days[doctor_id], absences[doctor_id])
+        return templates
+
+    def work_intervals(self, day: date) -> List[Interval]:
+        """Plages de travail du jour, fusionnées et triées (fallback 9h-17h)."""
+        hours = self.days[day.weekday()] or [(DEFAULT_WORK_START, DEFAULT_WORK_END)]
+        return merge_intervals([
+            (datetime.combine(day, start), datetime.combine(day, end)) for start, end in hours
+        ])
+
+    def working_hours(self, day: date) -> Interval:
+        """Bornes de la journée : début de la première plage, fin de la dernière."""
+        intervals = self.work_intervals(day)
+        return intervals[0][0], intervals[-1][1]
+
+    def absences_on(self, day: date) -> List[Interval]:
+        """Absences du jour (calendrier d'exceptions), rognées aux bornes du jour."""
+        return self._exceptions.get(day, [])
+
+    def blocked_on(self, day: date) -> List[Interval]:
+        """Absences et pauses entre deux plages de travail, triées et fusionnées."""
+        intervals = self.work_intervals(day)
+        breaks = [(intervals[i][1], intervals[i + 1][0]) for i in range(len(intervals) - 1)]
+        return merge_intervals(sorted(breaks + self.absences_on(day)))
+
+
+_templates: Dict[int, WeeklyTemplate] = {}
+_templates_lock = threading.Lock()
+
+
+def _is_current(template: Optional[WeeklyTemplate], version: int, now: float) -> bool:
+    return (template is not None and template.version == version
+            and now - template.built_at < TEMPLATE_MAX_AGE_SECONDS)
+
+
+def get_weekly_template(doctor_id: int) -> WeeklyTemplate:
+    """Modèle hebdomadaire du médecin, recompilé après invalidation ou TEMPLATE_MAX_AGE_SECONDS."""
+    return get_weekly_templates([doctor_id])[doctor_id]
+
+
+def get_weekly_templates(doctor_ids: Sequence[int]) -> Dict[int, WeeklyTemplate]:
+    """Modèles de plusieurs médecins ; ceux absents du cache sont compilés d'un bloc."""
+    # Lue avant le chargement : une invalidation pendant celui-ci force une relecture
+    version = queue_events.backend.version(TEMPLATES_VERSION_KEY)
+    now = clock.time()
+    templates = {}
+    missing = []
+    for doctor_id in doctor_ids:
+        template = _templates.get(doctor_id)
+        if _is_current(template, version, now):
+            templates[doctor_id] = template
+        else:
+            missing.append(doctor_id)
+
+    if missing:
+        loaded = WeeklyTemplate.load_many(missing)
+        for template in loaded.values():
+            template.version = version
+        with _templates_lock:
+            _templates.update(loaded)
+        templates.update(loaded)
+    return templates
+
+
+def load_booked(
+    doctor_ids: Sequence[int],
+    start_date: date,
+    end_date: date,
+    statuses: Sequence[str] = BLOCKING_STATUSES,
+    exclude_appointment_id: Optional[int] = None
+) -> Dict[int, Dict[date, List[Tuple[datetime, datetime, int]]]]:
+    """
+    RDV bloquants de plusieurs médecins sur [start_date, end_date], en une requête.
+
+    Returns:
+        {doctor_id: {jour: [(début, fin, appointment_id), ...] triés par début}}
+    """
+    booked: Dict[int, Dict[date, List[Tuple[datetime, datetime, int]]]] = {
+        doctor_id: {} for doctor_id in doctor_ids
+    }
+    if not booked:
+        return booked
+
+    query = Appointment.query.options(
+        joinedload(Appointment.consultation_type)
+    ).filter(
+        Appointment.doctor_id.in_(list(booked)),
+        Appointment.appointment_date >= start_date,
+        Appointment.appointment_date <= end_date,
+        Appointment.status.in_(list(statuses)),
+        Appointment.appointment_time.isnot(None)
+    )
+
+    if exclude_appointment_id:
+        query = query.filter(Appointment.id != exclude_appointment_id)
+
+    appointments = query.order_by(
+        Appointment.appointment_date,
+        Appointment.appointment_time
+    ).all()
+
+    for appt in appointments:
+        start = datetime.combine(appt.appointment_date, appt.appointment_time)
+        duration = appt.consultation_type.duration if appt.consultation_type else DEFAULT_DURATION
+        booked[appt.doctor_id].setdefault(appt.appointment_date, []).append(
+            (start, start + timedelta(minutes=duration), appt.id)
+        )
+    return booked
+
+
+def invalidate_weekly_template(doctor_id: Optional[int] = None):
+    """À appeler après un commit sur DoctorAvailability / DoctorAbsence (None = tous)."""
+    with _templates_lock:
+        if doctor_id is None:
+            _templates.clear()
+        else:
+            _templates.pop(doctor_id, None)
+    # Les autres workers recompilent leurs modèles au prochain accès
+    queue_events.backend.bump(TEMPLATES_VERSION_KEY)
+
+
+class AvailabilityWindow:
+    """
+    Instantané du planning d'un médecin sur [start_date, end_date].
+
+    Une requête au total, quelle que soit la taille de la fenêtre (RDV
+    bloquants) : horaires et absences viennent du WeeklyTemplate en cache.
+    `template` et `booked` sont fournis déjà chargés par for_doctors.
+    """
+
+    def __init__(
+        self,
+        doctor_id: int,
+        start_date: date,
+        end_date: date,
+        statuses: Sequence[str] = BLOCKING_STATUSES,
+        exclude_appointment_id: Optional[int] = None,
+        template: Optional[WeeklyTemplate] = None,
+        booked: Optional[Dict[date, List[Tuple[datetime, datetime, int]]]] = None
+    ):
+        self.doctor_id = doctor_id
+        self.start_date = start_date
+        self.end_date = end_date
+
+        self._template = template or get_weekly_template(doctor_id)
+        if booked is None:
+            booked = load_booked([doctor_id], start_date, end_date, statuses, exclude_appointment_id)[doctor_id]
+        self._booked = booked
+        self._busy_cache: Dict[date, List[Interval]] = {}
+
+    @classmethod
+    def for_doctors(
+        cls,
+        doctor_ids: Sequence[int],
+        start_date: date,
+        end_date: date,
+        statuses: Sequence[str] = BLOCKING_STATUSES
+    ) -> Dict[int, 'AvailabilityWindow']:
+        """Fenêtres de plusieurs médecins : une requête par table pour tout le lot."""
+        templates = get_weekly_templates(doctor_ids)
+        booked = load_booked(doctor_ids, start_date, end_date, statuses)
+        return {
+            doctor_id: cls(doctor_id, start_date, end_date, statuses,
+                           template=templates[doctor_id], booked=booked[doctor_id])
+            for doctor_id in doctor_ids
+        }
+
+    # ========================================
+    # REQUÊTES EN MÉMOIRE
+    # ========================================
+
+    def working_hours(self, day: date) -> Interval:
+        """Bornes de la journée de travail (fallback 9h-17h)."""
+        return self._template.working_hours(day)
+
+    def appointments_on(self, day: date) -> List[Tuple[datetime, datetime, int]]:
+        """RDV bloquants du jour : (début, fin, appointment_id), triés par début."""
+        return self._booked.get(day, [])
+
+    def absences_on(self, day: date) -> List[Interval]:
+        """Absences du médecin rognées aux bornes du jour."""
+        return self._template.absences_on(day)
+
+    def blocked_on(self, day: date) -> List[Interval]:
+        """Absences et pauses entre les plages de travail du jour."""
+        return self._template.blocked_on(day)
+
+    def busy_intervals(self, day: date) -> List[Interval]:
+        """RDV et absences du jour, fusionnés en intervalles disjoints triés."""
+        if day in self._busy_cache:
+            return self._busy_cache[day]
+
+        intervals = [(start, end) for start, end, _ in self.appointments_on(day)]
+        intervals.extend(self.blocked_on(day))
+
+        # Les RDV arrivent déjà triés : timsort reste linéaire sur ce cas
+        merged = merge_intervals(sorted(intervals))
+        self._busy_cache[day] = merged
+        return merged
+
+    def free_slots(
+        self,
+        day: date,
+        duration: int = DEFAULT_DURATION,
+        step: int = 15,
+        not_before: Optional[datetime] = None
+    ) -> List[datetime]:
+        """Débuts de créneaux libres pour un jour de la fenêtre."""
+        work_start, work_end = self.working_hours(day)
+        return free_starts(work_start, work_end, self.busy_intervals(day), duration, step, not_before)
+
+    def is_free(self, start_dt: datetime, duration_minutes: int) -> bool:
+        """Vérifie qu'un créneau tient dans les horaires et ne chevauche rien."""
+        end_dt = start_dt + timedelta(minutes=duration_minutes)
+        work_start, work_end = self.working_hours(start_dt.date())
+
+        if start_dt < work_start or end_dt > work_end:
+            return False
+
+        busy = self.busy_intervals(start_dt.date())
+        ends = [interval_end for _, interval_end in busy]
+        i = bisect_right(ends, start_dt)
+        return i == len(busy) or busy[i][0] >= end_dt
+
+
+def first_free_slots(
+    windows: Dict[int, AvailabilityWindow],
+    start_date: date,
+    days: int,
+    limit: int,
+    duration: int = DEFAULT_DURATION,
+    step: int = 15,
+    not_before: Optional[datetime] = None
+) -> List[Tuple[datetime, int]]:
+    """
+    Premiers créneaux libres tous médecins confondus, par ordre chronologique.
+
+    Les jours sont parcourus dans l'ordre et la recherche s'arrête dès que
+    `limit` créneaux sont trouvés.
+
+    Returns:
+        [(début, doctor_id), ...] trié par début puis par médecin
+    """
+    found: List[Tuple[datetime, int]] = []
+    for i in range(days):
+        day = start_date + timedelta(days=i)
+        per_doctor = [
+            [(slot, doctor_id) for slot in window.free_slots(day, duration, step, not_before)]
+            for doctor_id, window in windows.items()
+        ]
+        for slot in heapq.merge(*per_doctor):
+            found.append(slot)
+            if len(found) >= limit:
+                return found
+    return found
@@ -0,0 +1,223 @@
+"""
+TBIB - Calendrier journalier en mémoire
+
+Représente l'occupation d'un médecin pour un jour donné sous forme de
+tableaux d'intervalles triés. Construit une seule fois depuis la base (via
+AvailabilityWindow), il répond ensuite sans aucune requête :
+- chevauchement d'un créneau : O(log n) par bissection
+- prochain trou de durée d à partir de t : O(log n) via un arbre de maxima
+
+Utilisé par le Smart Shift pour déplacer toute une journée de RDV en mémoire
+puis écrire le résultat en une seule fois.
+"""
+
+from bisect import bisect_right
+from datetime import datetime, date, timedelta
+from typing import Dict, List, Optional, Tuple
+
+from utils.availability import AvailabilityWindow, merge_intervals, Interval
+
+
+class _MaxTree:
+    """Arbre de segments (maximum) : premier indice >= lo dont la valeur >= seuil."""
+
+    def __init__(self, values: List[float]):
+        self.n = len(values)
+        size = 1
+        while size < max(self.n, 1):
+            size *= 2
+        self.size = size
+        self.tree = [-1.0] * (2 * size)
+        for i, value in enumerate(values):
+            self.tree[size + i] = value
+        for node in range(size - 1, 0, -1):
+            self.tree[node] = max(self.tree[2 * node], self.tree[2 * node + 1])
+
+    def first_at_least(self, lo: int, threshold: float) -> int:
+        if lo >= self.n:
+            return -1
+        return self._search(1, 0, self.size - 1, lo, threshold)
+
+    def _search(self, node: int, node_lo: int, node_hi: int, lo: int, threshold: float) -> int:
+        if node_hi < lo or self.tree[node] < threshold:
+            return -1
+        if node_lo == node_hi:
+            return node_lo
+        mid = (node_lo + node_hi) // 2
+        found = self._search(2 * node, node_lo, mid, lo, threshold)
+        if found != -1:
+            return found
+        return self._search(2 * node + 1, mid + 1, node_hi, lo, threshold)
+
+
+class DayCalendar:
+    """
+    Occupation d'un médecin (doctor_id, day).
+
+    Les RDV sont indexés par appointment_id pour pouvoir être déplacés ; les
+    absences sont des blocs fixes. Les tableaux triés (occupations fusionnées,
+    trous libres, arbre des longueurs de trous) sont reconstruits paresseusement
+    après une modification.
+    """
+
+    def __init__(
+        self,
+        doctor_id: int,
+        day: date,
+        work_start: datetime,
+        work_end: datetime,
+        appointments: Optional[List[Tuple[datetime, datetime, int]]] = None,
+        blocked: Optional[List[Interval]] = None
+    ):
+        self.doctor_id = doctor_id
+        self.day = day
+        self.work_start = work_start
+        self.work_end = work_end
+
+        self._appointments: Dict[int, Interval] = {
+            appt_id: (start, end) for start, end, appt_id in (appointments or [])
+        }
+        self._blocked = list(blocked or [])
+        self._dirty = True
+
+    @classmethod
+    def from_window(cls, window: AvailabilityWindow, day: date) -> 'DayCalendar':
+        work_start, work_end = window.working_hours(day)
+        return cls(
+            window.doctor_id,
+            day,
+            work_start,
+            work_end,
+            appointments=window.appointments_on(day),
+            blocked=window.blocked_on(day)
+        )
+
+    # ========================================
+    # MODIFICATIONS
+    # ========================================
+
+    def add(self, appointment_id: int, start: datetime, duration_minutes: int):
+        self._appointments[appointment_id] = (start, start + timedelta(minutes=duration_minutes))
+        self._dirty = True
+
+    def remove(self, appointment_id: int) -> Optional[Interval]:
+        interval = self._appointments.pop(appointment_id, None)
+        if interval is not None:
+            self._dirty = True
+        return interval
+
+    # ========================================
+    # INDEX TRIÉS
+    # ========================================
+
+    def _rebuild(self):
+        busy = merge_intervals(sorted(list(self._appointments.values()) + self._blocked))
+        self._busy_starts = [start for start, _ in busy]
+        self._busy_ends = [end for _, end in busy]
+
+        # Trous libres à l'intérieur des horaires de travail
+        gaps = []
+        cursor = self.work_start
+        for start, end in busy:
+            if end <= cursor:
+                continue
+            if start >= self.work_end:
+                break
+            if start > cursor:
+                gaps.append((cursor, start))
+            cursor = max(cursor, end)
+        if cursor < self.work_end:
+            gaps.append((cursor, self.work_end))
+
+        self._gap_starts = [start for start, _ in gaps]
+        self._gap_ends = [end for _, end in gaps]
+        self._gap_tree = _MaxTree([(end - start).total_seconds() for start, end in gaps])
+        self._dirty = False
+
+    # ========================================
+    # REQUÊTES
+    # ========================================
+
+    def overlaps(self, start: datetime, end: datetime) -> bool:
+        """True si [start, end) chevauche un RDV ou une absence."""
+        if self._dirty:
+            self._rebuild()
+        i = bisect_right(self._busy_ends, start)
+        return i < len(self._busy_starts) and self._busy_starts[i] < end
+
+    def is_free(self, start: datetime, duration_minutes: int) -> bool:
+        """Créneau dans les horaires et sans chevauchement."""
+        end = start + timedelta(minutes=duration_minutes)
+        if start < self.work_start or end > self.work_end:
+            return False
+        return not self.overlaps(start, end)
+
+    def next_gap(self, at_or_after: datetime, duration_minutes: int) -> Optional[datetime]:
+        """
+        Premier début de créneau libre de `duration_minutes` à partir de `at_or_after`.
+
+        Returns:
+            datetime de début, ou None si la journée ne contient pas de trou assez long
+        """
+        if self._dirty:
+            self._rebuild()
+
+        needed = timedelta(minutes=duration_minutes)
+        t = max(at_or_after, self.work_start)
+
+        # Premier trou qui se termine après t
+        i = bisect_right(self._gap_ends, t)
+        if i >= len(self._gap_starts):
+            return None
+
+        if self._gap_starts[i] <= t:
+            # t tombe dans ce trou : il reste gap_end - t
+            if self._gap_ends[i] - t >= needed:
+                return t
+            i += 1
+
+        j = self._gap_tree.first_at_least(i, needed.total_seconds())
+        if j == -1:
+            return None
+        return self._gap_starts[j]
+
+
+class CalendarBook:
+    """
+    Ensemble de DayCalendar d'un médecin, chargés d'un bloc sur une fenêtre.
+
+    Un jour hors de la fenêtre initiale déclenche le chargement d'une
+    fenêtre supplémentaire d'un jour.
+    """
+
+    def __init__(
+        self,
+        doctor_id: int,
+        start_date: date,
+        end_date: date,
+        exclude_appointment_id: Optional[int] = None
+    ):
+        self.doctor_id = doctor_id
+        self.exclude_appointment_id = exclude_appointment_id
+        self._window = AvailabilityWindow(
+            doctor_id, start_date, end_date,
+            exclude_appointment_id=exclude_appointment_id
+        )
+        self._days: Dict[date, DayCalendar] = {}
+
+    def day(self, day: date) -> DayCalendar:
+        if day not in self._days:
+            window = self._window
+            if not (window.start_date <= day <= window.end_date):
+                window = AvailabilityWindow(
+                    self.doctor_id, day, day,
+                    exclude_appointment_id=self.exclude_appointment_id
+                )
+            self._days[day] = DayCalendar.from_window(window, day)
+        return self._days[day]
+
+    def remove(self, appointment_id: int, day: date):
+        self.day(day).remove(appointment_id)
+
+    def add(self, appointment_id: int, start: datetime, duration_minutes: int):
+        self.day(start.date()).add(appointment_id, start, duration_minutes)
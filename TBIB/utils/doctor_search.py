@@ -0,0 +1,305 @@
+"""
+TBIB - Recherche de médecins
+
+Chaque médecin a une ligne dans doctor_search_index : nom, spécialité, ville,
+expertises et langues, normalisés une fois à l'écriture (minuscules, sans
+accents, arabe translittéré, variantes connues ramenées à une forme unique).
+La requête de l'utilisateur passe par la même normalisation, ce qui rend
+"Pédiatre", "pediatrie" et "طبيب أطفال" équivalents.
+
+- SQLite : table FTS5 (tokenizer trigram), classement bm25
+- PostgreSQL : index GIN pg_trgm, classement word_similarity
+- Autres bases : LIKE sur la table d'index, tri par nom
+
+L'index est tenu à jour par des événements SQLAlchemy sur DoctorProfile et
+User (création, modification du profil dans doctor_settings_profile, etc.).
+`flask search-reindex` le reconstruit entièrement.
+"""
+
+import re
+import unicodedata
+from decimal import Decimal
+from typing import Dict, List, Optional, Tuple
+
+import click
+from sqlalchemy import Numeric, and_, cast, delete, event, func, inspect, insert, or_, select, text
+from sqlalchemy.orm import joinedload
+
+from extensions import db
+from models import DoctorProfile, DoctorSearchIndex, User
+from utils.pagination import decode_cursor, split_page
+
+# Nombre de résultats par page par défaut / maximum
+DEFAULT_PER_PAGE = 20
+MAX_PER_PAGE = 50
+
+# Poids bm25 des colonnes FTS5 : name, specialty, city, document
+FTS_WEIGHTS = (4.0, 8.0, 8.0, 1.0)
+
+# Colonnes du profil qui alimentent l'index
+INDEXED_PROFILE_FIELDS = ('specialty', 'city', 'expertises', 'languages')
+
+# ========================================
+# NORMALISATION
+# ========================================
+
+_ARABIC_TO_LATIN = str.maketrans({
+    'ا': 'a', 'ب': 'b', 'ت': 't', 'ث': 't', 'ج': 'dj', 'ح': 'h', 'خ': 'kh',
+    'د': 'd', 'ذ': 'd', 'ر': 'r', 'ز': 'z', 'س': 's', 'ش': 'ch', 'ص': 's',
+    'ض': 'd', 'ط': 't', 'ظ': 'z', 'ع': '', 'غ': 'gh', 'ف': 'f', 'ق': 'k',
+    'ك': 'k', 'ل': 'l', 'م': 'm', 'ن': 'n', 'ه': 'h', 'ة': 'a', 'و': 'ou',
+    'ي': 'i', 'ى': 'a', 'ء': '', 'ـ': '',
+})
+
+# Simplifications phonétiques appliquées aux deux côtés (index et requête)
+_PHONETIC = [
+    (re.compile(r'([a-z])\1+'), r'\1'),
+    (re.compile(r'ph'), 'f'),
+    (re.compile(r'dj'), 'j'),
+    (re.compile(r'ou'), 'u'),
+    (re.compile(r'[qc](?=[aou])|q'), 'k'),
+    (re.compile(r'y'), 'i'),
+    (re.compile(r'logie\b'), 'logue'),
+]
+
+# Variantes (arabe, anglais, noms de la spécialité) -> forme canonique ;
+# une forme canonique vide supprime le mot ("طبيب", "dr")
+ALIASES: Dict[str, List[str]] = {
+    '': ['طبيب', 'طبيبة', 'طب', 'dr', 'docteur', 'doctor', 'tbib'],
+    'alger': ['الجزائر', 'الجزائر العاصمة', 'algiers', 'dzair', 'el djazair'],
+    'oran': ['وهران', 'wahran', 'ouahran'],
+    'constantine': ['قسنطينة', 'qacentina', 'ksentina'],
+    'annaba': ['عنابة'],
+    'setif': ['سطيف', 'stif'],
+    'bejaia': ['بجاية', 'bgayet', 'bougie'],
+    'tlemcen': ['تلمسان', 'tilimsan'],
+    'blida': ['البليدة'],
+    'tizi ouzou': ['تيزي وزو'],
+    'batna': ['باتنة'],
+    'generaliste': ['عام', 'عامة', 'general', 'generalist'],
+    'dentiste': ['أسنان', 'الأسنان', 'dentaire', 'dentist'],
+    'cardiologue': ['قلب', 'القلب', 'cardiologist'],
+    'pediatre': ['أطفال', 'الأطفال', 'pediatrie', 'pediatrician'],
+    'dermatologue': ['جلد', 'الجلد', 'جلدية', 'dermatologist'],
+    'gynecologue': ['نساء', 'النساء', 'توليد', 'gynecologist'],
+    'ophtalmologue': ['عيون', 'العيون', 'ophthalmologist'],
+    'psychologue': ['نفس', 'النفس', 'نفساني', 'psychologist'],
+}
+
+
+def _fold(value: Optional[str]) -> str:
+    """Minuscules, sans accents ni signes, arabe translittéré, phonétique simplifiée."""
+    value = unicodedata.normalize('NFKD', value or '')
+    value = ''.join(ch for ch in value if not unicodedata.combining(ch))
+    value = value.lower().translate(_ARABIC_TO_LATIN)
+    value = re.sub(r'[^a-z0-9]+', ' ', value)
+    for pattern, replacement in _PHONETIC:
+        value = pattern.sub(replacement, value)
+    return ' '.join(value.split())
+
+
+def _build_alias_pattern():
+    table = {}
+    for canonical, variants in ALIASES.items():
+        for variant in variants:
+            table[_fold(variant)] = _fold(canonical)
+    # Variantes les plus longues d'abord ("الجزائر العاصمة" avant "الجزائر")
+    keys = sorted((key for key in table if key), key=len, reverse=True)
+    return re.compile(r'\b(' + '|'.join(re.escape(key) for key in keys) + r')\b'), table
+
+
+_ALIAS_PATTERN, _ALIAS_TABLE = _build_alias_pattern()
+
+
+def normalize(value: Optional[str]) -> str:
+    """Forme normalisée utilisée pour l'index comme pour les requêtes."""
+    folded = _ALIAS_PATTERN.sub(lambda match: _ALIAS_TABLE[match.group(1)], _fold(value))
+    return ' '.join(folded.split())
+
+
+def build_row(doctor_id: int, name: Optional[str], specialty: Optional[str], city: Optional[str],
+              expertises: Optional[str], languages: Optional[str]) -> Dict:
+    """Ligne de doctor_search_index pour un médecin."""
+    return {
+        'doctor_id': doctor_id,
+        'name': normalize(name),
+        'specialty': normalize(specialty),
+        'city': normalize(city),
+        'document': normalize(' '.join(filter(None, [expertises, languages]))),
+    }
+
+
+# ========================================
+# SYNCHRONISATION
+# ========================================
+
+def _write_row(connection, row: Dict):
+    table = DoctorSearchIndex.__table__
+    connection.execute(delete(table).where(table.c.doctor_id == row['doctor_id']))
+    connection.execute(insert(table).values(**row))
+
+
+def _index_profile(connection, profile: DoctorProfile):
+    name = connection.execute(select(User.name).where(User.id == profile.user_id)).scalar()
+    _write_row(connection, build_row(profile.id, name, profile.specialty, profile.city,
+                                     profile.expertises, profile.languages))
+
+
+@event.listens_for(DoctorProfile, 'after_insert')
+def _profile_inserted(mapper, connection, profile):
+    _index_profile(connection, profile)
+
+
+@event.listens_for(DoctorProfile, 'after_update')
+def _profile_updated(mapper, connection, profile):
+    # waiting_room_count change à chaque patient : ne réindexer que les champs cherchables
+    state = inspect(profile)
+    if any(state.attrs[field].history.has_changes() for field in INDEXED_PROFILE_FIELDS):
+        _index_profile(connection, profile)
+
+
+@event.listens_for(User, 'after_update')
+def _user_updated(mapper, connection, user):
+    if user.role != 'doctor' or not inspect(user).attrs.name.history.has_changes():
+        return
+    profiles = connection.execute(
+        select(DoctorProfile.__table__).where(DoctorProfile.user_id == user.id)
+    ).mappings().all()
+    for profile in profiles:
+        _write_row(connection, build_row(profile['id'], user.name, profile['specialty'], profile['city'],
+                                         profile['expertises'], profile['languages']))
+
+
+def reindex_doctors() -> int:
+    """Reconstruit tout l'index (après migration ou import en masse). Ne commit pas."""
+    rows = db.session.query(
+        DoctorProfile.id, User.name, DoctorProfile.specialty, DoctorProfile.city,
+        DoctorProfile.expertises, DoctorProfile.languages
+    ).join(User, DoctorProfile.user_id == User.id).all()
+
+    db.session.execute(delete(DoctorSearchIndex.__table__))
+    if rows:
+        db.session.execute(insert(DoctorSearchIndex.__table__), [build_row(*row) for row in rows])
+    return len(rows)
+
+
+def init_app(app):
+    @app.cli.command('search-reindex')
+    def search_reindex_command():
+        """Reconstruit l'index de recherche des médecins."""
+        count = reindex_doctors()
+        db.session.commit()
+        click.echo(f"{count} médecins indexés")
+
+
+# ========================================
+# RECHERCHE
+# ========================================
+
+def _tokens(value: Optional[str]) -> List[str]:
+    return normalize(value).split()
+
+
+def _fts_phrase(column: Optional[str], token: str) -> str:
+    phrase = '"' + token.replace('"', '""') + '"'
+    return f"{column} : {phrase}" if column else phrase
+
+
+def search_doctors(
+    q: str = '',
+    specialty: str = '',
+    city: str = '',
+    after: Optional[str] = None,
+    per_page: int = DEFAULT_PER_PAGE
+) -> Tuple[List[DoctorProfile], Optional[str]]:
+    """
+    Médecins correspondant à la recherche, les plus pertinents d'abord.
+
+    Chaque mot doit apparaître (en sous-chaîne) : ceux de `specialty` et `city`
+    dans la colonne correspondante, ceux de `q` dans n'importe quel champ.
+    Pagination par curseur sur (score, doctor_id) ; sans mot-clé, par nom.
+
+    Raises:
+        InvalidCursor: si `after` n'est pas un curseur émis par cette fonction
+
+    Returns:
+        (profils de la page avec leur User préchargé, curseur de la page suivante ou None)
+    """
+    per_page = min(max(per_page, 1), MAX_PER_PAGE)
+    position = decode_cursor(after, 2)
+    terms = [('specialty', token) for token in _tokens(specialty)]
+    terms += [('city', token) for token in _tokens(city)]
+    terms += [(None, token) for token in _tokens(q)]
+
+    dialect = db.session.get_bind().dialect.name
+    # Le tokenizer trigram de FTS5 ignore les mots de moins de 3 lettres
+    if dialect == 'sqlite' and terms and all(len(token) >= 3 for _, token in terms):
+        rows = _search_fts(terms, position, per_page + 1)
+    elif dialect == 'postgresql' and terms:
+        rows = _search_trigram(terms, position, per_page + 1)
+    else:
+        rows = _search_by_name(terms, position, per_page + 1)
+
+    rows, next_cursor = split_page(rows, per_page, key=lambda row: row)
+    doctor_ids = [doctor_id for _, doctor_id in rows]
+
+    profiles = DoctorProfile.query.options(joinedload(DoctorProfile.user)).filter(
+        DoctorProfile.id.in_(doctor_ids)
+    ).all() if doctor_ids else []
+    by_id = {profile.id: profile for profile in profiles}
+    return [by_id[doctor_id] for doctor_id in doctor_ids if doctor_id in by_id], next_cursor
+
+
+def _like_conditions(terms) -> List:
+    index = DoctorSearchIndex
+    conditions = []
+    for column, token in terms:
+        pattern = f'%{token}%'
+        if column:
+            conditions.append(getattr(index, column).like(pattern))
+        else:
+            conditions.append(or_(index.name.like(pattern), index.specialty.like(pattern),
+                                  index.city.like(pattern), index.document.like(pattern)))
+    return conditions
+
+
+def _search_fts(terms, position, limit: int) -> List[Tuple[float, int]]:
+    """SQLite : score bm25 croissant (meilleur d'abord), puis doctor_id."""
+    params = {'match': ' AND '.join(_fts_phrase(column, token) for column, token in terms), 'limit': limit}
+    after = ''
+    if position is not None:
+        after = "WHERE score > :score OR (score = :score AND doctor_id > :doctor_id)"
+        params.update(score=float(position[0]), doctor_id=int(position[1]))
+
+    weights = ', '.join(str(weight) for weight in FTS_WEIGHTS)
+    rows = db.session.execute(text(
+        f"SELECT score, doctor_id FROM ("
+        f"SELECT bm25(doctor_search_fts, {weights}) AS score, rowid AS doctor_id "
+        f"FROM doctor_search_fts WHERE doctor_search_fts MATCH :match) "
+        f"{after} ORDER BY score, doctor_id LIMIT :limit"
+    ), params).all()
+    return [(score, doctor_id) for score, doctor_id in rows]
+
+
+def _search_trigram(terms, position, limit: int) -> List[Tuple[Decimal, int]]:
+    """PostgreSQL : similarité décroissante (arrondie, pour un curseur exact), puis doctor_id."""
+    index = DoctorSearchIndex
+    query_text = ' '.join(token for _, token in terms)
+    haystack = func.concat_ws(' ', index.name, index.specialty, index.city, index.document)
+    score = func.round(cast(func.word_similarity(query_text, haystack), Numeric), 6)
+
+    query = db.session.query(score, index.doctor_id).filter(*_like_conditions(terms))
+    if position is not None:
+        last_score, last_id = Decimal(str(position[0])), int(position[1])
+        query = query.filter(or_(score < last_score, and_(score == last_score, index.doctor_id > last_id)))
+    return query.order_by(score.desc(), index.doctor_id).limit(limit).all()
+
+
+def _search_by_name(terms, position, limit: int) -> List[Tuple[str, int]]:
+    """Sans index plein texte (ou sans mot-clé) : LIKE sur l'index, tri par nom puis doctor_id."""
+    index = DoctorSearchIndex
+    query = db.session.query(index.name, index.doctor_id).filter(*_like_conditions(terms))
+    if position is not None:
+        last_name, last_id = str(position[0]), int(position[1])
+        query = query.filter(or_(index.name > last_name, and_(index.name == last_name, index.doctor_id > last_id)))
+    return query.order_by(index.name, index.doctor_id).limit(limit).all()
@@ -1,6 +1,10 @@
 from datetime import datetime, date, timedelta, time
+from sqlalchemy.orm import joinedload
 from extensions import db
-from models import Appointment, DoctorAvailability, DoctorAbsence, ConsultationType
+from models import Appointment
+from utils.availability import BLOCKING_STATUSES
+from utils.day_calendar import CalendarBook
+from utils.queue_events import queue_events, SHIFT, STATUS_CHANGE
 
 def calculate_wait_time(doctor_id):
     """
@@ -17,130 +21,55 @@ def calculate_wait_time(doctor_id):
     wait_time = waiting_count * 20
     return f"{wait_time} min"
 
-def is_slot_free(doctor_id, start_dt, duration_minutes, exclude_appointment_id=None):
+def is_slot_free(doctor_id, start_dt, duration_minutes, exclude_appointment_id=None, book=None):
     """
     Checks if a slot is free for a doctor.
     Considers:
     1. Working hours (DoctorAvailability)
     2. Absences (DoctorAbsence)
     3. Existing Appointments
-    """
-    end_dt = start_dt + timedelta(minutes=duration_minutes)
-    day_of_week = start_dt.weekday()
-    current_date = start_dt.date()
-
-    # 1. Check Working Hours
-    availability = DoctorAvailability.query.filter_by(
-        doctor_id=doctor_id,
-        day_of_week=day_of_week,
-        is_available=True
-    ).first()
-
-    if not availability:
-        # If no availability defined for this day, assume strictly 9-17 or unavailable?
-        # Based on app logic, fallback seems to be 9-17.
-        start_work = time(9, 0)
-        end_work = time(17, 0)
-    else:
-        start_work = availability.start_time
-        end_work = availability.end_time
-
-    # Check if slot fits in working hours
-    # Create comparable datetimes for the day
-    work_start_dt = datetime.combine(current_date, start_work)
-    work_end_dt = datetime.combine(current_date, end_work)
-
-    if start_dt < work_start_dt or end_dt > work_end_dt:
-        return False
-
-    # 2. Check Absences
-    # If the slot overlaps with any absence
-    absence = DoctorAbsence.query.filter(
-        DoctorAbsence.doctor_id == doctor_id,
-        DoctorAbsence.start_date < end_dt,
-        DoctorAbsence.end_date > start_dt
-    ).first()
-
-    if absence:
-        return False
-
-    # 3. Check Existing Appointments
-    # We check for overlaps.
-    # Overlap logic: (StartA < EndB) and (EndA > StartB)
-    query = Appointment.query.filter(
-        Appointment.doctor_id == doctor_id,
-        Appointment.appointment_date == current_date,
-        Appointment.status.in_(['confirmed', 'waiting'])
-    )
-
-    if exclude_appointment_id:
-        query = query.filter(Appointment.id != exclude_appointment_id)
-
-    # Fetch relevant appointments for the day
-    existing_appointments = query.all()
 
-    for appt in existing_appointments:
-        if not appt.appointment_time:
-            continue
-
-        appt_start = datetime.combine(appt.appointment_date, appt.appointment_time)
-        # Determine duration
-        appt_duration = 30
-        if appt.consultation_type:
-            appt_duration = appt.consultation_type.duration
-
-        appt_end = appt_start + timedelta(minutes=appt_duration)
-
-        if start_dt < appt_end and end_dt > appt_start:
-            return False
-
-    return True
-
-def find_next_free_slot(doctor_id, start_dt, duration_minutes, max_days=30, exclude_appointment_id=None):
+    Without a `book`, the day is loaded once through the availability engine.
+    With a CalendarBook, the check runs in memory (O(log n), no query).
     """
-    Finds the next available slot starting from start_dt.
+    if book is None:
+        book = CalendarBook(
+            doctor_id,
+            start_dt.date(),
+            start_dt.date(),
+            exclude_appointment_id=exclude_appointment_id
+        )
+    return book.day(start_dt.date()).is_free(start_dt, duration_minutes)
+
+def find_next_free_slot(doctor_id, start_dt, duration_minutes, max_days=30, exclude_appointment_id=None, book=None):
     """
-    current_search_dt = start_dt
+    Finds the next available slot starting from start_dt.
 
-    # Safety limit: check up to X days ahead
+    Runs against in-memory day calendars: one "next gap of this length"
+    query per day instead of probing every 15 minutes. The search window
+    is loaded in a single pass unless a CalendarBook is passed in.
+    """
     max_search_date = start_dt.date() + timedelta(days=max_days)
 
-    # Loop limit to prevent infinite loops (e.g., if everything is booked or bug)
-    max_iterations = 5000
-    iterations = 0
-
-    while current_search_dt.date() <= max_search_date:
-        if iterations > max_iterations:
-            raise Exception("Could not find a free slot within reasonable limits.")
-        iterations += 1
-
-        if is_slot_free(doctor_id, current_search_dt, duration_minutes, exclude_appointment_id):
-            return current_search_dt
-
-        # Increment search time
-        # We can increment by small steps (e.g. 15 mins)
-        current_search_dt += timedelta(minutes=15)
-
-        # Optimization: If we passed end of working day, jump to next day start
-        # Retrieve working hours for current day to see if we passed them
-        day_of_week = current_search_dt.weekday()
-        availability = DoctorAvailability.query.filter_by(
-            doctor_id=doctor_id,
-            day_of_week=day_of_week,
-            is_available=True
-        ).first()
-
-        if availability:
-            end_work = availability.end_time
-        else:
-            end_work = time(17, 0) # Default fallback
+    if book is None:
+        book = CalendarBook(
+            doctor_id,
+            start_dt.date(),
+            max_search_date,
+            exclude_appointment_id=exclude_appointment_id
+        )
 
-        work_end_dt = datetime.combine(current_search_dt.date(), end_work)
+    search_from = start_dt
+    current_date = start_dt.date()
 
-        if current_search_dt >= work_end_dt:
-            # Jump to next day 08:00 (since we don't know start time easily without querying again, 08:00 is safe bet to start checking)
-            next_day = current_search_dt.date() + timedelta(days=1)
-            current_search_dt = datetime.combine(next_day, time(8, 0))
+    while current_date <= max_search_date:
+        slot = book.day(current_date).next_gap(search_from, duration_minutes)
+        if slot:
+            return slot
+
+        # Nothing left today: restart from the beginning of the next working day
+        current_date += timedelta(days=1)
+        search_from = datetime.combine(current_date, time(0, 0))
 
     return None
 
@@ -151,12 +80,19 @@ def shift_appointments(doctor_id, urgency_duration):
 
     If shifting forward (delay), processes appointments in reverse chronological order to avoid cascading collisions.
     If shifting backward (earlier), processes in chronological order.
+
+    The whole search runs against a CalendarBook loaded once. Each move is
+    flushed before the next one: at commit time SQLAlchemy would emit the
+    UPDATEs in primary-key order, and a row could land on a slot its
+    neighbour has not left yet (ix_unique_scheduled_slot).
     """
     current_time = datetime.now().time()
     today = date.today()
 
     # Get future appointments for today, sorted by time
-    appointments = Appointment.query.filter(
+    appointments = Appointment.query.options(
+        joinedload(Appointment.consultation_type)
+    ).filter(
         Appointment.doctor_id == doctor_id,
         Appointment.appointment_date == today,
         Appointment.appointment_time > current_time
@@ -167,6 +103,9 @@ def shift_appointments(doctor_id, urgency_duration):
     if urgency_duration > 0:
         appointments.reverse()
 
+    book = CalendarBook(doctor_id, today, today + timedelta(days=30))
+    touched_days = {today}
+
     for appointment in appointments:
         if appointment.appointment_time:
             # Determine duration of this appointment
@@ -179,27 +118,33 @@ def shift_appointments(doctor_id, urgency_duration):
             # Calculate tentative new start time
             tentative_start = appointment_dt + timedelta(minutes=urgency_duration)
 
-            # Find actual free slot starting from tentative_start
-            # We exclude current appointment ID from collision check (it's moving)
+            # The appointment is moving: free its current slot in memory first
+            book.remove(appointment.id, appointment.appointment_date)
+
             real_start_dt = find_next_free_slot(
                 doctor_id,
                 tentative_start,
                 duration,
-                exclude_appointment_id=appointment.id
+                book=book
             )
 
             if real_start_dt:
                 appointment.appointment_date = real_start_dt.date()
                 appointment.appointment_time = real_start_dt.time()
-
-                # Flush to ensure subsequent checks see this slot as taken/freed
-                db.session.add(appointment)
+                touched_days.add(real_start_dt.date())
                 db.session.flush()
+
+                # Later appointments must see this slot as taken
+                if appointment.status in BLOCKING_STATUSES:
+                    book.add(appointment.id, real_start_dt, duration)
             else:
                 raise Exception(f"Cannot reschedule appointment {appointment.id}: No slots available.")
 
     db.session.commit()
 
+    for day in touched_days:
+        queue_events.publish(SHIFT, doctor_id, day)
+
 def get_conflicting_appointments(doctor_id, start_date, end_date):
     """
     Returns a count of appointments that conflict with a given absence range.
@@ -242,4 +187,8 @@ def cancel_appointments_in_range(doctor_id, start_date, end_date, reason):
             appt.doctor_notes = f"ANNULÉ (Absence médecin)\n{existing_notes}".strip()
 
     db.session.commit()
+
+    # One bulk event per affected day: queue states and snapshots reload
+    for day in {appt.appointment_date for appt in appointments}:
+        queue_events.publish(STATUS_CHANGE, doctor_id, day)
     return len(appointments)
@@ -0,0 +1,129 @@
+"""
+TBIB - Facettes de recherche (spécialités, villes)
+
+Listes des spécialités et villes proposées sur la page d'accueil, avec le
+nombre de médecins de chacune, calculées en une requête GROUP BY puis
+servies depuis la mémoire du processus.
+
+Invalidées après le commit d'une création, suppression ou modification de
+spécialité / ville d'un DoctorProfile ; les changements faits par un autre
+worker sont vus au plus tard après FACET_TTL_SECONDS.
+"""
+
+import threading
+import time as clock
+from typing import Dict, List, Optional
+
+from sqlalchemy import event, func, inspect
+from sqlalchemy.orm import Session, object_session
+
+from extensions import db
+from models import DoctorProfile
+
+FACET_TTL_SECONDS = 300
+
+# Colonnes du profil qui changent les facettes
+FACET_FIELDS = ('specialty', 'city')
+
+
+class Facets:
+    """Photo des facettes : valeurs triées et nombre de médecins par valeur."""
+
+    def __init__(self, specialty_counts: Dict[str, int], city_counts: Dict[str, int], doctor_count: int):
+        self.specialty_counts = specialty_counts
+        self.city_counts = city_counts
+        self.doctor_count = doctor_count
+        self.built_at = clock.time()
+
+    @property
+    def specialties(self) -> List[str]:
+        return sorted(self.specialty_counts)
+
+    @property
+    def cities(self) -> List[str]:
+        return sorted(self.city_counts)
+
+    @classmethod
+    def load(cls) -> 'Facets':
+        rows = db.session.query(
+            DoctorProfile.specialty, DoctorProfile.city, func.count(DoctorProfile.id)
+        ).group_by(DoctorProfile.specialty, DoctorProfile.city).all()
+
+        specialty_counts: Dict[str, int] = {}
+        city_counts: Dict[str, int] = {}
+        doctor_count = 0
+        for specialty, city, count in rows:
+            if specialty:
+                specialty_counts[specialty] = specialty_counts.get(specialty, 0) + count
+            if city:
+                city_counts[city] = city_counts.get(city, 0) + count
+            doctor_count += count
+        return cls(specialty_counts, city_counts, doctor_count)
+
+
+class FacetCache:
+    """Facettes en mémoire, rechargées après invalidation ou expiration du TTL."""
+
+    def __init__(self, ttl: int = FACET_TTL_SECONDS):
+        self.ttl = ttl
+        self._facets: Optional[Facets] = None
+        self._lock = threading.Lock()
+
+    def get(self) -> Facets:
+        facets = self._facets
+        if facets is not None and clock.time() - facets.built_at < self.ttl:
+            return facets
+
+        with self._lock:
+            facets = self._facets
+            if facets is None or clock.time() - facets.built_at >= self.ttl:
+                facets = self._facets = Facets.load()
+        return facets
+
+    def init_app(self, app):
+        # Nouvelle application (tests, reload) : rien à garder de la base précédente
+        self.invalidate()
+
+    def invalidate(self):
+        self._facets = None
+
+
+facet_cache = FacetCache()
+
+
+# ========================================
+# INVALIDATION (APRÈS COMMIT)
+# ========================================
+
+def _mark_dirty(profile):
+    session = object_session(profile)
+    if session is not None:
+        session.info['facets_dirty'] = True
+
+
+@event.listens_for(DoctorProfile, 'after_insert')
+def _profile_inserted(mapper, connection, profile):
+    _mark_dirty(profile)
+
+
+@event.listens_for(DoctorProfile, 'after_delete')
+def _profile_deleted(mapper, connection, profile):
+    _mark_dirty(profile)
+
+
+@event.listens_for(DoctorProfile, 'after_update')
+def _profile_updated(mapper, connection, profile):
+    state = inspect(profile)
+    if any(state.attrs[field].history.has_changes() for field in FACET_FIELDS):
+        _mark_dirty(profile)
+
+
+@event.listens_for(Session, 'after_commit')
+def _invalidate_on_commit(session):
+    if session.info.pop('facets_dirty', False):
+        facet_cache.invalidate()
+
+
+@event.listens_for(Session, 'after_rollback')
+def _discard_on_rollback(session):
+    session.info.pop('facets_dirty', None)
@@ -0,0 +1,197 @@
+"""
+TBIB - Politique de cache HTTP par route
+
+Par défaut tout reste `no-store` (données patients et médicales). Les routes
+qui peuvent être mises en cache le déclarent :
+
+    @main_bp.route('/api/doctors/<int:doctor_id>/consultation-types')
+    @public(max_age=300)
+    def get_consultation_types(doctor_id): ...
+
+Politiques :
+- 'immutable' : public, un an, jamais revalidé (URL versionnée par contenu)
+- 'public'    : public avec max-age (réponses identiques pour tous)
+- 'revalidate': private, no-cache : réutilisable après un 304 (ETag) ;
+                pages HTML dont l'en-tête affiche l'utilisateur connecté
+- 'no-store'  : rien n'est conservé (défaut)
+
+Les réponses 200 'public' et 'revalidate' reçoivent un ETag (empreinte du
+corps) et répondent 304 au client qui a déjà cette version.
+
+Ordre de résolution : en-tête Cache-Control posé par la vue elle-même, puis
+décorateur de la vue, puis politique du blueprint (`blueprint_policy`), puis
+'no-store'.
+
+Fichiers statiques : les URLs empreintées de `asset_url()` (static/dist/, voir
+utils/assets) et celles de `url_for('static', ...)`, qui reçoivent
+?v=<empreinte du contenu>, sont servies 'immutable' : l'ancienne version n'est
+plus référencée après un déploiement. sw.js et manifest.json gardent une URL fixe
+(le navigateur les recharge lui-même) et sont revalidés.
+"""
+
+import hashlib
+import os
+from typing import Dict, Optional, Tuple
+
+from flask import current_app, request
+
+from utils.assets import BUILD_FILES, DIST_DIR, UNVERSIONED_ASSETS
+
+ONE_YEAR = 365 * 24 * 3600
+DEFAULT_POLICY = ('no-store', None)
+POLICIES = ('immutable', 'public', 'revalidate', 'no-store')
+
+
+_BLUEPRINT_POLICIES: Dict[str, Tuple[str, Optional[int]]] = {}
+
+
+# ========================================
+# DÉCLARATION
+# ========================================
+
+def cache_policy(policy: str, max_age: Optional[int] = None):
+    """Décorateur : politique de cache de la vue (voir POLICIES)."""
+    if policy not in POLICIES:
+        raise ValueError(f"Politique de cache inconnue : {policy}")
+
+    def decorator(view):
+        view.cache_policy = (policy, max_age)
+        return view
+    return decorator
+
+
+def immutable(view):
+    return cache_policy('immutable', ONE_YEAR)(view)
+
+
+def public(max_age: int):
+    return cache_policy('public', max_age)
+
+
+def revalidate(view):
+    return cache_policy('revalidate')(view)
+
+
+def private_no_store(view):
+    return cache_policy('no-store')(view)
+
+
+def blueprint_policy(blueprint, policy: str, max_age: Optional[int] = None):
+    """Politique par défaut des vues d'un blueprint qui n'en déclarent pas."""
+    if policy not in POLICIES:
+        raise ValueError(f"Politique de cache inconnue : {policy}")
+    _BLUEPRINT_POLICIES[blueprint.name] = (policy, max_age)
+
+
+# ========================================
+# RÉPONSES CONDITIONNELLES
+# ========================================
+
+def conditional(response, etag: Optional[str] = None, last_modified=None):
+    """
+    ETag (empreinte du corps si absent) et Last-Modified, puis 304 si le client
+    a déjà cette version (If-None-Match / If-Modified-Since).
+    """
+    if etag is None:
+        etag = hashlib.sha256(response.get_data()).hexdigest()[:32]
+    response.set_etag(etag)
+    if last_modified is not None:
+        response.last_modified = last_modified
+    return response.make_conditional(request)
+
+
+# ========================================
+# APPLICATION
+# ========================================
+
+def apply_policy(response, policy: str, max_age: Optional[int] = None):
+    if policy == 'no-store':
+        response.headers['Cache-Control'] = 'no-cache, no-store, must-revalidate'
+        response.headers['Pragma'] = 'no-cache'
+        response.headers['Expires'] = '0'
+        return response
+
+    # Repartir de zéro : send_static_file pose déjà 'no-cache'
+    del response.headers['Cache-Control']
+    cache_control = response.cache_control
+    if policy == 'revalidate':
+        cache_control.private = True
+        cache_control.no_cache = True
+    else:
+        cache_control.public = True
+        cache_control.max_age = max_age if max_age is not None else 0
+        if policy == 'immutable':
+            cache_control.immutable = True
+    return response
+
+
+def _is_fingerprinted(filename: str) -> bool:
+    return filename.startswith(DIST_DIR + '/') and filename not in BUILD_FILES
+
+
+def _static_policy(filename: str) -> Tuple[str, Optional[int]]:
+    # Le contenu d'une URL empreintée (dist/, utils/assets) ou versionnée ne change jamais
+    if _is_fingerprinted(filename) or request.args.get('v'):
+        return 'immutable', ONE_YEAR
+    return 'revalidate', None
+
+
+def resolve_policy(response) -> Optional[Tuple[str, Optional[int]]]:
+    """Politique à appliquer, ou None si la vue a posé son propre Cache-Control."""
+    endpoint = request.endpoint
+    if endpoint == 'static':
+        return _static_policy(request.view_args.get('filename', ''))
+    if 'Cache-Control' in response.headers:
+        return None
+
+    view = current_app.view_functions.get(endpoint) if endpoint else None
+    policy = getattr(view, 'cache_policy', None)
+    if policy is None and request.blueprint:
+        policy = _BLUEPRINT_POLICIES.get(request.blueprint)
+    return policy or DEFAULT_POLICY
+
+
+# ----- Empreinte des fichiers statiques -----
+
+_asset_digests: Dict[str, Tuple[float, str]] = {}
+
+
+def asset_version(filename: str) -> Optional[str]:
+    """Empreinte courte du contenu (recalculée si le fichier change), None si absent."""
+    path = os.path.join(current_app.static_folder, filename)
+    try:
+        mtime = os.path.getmtime(path)
+    except OSError:
+        return None
+    cached = _asset_digests.get(filename)
+    if cached and cached[0] == mtime:
+        return cached[1]
+    with open(path, 'rb') as handle:
+        digest = hashlib.sha256(handle.read()).hexdigest()[:12]
+    _asset_digests[filename] = (mtime, digest)
+    return digest
+
+
+def init_app(app):
+    _asset_digests.clear()
+
+    @app.url_defaults
+    def version_static_urls(endpoint, values):
+        filename = values.get('filename')
+        if (endpoint == 'static' and filename and 'v' not in values
+                and filename not in UNVERSIONED_ASSETS and not _is_fingerprinted(filename)):
+            version = asset_version(filename)
+            if version:
+                values['v'] = version
+
+    @app.after_request
+    def add_cache_control(response):
+        policy = resolve_policy(response)
+        if policy is None:
+            return response
+        apply_policy(response, *policy)
+        if (policy[0] in ('public', 'revalidate') and response.status_code == 200
+                and request.method in ('GET', 'HEAD') and not response.direct_passthrough
+                and not response.get_etag()[0]):
+            response = conditional(response)
+        return response
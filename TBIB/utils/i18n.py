@@ -0,0 +1,114 @@
+"""
+TBIB - Libellés de l'interface (catalogues compilés)
+
+Les libellés courts de l'interface (boutons, titres, statuts) sont rangés par
+clé dans le domaine gettext 'ui', à côté du domaine 'messages' de Flask-Babel :
+
+    translations/<langue>/LC_MESSAGES/ui.po   (source, msgid = clé)
+    translations/<langue>/LC_MESSAGES/ui.mo   (compilé : flask i18n-compile)
+
+Chaque catalogue n'est chargé qu'au premier libellé demandé dans sa langue,
+puis gardé en mémoire (mapping figé). Dans les gabarits : `{{ t('login') }}` ;
+en Python : `translate('appointment_booked')`. Une clé absente retombe sur le
+français, puis sur la valeur par défaut, puis sur la clé elle-même.
+
+`flask i18n-check` liste les clés manquantes d'une langue à l'autre.
+"""
+
+import gettext
+import os
+import sys
+from functools import lru_cache
+from types import MappingProxyType
+from typing import Dict, List, Mapping, Optional
+
+import click
+from flask import has_request_context, session
+
+LANGUAGES = ('fr', 'ar', 'en')
+DEFAULT_LANGUAGE = 'fr'
+DOMAIN = 'ui'
+
+TRANSLATIONS_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'translations')
+
+
+def _catalog_path(lang: str, extension: str) -> str:
+    return os.path.join(TRANSLATIONS_DIR, lang, 'LC_MESSAGES', f"{DOMAIN}.{extension}")
+
+
+@lru_cache(maxsize=None)
+def catalog(lang: str) -> Mapping[str, str]:
+    """Libellés compilés d'une langue ({} si la langue n'a pas de catalogue)."""
+    try:
+        with open(_catalog_path(lang, 'mo'), 'rb') as handle:
+            messages = gettext.GNUTranslations(handle)._catalog
+    except OSError:
+        return MappingProxyType({})
+    # La clé vide porte l'en-tête du catalogue
+    return MappingProxyType({key: value for key, value in messages.items() if key})
+
+
+def current_language() -> str:
+    lang = session.get('lang', DEFAULT_LANGUAGE) if has_request_context() else DEFAULT_LANGUAGE
+    return lang if lang in LANGUAGES else DEFAULT_LANGUAGE
+
+
+def translate(key: str, default: Optional[str] = None, lang: Optional[str] = None) -> str:
+    lang = lang or current_language()
+    value = catalog(lang).get(key)
+    if value is None and lang != DEFAULT_LANGUAGE:
+        value = catalog(DEFAULT_LANGUAGE).get(key)
+    if value is None:
+        value = default if default is not None else key
+    return value
+
+
+# ========================================
+# OUTILLAGE (compilation, vérification)
+# ========================================
+
+def compile_catalogs() -> List[str]:
+    """Compile les ui.po en ui.mo ; retourne les langues compilées."""
+    from babel.messages.mofile import write_mo
+    from babel.messages.pofile import read_po
+
+    compiled = []
+    for lang in LANGUAGES:
+        source = _catalog_path(lang, 'po')
+        if not os.path.exists(source):
+            continue
+        with open(source, 'rb') as handle:
+            messages = read_po(handle, locale=lang, domain=DOMAIN)
+        with open(_catalog_path(lang, 'mo'), 'wb') as handle:
+            write_mo(handle, messages)
+        compiled.append(lang)
+    catalog.cache_clear()
+    return compiled
+
+
+def missing_keys() -> Dict[str, List[str]]:
+    """{langue: clés présentes dans une autre langue mais absentes (ou vides) de celle-ci}."""
+    catalogs = {lang: catalog(lang) for lang in LANGUAGES}
+    every_key = set().union(*catalogs.values())
+    missing = {lang: sorted(every_key - {key for key, value in messages.items() if value})
+               for lang, messages in catalogs.items()}
+    return {lang: keys for lang, keys in missing.items() if keys}
+
+
+def init_app(app):
+    app.jinja_env.globals['t'] = translate
+
+    @app.cli.command('i18n-compile')
+    def i18n_compile_command():
+        """Compile translations/*/LC_MESSAGES/ui.po en .mo."""
+        click.echo(f"Catalogues compilés : {', '.join(compile_catalogs())}")
+
+    @app.cli.command('i18n-check')
+    def i18n_check_command():
+        """Liste les libellés manquants (fr/ar/en) ; code de sortie 1 s'il en manque."""
+        missing = missing_keys()
+        for lang, keys in missing.items():
+            click.echo(f"{lang}: {len(keys)} clé(s) manquante(s) : {', '.join(keys)}")
+        if missing:
+            sys.exit(1)
+        click.echo("Aucune clé manquante.")
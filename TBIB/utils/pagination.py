@@ -0,0 +1,54 @@
+"""
+TBIB - Pagination par curseur (keyset)
+
+Un curseur encode la clé de tri du dernier élément d'une page ; la page
+suivante repart strictement après cette clé (WHERE clé > curseur ORDER BY
+clé LIMIT n) au lieu d'un OFFSET qui relit toutes les pages précédentes.
+Les curseurs restent stables si des lignes sont ajoutées entre deux pages.
+"""
+
+import base64
+import binascii
+import json
+from typing import Any, List, Optional, Sequence, Tuple
+
+
+class InvalidCursor(ValueError):
+    """Curseur illisible ou falsifié."""
+
+
+def encode_cursor(*values: Any) -> str:
+    """Curseur opaque (base64 url-safe) pour une clé de tri ; dates et Decimal en texte."""
+    raw = json.dumps(list(values), default=str, separators=(',', ':')).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip('=')
+
+
+def decode_cursor(cursor: Optional[str], size: int) -> Optional[List[Any]]:
+    """
+    Clé de tri d'un curseur, ou None s'il est vide.
+
+    Raises:
+        InvalidCursor: si le curseur n'est pas une liste de `size` valeurs
+    """
+    if not cursor:
+        return None
+    try:
+        raw = base64.urlsafe_b64decode(cursor + '=' * (-len(cursor) % 4))
+        values = json.loads(raw)
+    except (binascii.Error, ValueError, UnicodeDecodeError):
+        raise InvalidCursor(cursor)
+    if not isinstance(values, list) or len(values) != size:
+        raise InvalidCursor(cursor)
+    return values
+
+
+def split_page(rows: Sequence, per_page: int, key) -> Tuple[List, Optional[str]]:
+    """
+    Découpe `per_page + 1` lignes lues en (page, curseur suivant).
+
+    `key(row)` donne la clé de tri d'une ligne ; pas de curseur sur la dernière page.
+    """
+    page = list(rows[:per_page])
+    if len(rows) > per_page and page:
+        return page, encode_cursor(*key(page[-1]))
+    return page, None
@@ -0,0 +1,246 @@
+"""
+TBIB - Liste des patients d'un médecin
+
+La table doctor_patient_stats a une ligne par couple (médecin, patient) ayant
+au moins un RDV, quel que soit son statut : un patient seulement réservé fait
+partie de la liste. Elle garde les dates de première et dernière consultation
+terminée, le nombre de consultations et d'absences. Elle est tenue à jour par
+des événements SQLAlchemy sur Appointment (nouveau RDV, passage à completed /
+no_show, correction d'un statut, suppression) et reconstruite par
+`flask roster-rebuild`.
+
+La liste est une lecture de l'index (doctor_id, last_visit, patient_id),
+paginée par curseur sur (last_visit, patient_id) décroissants : la page
+suivante repart après le dernier patient affiché, sans OFFSET. Les patients
+sans consultation terminée (last_visit NULL) viennent ensuite, par patient_id
+décroissant.
+"""
+
+from datetime import date
+from typing import Dict, List, Optional, Tuple
+
+import click
+from sqlalchemy import and_, case, delete, event, func, inspect, insert, or_, select, update
+
+from extensions import db
+from models import Appointment, DoctorPatientStats, User
+from utils.pagination import InvalidCursor, decode_cursor, split_page
+from utils.table_events import insert_missing, keep_previous_values, previous_value
+
+DEFAULT_PER_PAGE = 25
+MAX_PER_PAGE = 100
+
+COMPLETED = 'completed'
+NO_SHOW = 'no_show'
+# Statuts comptés dans doctor_patient_stats
+TRACKED_STATUSES = (COMPLETED, NO_SHOW)
+
+STATS_COLUMNS = ('doctor_id', 'patient_id', 'first_visit', 'last_visit', 'visit_count', 'no_show_count')
+
+# ========================================
+# MAINTENANCE INCRÉMENTALE
+# ========================================
+
+def _increment(connection, doctor_id: int, patient_id: int, status: str, day: Optional[date]) -> int:
+    table = DoctorPatientStats.__table__
+    values = {}
+    if status == COMPLETED:
+        values['visit_count'] = table.c.visit_count + 1
+        if day is not None:
+            values['first_visit'] = case(
+                (or_(table.c.first_visit.is_(None), table.c.first_visit > day), day),
+                else_=table.c.first_visit)
+            values['last_visit'] = case(
+                (or_(table.c.last_visit.is_(None), table.c.last_visit < day), day),
+                else_=table.c.last_visit)
+    else:
+        values['no_show_count'] = table.c.no_show_count + 1
+
+    return connection.execute(update(table).where(
+        table.c.doctor_id == doctor_id, table.c.patient_id == patient_id
+    ).values(**values)).rowcount
+
+
+def _seed(connection, doctor_id: int, patient_id: int):
+    """Ligne vide pour un nouveau couple (sans écraser celle d'un concurrent)."""
+    insert_missing(connection, DoctorPatientStats.__table__,
+                   {'doctor_id': doctor_id, 'patient_id': patient_id, 'visit_count': 0, 'no_show_count': 0},
+                   ['doctor_id', 'patient_id'])
+
+
+def record_outcome(connection, doctor_id: int, patient_id: int, status: str, day: Optional[date]):
+    """Ajoute une consultation terminée ou une absence au couple (médecin, patient)."""
+    if not _increment(connection, doctor_id, patient_id, status, day):
+        _seed(connection, doctor_id, patient_id)
+        _increment(connection, doctor_id, patient_id, status, day)
+
+
+def _aggregate(*criteria):
+    """SELECT (doctor_id, patient_id, first_visit, last_visit, visit_count, no_show_count) : un couple par RDV existant."""
+    completed = Appointment.status == COMPLETED
+    return select(
+        Appointment.doctor_id,
+        Appointment.patient_id,
+        func.min(case((completed, Appointment.appointment_date))),
+        func.max(case((completed, Appointment.appointment_date))),
+        func.count(case((completed, 1))),
+        func.count(case((Appointment.status == NO_SHOW, 1))),
+    ).where(*criteria).group_by(Appointment.doctor_id, Appointment.patient_id)
+
+
+def recompute_pair(connection, doctor_id: int, patient_id: int):
+    """
+    Recalcule un couple depuis ses RDV (statut annulé ou corrigé : un min/max ne
+    se décrémente pas). Plus aucun RDV : la ligne disparaît de la liste.
+    """
+    table = DoctorPatientStats.__table__
+    connection.execute(delete(table).where(table.c.doctor_id == doctor_id, table.c.patient_id == patient_id))
+    connection.execute(insert(table).from_select(STATS_COLUMNS, _aggregate(
+        Appointment.doctor_id == doctor_id, Appointment.patient_id == patient_id)))
+
+
+# Champs d'Appointment qui déplacent un RDV dans doctor_patient_stats
+TRACKED_FIELDS = ('status', 'appointment_date', 'doctor_id', 'patient_id')
+
+
+# L'ancienne valeur est chargée même si l'attribut était expiré (RDV modifié après un commit)
+keep_previous_values(*(getattr(Appointment, field) for field in TRACKED_FIELDS))
+
+
+@event.listens_for(Appointment, 'after_insert')
+def _appointment_inserted(mapper, connection, appointment):
+    if appointment.status in TRACKED_STATUSES:
+        record_outcome(connection, appointment.doctor_id, appointment.patient_id,
+                       appointment.status, appointment.appointment_date)
+    else:
+        # RDV réservé : le patient entre dans la liste, sans consultation comptée
+        _seed(connection, appointment.doctor_id, appointment.patient_id)
+
+
+@event.listens_for(Appointment, 'after_update')
+def _appointment_updated(mapper, connection, appointment):
+    # Un RDV change souvent (queue, check-in, notes) : ne regarder que les champs comptés
+    state = inspect(appointment)
+    if not any(state.attrs[field].history.has_changes() for field in TRACKED_FIELDS):
+        return
+
+    old_pair = (previous_value(state, 'doctor_id'), previous_value(state, 'patient_id'))
+    new_pair = (appointment.doctor_id, appointment.patient_id)
+    was_tracked = previous_value(state, 'status') in TRACKED_STATUSES
+
+    if was_tracked or old_pair != new_pair:
+        recompute_pair(connection, *old_pair)
+    if appointment.status in TRACKED_STATUSES and not (was_tracked and old_pair == new_pair):
+        record_outcome(connection, *new_pair, appointment.status, appointment.appointment_date)
+    elif old_pair != new_pair:
+        _seed(connection, *new_pair)
+
+
+@event.listens_for(Appointment, 'after_delete')
+def _appointment_deleted(mapper, connection, appointment):
+    # Même sans statut compté : c'était peut-être le dernier RDV du couple
+    state = inspect(appointment)
+    recompute_pair(connection, previous_value(state, 'doctor_id'), previous_value(state, 'patient_id'))
+
+
+def rebuild_patient_stats() -> int:
+    """Reconstruit toute la table (après un import en masse). Ne commit pas."""
+    table = DoctorPatientStats.__table__
+    db.session.execute(delete(table))
+    db.session.execute(insert(table).from_select(STATS_COLUMNS, _aggregate()))
+    return db.session.query(func.count()).select_from(DoctorPatientStats).scalar()
+
+
+def init_app(app):
+    @app.cli.command('roster-rebuild')
+    def roster_rebuild_command():
+        """Reconstruit la table doctor_patient_stats depuis les rendez-vous."""
+        count = rebuild_patient_stats()
+        db.session.commit()
+        click.echo(f"{count} relations médecin-patient recalculées")
+
+
+# ========================================
+# LECTURE
+# ========================================
+
+def _decode_position(after: Optional[str]):
+    """(last_visit ou None, patient_id) du dernier patient affiché."""
+    position = decode_cursor(after, 2)
+    if position is None:
+        return None
+    try:
+        return (date.fromisoformat(position[0]) if position[0] else None), int(position[1])
+    except (TypeError, ValueError):
+        raise InvalidCursor(after)
+
+
+def _position_key(row) -> Tuple[str, int]:
+    stats = row[0]
+    return (stats.last_visit.isoformat() if stats.last_visit else ''), stats.patient_id
+
+
+def patient_page(
+    doctor_id: int,
+    search: str = '',
+    after: Optional[str] = None,
+    per_page: int = DEFAULT_PER_PAGE
+) -> Tuple[List[Dict], Optional[str]]:
+    """
+    Une page de patients du médecin (au moins un RDV).
+
+    Deux plages de l'index, lues dans l'ordre : patients déjà vus par
+    last_visit décroissant, puis patients sans consultation terminée.
+
+    Raises:
+        InvalidCursor: si `after` n'est pas un curseur émis par cette fonction
+
+    Returns:
+        ([{'user', 'first_visit', 'last_visit', 'visit_count', 'no_show_count'}],
+         curseur de la page suivante ou None)
+    """
+    per_page = min(max(per_page, 1), MAX_PER_PAGE)
+    position = _decode_position(after)
+    stats = DoctorPatientStats
+
+    query = db.session.query(stats, User).join(User, User.id == stats.patient_id).filter(
+        stats.doctor_id == doctor_id
+    )
+    if search:
+        query = query.filter(User.name.ilike(f'%{search}%'))
+
+    rows = []
+    if position is None or position[0] is not None:
+        # Patients déjà vus (NULLS FIRST/LAST diffère selon la base : deux plages explicites)
+        visited = query.filter(stats.last_visit.isnot(None))
+        if position is not None:
+            last_visit, patient_id = position
+            visited = visited.filter(or_(
+                stats.last_visit < last_visit,
+                and_(stats.last_visit == last_visit, stats.patient_id < patient_id)
+            ))
+        rows = visited.order_by(stats.last_visit.desc(), stats.patient_id.desc()).limit(per_page + 1).all()
+
+    if len(rows) <= per_page:
+        booked = query.filter(stats.last_visit.is_(None))
+        if position is not None and position[0] is None:
+            booked = booked.filter(stats.patient_id < position[1])
+        rows += booked.order_by(stats.patient_id.desc()).limit(per_page + 1 - len(rows)).all()
+
+    rows, next_cursor = split_page(rows, per_page, key=_position_key)
+    return [{
+        'user': user,
+        'first_visit': row.first_visit,
+        'last_visit': row.last_visit,
+        'visit_count': row.visit_count,
+        'no_show_count': row.no_show_count,
+    } for row, user in rows], next_cursor
+
+
+def patient_count(doctor_id: int, search: str = '') -> int:
+    """Nombre total de patients du médecin (en-tête de la liste)."""
+    stats = DoctorPatientStats
+    query = db.session.query(func.count(stats.patient_id)).filter(stats.doctor_id == doctor_id)
+    if search:
+        query = query.join(User, User.id == stats.patient_id).filter(User.name.ilike(f'%{search}%'))
+    return query.scalar() or 0
@@ -0,0 +1,94 @@
+"""
+TBIB - Balayage des ordonnances expirées
+
+`flask prescriptions-sweep` (cron quotidien) :
+1. passe en 'expired' les ordonnances 'pending' dont la date est dépassée,
+   par lots (index partiel ix_prescriptions_active_expiry) ;
+2. déplace vers prescriptions_archive celles expirées depuis plus de
+   ARCHIVE_AFTER_DAYS jours, pour que la table chaude reste petite.
+
+Les ordonnances qui ont des délivrances (journal prescription_dispensations)
+restent dans la table chaude : le journal garde sa clé étrangère.
+
+Chaque lot est commité séparément : le balayage n'immobilise jamais la table
+et peut être interrompu puis relancé.
+"""
+
+from datetime import datetime, timedelta
+from typing import Optional
+
+import click
+from sqlalchemy import delete, insert, select, update
+
+from extensions import db
+from models import Prescription, PrescriptionArchive, PrescriptionDispensation
+
+SWEEP_BATCH_SIZE = 1000
+ARCHIVE_AFTER_DAYS = 90
+
+# Colonnes copiées telles quelles vers l'archive
+ARCHIVED_COLUMNS = (
+    'id', 'token', 'appointment_id', 'doctor_id', 'patient_id', 'medications', 'notes', 'status',
+    'security_hash', 'key_id', 'signed_header', 'prescription_type', 'usage_count', 'max_usage',
+    'expiry_date', 'created_at', 'last_verified_at',
+)
+
+
+def expire_prescriptions(now: Optional[datetime] = None, batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """Marque 'expired' les ordonnances pending périmées ; retourne le nombre de lignes. Commit par lot."""
+    now = now or datetime.utcnow()
+    table = Prescription.__table__
+    total = 0
+    while True:
+        batch = select(table.c.id).where(
+            table.c.status == 'pending',
+            table.c.expiry_date <= now
+        ).limit(batch_size)
+        count = db.session.execute(
+            update(table).where(table.c.id.in_(batch)).values(status='expired')
+        ).rowcount
+        db.session.commit()
+        total += count
+        if count < batch_size:
+            return total
+
+
+def archive_expired(older_than_days: int = ARCHIVE_AFTER_DAYS, now: Optional[datetime] = None,
+                    batch_size: int = SWEEP_BATCH_SIZE) -> int:
+    """Déplace vers l'archive les ordonnances expirées depuis `older_than_days` jours. Commit par lot."""
+    now = now or datetime.utcnow()
+    table = Prescription.__table__
+    archive = PrescriptionArchive.__table__
+    ledger = PrescriptionDispensation.__table__
+    total = 0
+    while True:
+        ids = db.session.execute(select(table.c.id).where(
+            table.c.status == 'expired',
+            table.c.expiry_date < now - timedelta(days=older_than_days),
+            ~select(ledger.c.id).where(ledger.c.prescription_id == table.c.id).exists()
+        ).order_by(table.c.id).limit(batch_size)).scalars().all()
+        if not ids:
+            return total
+
+        columns = [table.c[name] for name in ARCHIVED_COLUMNS]
+        db.session.execute(insert(archive).from_select(
+            list(ARCHIVED_COLUMNS) + ['archived_at'],
+            select(*columns, db.literal(now, db.DateTime)).where(table.c.id.in_(ids))
+        ))
+        db.session.execute(delete(table).where(table.c.id.in_(ids)))
+        db.session.commit()
+        total += len(ids)
+        if len(ids) < batch_size:
+            return total
+
+
+def init_app(app):
+    @app.cli.command('prescriptions-sweep')
+    @click.option('--archive-after-days', default=ARCHIVE_AFTER_DAYS, show_default=True,
+                  help="Archiver les ordonnances expirées depuis plus de N jours.")
+    @click.option('--batch-size', default=SWEEP_BATCH_SIZE, show_default=True)
+    def prescriptions_sweep_command(archive_after_days, batch_size):
+        """Expire les ordonnances périmées puis archive les plus anciennes."""
+        expired = expire_prescriptions(batch_size=batch_size)
+        archived = archive_expired(archive_after_days, batch_size=batch_size)
+        click.echo(f"{expired} ordonnances expirées, {archived} archivées")
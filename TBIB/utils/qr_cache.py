@@ -0,0 +1,213 @@
+"""
+TBIB - Cache des QR codes E-Wassfa
+
+Le QR d'une ordonnance encode son URL de vérification, qui ne change jamais :
+l'image est calculée une fois puis servie depuis un cache adressé par contenu
+(clé = sha256 du format et de l'URL), en mémoire avec éviction LRU et,
+si QR_CACHE_DIR est défini, persistée sur disque (partagée entre workers et
+conservée au redémarrage). Le dossier est borné à QR_CACHE_DISK_MAX fichiers :
+au-delà, les moins récemment servis sont supprimés.
+
+Formats :
+- 'svg' : chemin SVG construit depuis la matrice du QR, sans bibliothèque d'image
+- 'png' : image Pillow (impression, clients sans SVG)
+
+qrcode (et Pillow, pour le PNG) n'est importé qu'au premier rendu : un QR déjà
+en cache, ou un worker qui n'en sert aucun, ne paie pas cet import au démarrage.
+"""
+
+import hashlib
+import io
+import os
+import tempfile
+import threading
+from collections import OrderedDict
+from typing import List, Optional, Tuple
+
+QR_CACHE_SIZE = 512
+QR_CACHE_DISK_MAX = 10000
+QR_FORMATS = {
+    'svg': 'image/svg+xml',
+    'png': 'image/png',
+}
+
+# Taille d'un module (carré) et marge, en modules
+BOX_SIZE = 10
+BORDER = 2
+
+
+# ========================================
+# RENDU
+# ========================================
+
+def _make_qr(data: str):
+    import qrcode
+
+    qr = qrcode.QRCode(version=1, box_size=BOX_SIZE, border=BORDER)
+    qr.add_data(data)
+    qr.make(fit=True)
+    return qr
+
+
+def qr_matrix(data: str) -> List[List[bool]]:
+    """Matrice du QR (True = module noir), marge incluse."""
+    return _make_qr(data).get_matrix()
+
+
+def render_svg(data: str) -> bytes:
+    """SVG en un seul <path> (un rectangle par suite de modules noirs d'une ligne)."""
+    matrix = qr_matrix(data)
+    size = len(matrix)
+    segments = []
+    for y, row in enumerate(matrix):
+        x = 0
+        while x < size:
+            if not row[x]:
+                x += 1
+                continue
+            start = x
+            while x < size and row[x]:
+                x += 1
+            segments.append(f"M{start} {y}h{x - start}v1h-{x - start}z")
+
+    return (
+        f'<svg xmlns="http://www.w3.org/2000/svg" viewBox="0 0 {size} {size}" '
+        f'width="{size * BOX_SIZE}" height="{size * BOX_SIZE}" shape-rendering="crispEdges">'
+        f'<rect width="{size}" height="{size}" fill="#fff"/>'
+        f'<path d="{"".join(segments)}" fill="#000"/></svg>'
+    ).encode()
+
+
+def render_png(data: str) -> bytes:
+    img = _make_qr(data).make_image(fill_color="black", back_color="white")
+    buf = io.BytesIO()
+    img.save(buf, format='PNG')
+    return buf.getvalue()
+
+
+_RENDERERS = {
+    'svg': render_svg,
+    'png': render_png,
+}
+
+
+# ========================================
+# CACHE
+# ========================================
+
+class QRCache:
+    """QR codes rendus, par (format, URL) ; LRU en mémoire, disque optionnel."""
+
+    def __init__(self, max_entries: int = QR_CACHE_SIZE, directory: Optional[str] = None,
+                 max_files: int = QR_CACHE_DISK_MAX):
+        self.max_entries = max_entries
+        self.directory = directory
+        self.max_files = max_files
+        self._entries: 'OrderedDict[str, bytes]' = OrderedDict()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def key(data: str, fmt: str) -> str:
+        return hashlib.sha256(f"{fmt}\n{data}".encode()).hexdigest()
+
+    def get(self, data: str, fmt: str = 'svg') -> Tuple[bytes, str]:
+        """
+        (contenu, etag) du QR de `data` au format `fmt`.
+
+        Raises:
+            KeyError: format inconnu
+        """
+        renderer = _RENDERERS[fmt]
+        digest = self.key(data, fmt)
+
+        with self._lock:
+            content = self._entries.get(digest)
+            if content is not None:
+                self._entries.move_to_end(digest)
+                return content, digest
+
+        content = self._read(digest, fmt)
+        if content is None:
+            content = renderer(data)
+            self._write(digest, fmt, content)
+
+        with self._lock:
+            self._entries[digest] = content
+            self._entries.move_to_end(digest)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return content, digest
+
+    def _path(self, digest: str, fmt: str) -> str:
+        return os.path.join(self.directory, f"{digest}.{fmt}")
+
+    def _read(self, digest: str, fmt: str) -> Optional[bytes]:
+        if not self.directory:
+            return None
+        path = self._path(digest, fmt)
+        try:
+            with open(path, 'rb') as handle:
+                content = handle.read()
+            # mtime = dernier accès : l'éviction garde les QR encore servis
+            os.utime(path)
+            return content
+        except OSError:
+            return None
+
+    def _write(self, digest: str, fmt: str, content: bytes):
+        if not self.directory:
+            return
+        tmp_path = None
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            # Fichier temporaire puis rename : un autre worker ne lit jamais un fichier partiel
+            fd, tmp_path = tempfile.mkstemp(dir=self.directory, suffix='.tmp')
+            with os.fdopen(fd, 'wb') as handle:
+                handle.write(content)
+            os.replace(tmp_path, self._path(digest, fmt))
+        except OSError:
+            # Le disque n'est qu'un cache : on garde la version en mémoire
+            if tmp_path is not None:
+                try:
+                    os.unlink(tmp_path)
+                except OSError:
+                    pass
+            return
+        self._prune()
+
+    def _prune(self):
+        """Supprime les fichiers les moins récemment servis au-delà de max_files."""
+        try:
+            files = [entry for entry in os.scandir(self.directory)
+                     if entry.is_file() and not entry.name.endswith('.tmp')]
+        except OSError:
+            return
+        if len(files) <= self.max_files:
+            return
+        files.sort(key=lambda entry: entry.stat().st_mtime)
+        for entry in files[:len(files) - self.max_files]:
+            try:
+                os.unlink(entry.path)
+            except OSError:
+                pass  # Déjà supprimé par un autre worker
+
+    def init_app(self, app):
+        self.max_entries = app.config.get('QR_CACHE_SIZE', QR_CACHE_SIZE)
+        self.directory = app.config.get('QR_CACHE_DIR')
+        self.max_files = app.config.get('QR_CACHE_DISK_MAX', QR_CACHE_DISK_MAX)
+        if self.directory and not (app.config.get('PUBLIC_BASE_URL') or app.config.get('SERVER_NAME')):
+            # Sans adresse publique fixe, l'URL encodée suit l'en-tête Host : un client
+            # pourrait remplir le disque en le faisant varier. Mémoire seule.
+            app.logger.warning('QR_CACHE_DIR ignoré : définir PUBLIC_BASE_URL ou SERVER_NAME')
+            self.directory = None
+        self.clear()
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+qr_cache = QRCache()
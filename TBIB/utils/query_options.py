@@ -0,0 +1,117 @@
+"""
+TBIB - Politique de chargement des relations
+
+Chaque vue qui sérialise des RDV déclare ici les relations qu'elle lit, pour
+les charger avec la requête principale au lieu d'un lazy load par ligne (N+1).
+
+- joinedload : relations many-to-one (patient, type de consultation) ;
+  une seule requête avec JOIN
+- selectinload : collections ; une requête IN (...) par relation
+
+QueryCounter compte les requêtes SQL émises sur un engine ; les tests
+l'utilisent pour borner le nombre de requêtes d'un endpoint (query budget).
+"""
+
+import threading
+from contextlib import contextmanager
+from typing import Dict, List, Tuple
+
+from sqlalchemy import event
+from sqlalchemy.orm import joinedload
+
+from models import Appointment, User
+
+# ========================================
+# PRESETS PAR VUE
+# ========================================
+
+APPOINTMENT_VIEWS: Dict[str, Tuple] = {
+    # Agenda médecin : fiche patient, dossier médical, durée/couleur du type
+    'doctor_calendar': (
+        joinedload(Appointment.patient).joinedload(User.health_record),
+        joinedload(Appointment.consultation_type),
+    ),
+    # File d'attente (SmartFlow, snapshot, secrétariat) : nom/téléphone et durée
+    'queue': (
+        joinedload(Appointment.patient),
+        joinedload(Appointment.consultation_type),
+    ),
+    # Historique d'un patient chez un médecin : colonnes de l'Appointment seules
+    'patient_history': (),
+}
+
+PATIENT_VIEWS: Dict[str, Tuple] = {
+    # En-tête de l'historique : dossier médical du patient
+    'patient_history': (
+        joinedload(User.health_record),
+    ),
+}
+
+
+def appointment_options(view: str) -> Tuple:
+    """Options de chargement des RDV pour une vue (KeyError si vue inconnue)."""
+    return APPOINTMENT_VIEWS[view]
+
+
+def patient_options(view: str) -> Tuple:
+    """Options de chargement d'un patient pour une vue (KeyError si vue inconnue)."""
+    return PATIENT_VIEWS[view]
+
+
+# ========================================
+# COMPTEUR DE REQUÊTES (TESTS)
+# ========================================
+
+class QueryBudgetExceeded(AssertionError):
+    """Un bloc a émis plus de requêtes SQL que son budget déclaré."""
+
+
+class QueryCounter:
+    """
+    Enregistre les requêtes SQL exécutées sur un engine pendant un bloc.
+
+    Usage :
+        with QueryCounter(db.engine) as counter:
+            client.get('/api/...')
+        assert counter.count <= 4
+    """
+
+    def __init__(self, engine):
+        self.engine = engine
+        self.statements: List[str] = []
+        self._thread = None
+
+    def _record(self, conn, cursor, statement, parameters, context, executemany):
+        # Le serveur de test tourne dans le même thread ; ignorer les autres
+        if threading.get_ident() == self._thread:
+            self.statements.append(statement)
+
+    @property
+    def count(self) -> int:
+        return len(self.statements)
+
+    def __enter__(self) -> 'QueryCounter':
+        self._thread = threading.get_ident()
+        event.listen(self.engine, 'before_cursor_execute', self._record)
+        return self
+
+    def __exit__(self, *exc):
+        event.remove(self.engine, 'before_cursor_execute', self._record)
+        return False
+
+
+@contextmanager
+def query_budget(engine, budget: int, label: str = 'bloc'):
+    """
+    Échoue si le bloc émet plus de `budget` requêtes SQL.
+
+    Raises:
+        QueryBudgetExceeded: avec la liste des requêtes émises
+    """
+    with QueryCounter(engine) as counter:
+        yield counter
+    if counter.count > budget:
+        listing = '\n'.join(f"  {idx + 1}. {sql}" for idx, sql in enumerate(counter.statements))
+        raise QueryBudgetExceeded(
+            f"{label} : {counter.count} requêtes pour un budget de {budget}\n{listing}"
+        )
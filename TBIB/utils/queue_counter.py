@@ -0,0 +1,82 @@
+"""
+TBIB - Numéros de passage
+
+Un compteur par (médecin, jour) dans la table queue_counters, incrémenté par
+un seul UPDATE ... RETURNING : deux check-ins simultanés ne peuvent pas
+obtenir le même numéro, et l'attribution ne parcourt pas les RDV du jour.
+
+Le verrou d'écriture pris par l'UPDATE (ligne en PostgreSQL, base en SQLite)
+est tenu jusqu'au commit de l'appelant : un numéro n'est pas perdu si la
+transaction est annulée.
+"""
+
+from datetime import date
+
+from sqlalchemy import func, update
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+
+from extensions import db
+from models import Appointment, QueueCounter
+
+_UPSERT_DIALECTS = {
+    'postgresql': pg_insert,
+    'sqlite': sqlite_insert,
+}
+
+
+def next_queue_number(doctor_id: int, day: date) -> int:
+    """
+    Réserve le prochain numéro de passage du médecin pour ce jour.
+
+    Un aller-retour (UPDATE ... RETURNING) une fois le compteur créé ; le
+    premier numéro du jour initialise le compteur depuis les RDV existants.
+    """
+    number = _increment(doctor_id, day)
+    if number is None:
+        _seed(doctor_id, day)
+        number = _increment(doctor_id, day)
+    return number
+
+
+def _increment(doctor_id: int, day: date):
+    table = QueueCounter.__table__
+    statement = update(table).where(
+        table.c.doctor_id == doctor_id,
+        table.c.date == day
+    ).values(next_value=table.c.next_value + 1)
+
+    if db.session.get_bind().dialect.update_returning:
+        return db.session.execute(statement.returning(table.c.next_value - 1)).scalar()
+
+    # Sans RETURNING : l'UPDATE tient déjà le verrou, la relecture est sûre
+    if db.session.execute(statement).rowcount == 0:
+        return None
+    return db.session.execute(
+        db.select(table.c.next_value - 1).where(table.c.doctor_id == doctor_id, table.c.date == day)
+    ).scalar()
+
+
+def _seed(doctor_id: int, day: date):
+    """Crée le compteur après le plus grand numéro déjà attribué (sans écraser un concurrent)."""
+    table = QueueCounter.__table__
+    current_max = db.session.query(func.max(Appointment.queue_number)).filter(
+        Appointment.doctor_id == doctor_id,
+        Appointment.appointment_date == day
+    ).scalar() or 0
+    values = {'doctor_id': doctor_id, 'date': day, 'next_value': current_max + 1}
+
+    dialect = db.session.get_bind().dialect.name
+    if dialect in _UPSERT_DIALECTS:
+        db.session.execute(
+            _UPSERT_DIALECTS[dialect](table).values(**values).on_conflict_do_nothing(
+                index_elements=['doctor_id', 'date'])
+        )
+        return
+
+    try:
+        with db.session.begin_nested():
+            db.session.execute(table.insert().values(**values))
+    except IntegrityError:
+        pass  # Créé entre-temps par une autre transaction
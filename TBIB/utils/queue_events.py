@@ -0,0 +1,167 @@
+"""
+TBIB - Bus d'événements de la file d'attente
+
+Les chemins qui modifient une file (check-in, patient suivant, présent,
+no-show, walk-in, fin de consultation, changement de statut, décalage,
+compression) publient un événement pour (doctor_id, jour). Chaque publication
+incrémente la version de la file : tout cache calculé pour une version plus
+ancienne est invalide.
+
+Le backend stocke versions et snapshots :
+- MemoryQueueBackend (défaut) : propre au processus
+- RedisQueueBackend : partagé entre workers gunicorn (QUEUE_CACHE_URL=redis://...)
+"""
+
+import pickle
+import threading
+from datetime import date
+from typing import Callable, Dict, List, Optional, Tuple, Any
+
+# Types d'événements publiés par les chemins de mutation
+CHECK_IN = 'check_in'
+NEXT_PATIENT = 'next_patient'
+PRESENT = 'present'
+NO_SHOW = 'no_show'
+WALK_IN = 'walk_in'
+COMPLETED = 'completed'
+STATUS_CHANGE = 'status_change'
+SHIFT = 'shift'
+COMPRESSION = 'compression'
+
+QueueKey = Tuple[int, date]
+
+
+class MemoryQueueBackend:
+    """Versions et snapshots en mémoire, pour un seul processus."""
+
+    # Les écritures d'une autre instance ne changent pas ces versions
+    shared = False
+
+    def __init__(self):
+        self._versions: Dict[QueueKey, int] = {}
+        self._snapshots: Dict[QueueKey, Tuple[int, Any]] = {}
+        self._lock = threading.Lock()
+
+    def version(self, key: QueueKey) -> int:
+        return self._versions.get(key, 0)
+
+    def bump(self, key: QueueKey) -> int:
+        with self._lock:
+            version = self._versions[key] = self._versions.get(key, 0) + 1
+            self._snapshots.pop(key, None)
+        return version
+
+    def get_snapshot(self, key: QueueKey) -> Optional[Tuple[int, Any]]:
+        return self._snapshots.get(key)
+
+    def set_snapshot(self, key: QueueKey, version: int, snapshot: Any, ttl: int):
+        # Le TTL est vérifié par l'appelant (computed_at) : rien à expirer ici
+        self._snapshots[key] = (version, snapshot)
+
+    def clear(self):
+        with self._lock:
+            self._versions.clear()
+            self._snapshots.clear()
+
+
+class RedisQueueBackend:
+    """Versions (INCR) et snapshots (pickle + TTL) partagés via Redis."""
+
+    shared = True
+
+    PREFIX = 'tbib:queue'
+
+    def __init__(self, url: str):
+        import redis  # Dépendance optionnelle, seulement si QUEUE_CACHE_URL est défini
+        self._redis = redis.Redis.from_url(url)
+
+    def _key(self, kind: str, key: QueueKey) -> str:
+        doctor_id, day = key
+        return f"{self.PREFIX}:{kind}:{doctor_id}:{day.isoformat()}"
+
+    def version(self, key: QueueKey) -> int:
+        return int(self._redis.get(self._key('version', key)) or 0)
+
+    def bump(self, key: QueueKey) -> int:
+        pipe = self._redis.pipeline()
+        pipe.incr(self._key('version', key))
+        pipe.expire(self._key('version', key), 2 * 24 * 3600)
+        pipe.delete(self._key('snapshot', key))
+        return int(pipe.execute()[0])
+
+    def get_snapshot(self, key: QueueKey) -> Optional[Tuple[int, Any]]:
+        raw = self._redis.get(self._key('snapshot', key))
+        return pickle.loads(raw) if raw else None
+
+    def set_snapshot(self, key: QueueKey, version: int, snapshot: Any, ttl: int):
+        self._redis.setex(self._key('snapshot', key), ttl, pickle.dumps((version, snapshot)))
+
+    def clear(self):
+        for redis_key in self._redis.scan_iter(f"{self.PREFIX}:*"):
+            self._redis.delete(redis_key)
+
+
+class QueueEventBus:
+    """
+    Publie les changements de file et notifie les abonnés du processus.
+
+    Abonnés : callables (event_type, doctor_id, day, appointment, version).
+    `appointment` vaut None pour les changements de masse (décalage, compression).
+    """
+
+    def __init__(self, backend=None):
+        self.backend = backend or MemoryQueueBackend()
+        self._handlers: List[Callable] = []
+        self._changed = threading.Condition()
+
+    def init_app(self, app):
+        url = app.config.get('QUEUE_CACHE_URL')
+        self.backend = RedisQueueBackend(url) if url else MemoryQueueBackend()
+
+    def subscribe(self, handler: Callable):
+        if handler not in self._handlers:
+            self._handlers.append(handler)
+        return handler
+
+    def publish(self, event_type: str, doctor_id: int, day: Optional[date] = None, appointment=None) -> int:
+        """
+        Invalide la file (doctor_id, day) et prévient les abonnés.
+
+        À appeler après le commit, pour que les abonnés relisent l'état final.
+
+        Returns:
+            La nouvelle version de la file
+        """
+        key = (doctor_id, day or date.today())
+        version = self.backend.bump(key)
+        for handler in self._handlers:
+            handler(event_type, doctor_id, key[1], appointment, version)
+
+        with self._changed:
+            self._changed.notify_all()
+        return version
+
+    @property
+    def shared(self) -> bool:
+        """Vrai si toutes les instances voient les mêmes versions (backend Redis)."""
+        return self.backend.shared
+
+    def version(self, doctor_id: int, day: Optional[date] = None) -> int:
+        return self.backend.version((doctor_id, day or date.today()))
+
+    def wait(self, doctor_id: int, since_version: int, timeout: float, day: Optional[date] = None) -> int:
+        """
+        Bloque jusqu'à un changement de la file ou l'expiration du délai.
+
+        Les publications des autres workers (backend partagé) ne réveillent
+        pas ce processus : elles sont vues au plus tard après `timeout`.
+
+        Returns:
+            La version courante (égale à `since_version` si rien n'a changé)
+        """
+        with self._changed:
+            self._changed.wait_for(lambda: self.version(doctor_id, day) != since_version, timeout)
+        return self.version(doctor_id, day)
+
+
+queue_events = QueueEventBus()
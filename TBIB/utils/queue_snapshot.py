@@ -0,0 +1,238 @@
+"""
+TBIB - Snapshot de la file d'attente
+
+Calcule une seule fois par (médecin, jour) qui attend, dans quel ordre, pour
+combien de temps, et le drift du médecin, puis le partage entre tous les
+lecteurs : ticket live (page, polling, flux SSE), /api/queue_status,
+SmartFlow, tableau de bord médecin et secrétariat.
+
+Le snapshot est rangé dans le backend du bus d'événements (mémoire ou Redis)
+avec la version de la file : toute publication sur le bus l'invalide. Le
+drift dépendant de l'heure, il est aussi recalculé après DRIFT_REFRESH_SECONDS.
+"""
+
+import threading
+import time as clock
+from bisect import bisect_left
+from datetime import date, datetime, time
+from typing import Dict, Iterable, List, Optional, Tuple
+
+from models import Appointment
+from utils.availability import DEFAULT_DURATION
+from utils.queue_events import queue_events
+from utils.query_options import appointment_options
+from utils.smart_engine import QueueOptimizer
+
+# Statuts comptés "devant" un patient
+AHEAD_STATUSES = ('waiting', 'confirmed')
+
+# Le drift dépend de l'heure : recalcul au moins toutes les N secondes
+DRIFT_REFRESH_SECONDS = 60
+
+# Flux SSE : commentaire keep-alive au plus tard toutes les N secondes, et
+# fermeture au bout de LIVE_STREAM_MAX_SECONDS (le navigateur se reconnecte)
+LIVE_STREAM_HEARTBEAT_SECONDS = 15
+LIVE_STREAM_MAX_SECONDS = 300
+
+
+class QueueSnapshot:
+    """
+    Photo de la file d'un médecin pour un jour.
+
+    Deux ordres triés avec sommes préfixes des durées (par numéro de queue et
+    par heure de RDV) : la position d'un ticket se lit par bissection.
+    Ne contient que des types simples, pour pouvoir être partagé via Redis.
+    """
+
+    def __init__(self, doctor_id: int, day: date, version: int, drift: Dict, rows: List[Dict]):
+        self.doctor_id = doctor_id
+        self.day = day
+        self.version = version
+        self.drift = drift
+        self.computed_at = clock.time()
+
+        # Triées par heure de RDV (ordre de la requête)
+        self.rows = rows
+        self._rows: Dict[int, Dict] = {row['id']: row for row in rows}
+
+        ahead = [row for row in rows if row['status'] in AHEAD_STATUSES]
+        self._by_queue = self._index(ahead, 'queue_number')
+        self._by_time = self._index(ahead, 'appointment_time')
+
+    @classmethod
+    def load(cls, doctor_id: int, day: date, version: int) -> 'QueueSnapshot':
+        appointments = Appointment.query.options(
+            *appointment_options('queue')
+        ).filter(
+            Appointment.doctor_id == doctor_id,
+            Appointment.appointment_date == day
+        ).order_by(Appointment.appointment_time).all()
+
+        rows = [
+            {
+                'id': appt.id,
+                'patient_id': appt.patient_id,
+                'patient_name': appt.patient.name if appt.patient else None,
+                'patient_phone': appt.patient.phone if appt.patient else None,
+                'status': appt.status,
+                'queue_number': appt.queue_number,
+                'appointment_time': appt.appointment_time,
+                'check_in_time': appt.check_in_time,
+                'duration': appt.consultation_type.duration if appt.consultation_type else DEFAULT_DURATION,
+                'consultation_reason': appt.consultation_reason,
+                'price_paid': appt.price_paid
+            }
+            for appt in appointments
+        ]
+
+        # Le drift ne concerne que la journée en cours
+        if day == date.today():
+            drift = QueueOptimizer().detect_drift(doctor_id)
+        else:
+            drift = {'drift_minutes': 0, 'is_behind': False, 'should_compress': False,
+                     'compression_suggestion': None, 'next_appointment': None,
+                     'remaining_appointments': 0}
+        return cls(doctor_id, day, version, drift, rows)
+
+    @staticmethod
+    def _index(rows: List[Dict], key: str) -> Tuple[List, List[int]]:
+        ordered = sorted((row[key], row['duration']) for row in rows if row[key] is not None)
+        keys = [k for k, _ in ordered]
+        prefix = [0]
+        for _, duration in ordered:
+            prefix.append(prefix[-1] + duration)
+        return keys, prefix
+
+    # ========================================
+    # TICKETS
+    # ========================================
+
+    @property
+    def drift_minutes(self) -> float:
+        return self.drift.get('drift_minutes', 0)
+
+    def position(self, queue_number: Optional[int], appointment_time: Optional[time]) -> Tuple[int, int]:
+        """
+        Patients devant un ticket et somme de leurs durées.
+
+        Même règle que la requête historique : par numéro de queue si le
+        ticket en a un, sinon par heure de RDV.
+
+        Returns:
+            (waiting_ahead, base_wait_minutes)
+        """
+        if queue_number is not None:
+            keys, prefix = self._by_queue
+            value = queue_number
+        elif appointment_time is not None:
+            keys, prefix = self._by_time
+            value = appointment_time
+        else:
+            return 0, 0
+
+        count = bisect_left(keys, value)
+        return count, prefix[count]
+
+    def ticket(self, appointment_id: int) -> Optional[Dict]:
+        """Données live d'un ticket du jour, ou None s'il n'est pas dans ce snapshot."""
+        row = self._rows.get(appointment_id)
+        if row is None:
+            return None
+        return self.payload(row['status'], row['queue_number'], row['appointment_time'], row['patient_name'])
+
+    def payload(self, status: str, queue_number: Optional[int], appointment_time: Optional[time],
+                patient_name: Optional[str]) -> Dict:
+        waiting_ahead, base_wait = self.position(queue_number, appointment_time)
+        return {
+            'success': True,
+            'status': status,
+            'waiting_ahead': waiting_ahead,
+            'estimated_wait': int(max(0, base_wait + self.drift_minutes)),
+            'drift_minutes': int(self.drift_minutes),
+            'queue_number': queue_number,
+            'patient_name': patient_name
+        }
+
+    # ========================================
+    # AGRÉGATS
+    # ========================================
+
+    def count(self, statuses: Iterable[str], queued_only: bool = False) -> int:
+        """Nombre de RDV dans ces statuts (avec numéro de queue si queued_only)."""
+        statuses = tuple(statuses)
+        return sum(
+            1 for row in self.rows
+            if row['status'] in statuses and (not queued_only or row['queue_number'] is not None)
+        )
+
+    def at_queue_number(self, queue_number: Optional[int]) -> Optional[Dict]:
+        for row in self.rows:
+            if row['queue_number'] == queue_number:
+                return row
+        return None
+
+    def revenue(self) -> float:
+        """Recette du jour : montants perçus des consultations terminées."""
+        return sum(
+            row['price_paid'] for row in self.rows
+            if row['status'] == 'completed' and row['price_paid'] is not None
+        )
+
+    def suspected_no_shows(self, now: datetime, threshold_minutes: int) -> List[Dict]:
+        """RDV confirmés sans check-in, dépassés de plus de `threshold_minutes`."""
+        suspected = []
+        for row in self.rows:
+            if row['status'] != 'confirmed' or row['appointment_time'] is None or row['check_in_time'] is not None:
+                continue
+            appointment_dt = datetime.combine(self.day, row['appointment_time'])
+            overdue = (now - appointment_dt).total_seconds() / 60
+            if overdue > threshold_minutes:
+                suspected.append({
+                    'appointment_id': row['id'],
+                    'patient_id': row['patient_id'],
+                    'patient_name': row['patient_name'] or 'Inconnu',
+                    'patient_phone': row['patient_phone'],
+                    'scheduled_time': row['appointment_time'].strftime('%H:%M'),
+                    'minutes_overdue': round(overdue),
+                    'action_suggested': 'Appeler le patient ou passer au suivant'
+                })
+        return suspected
+
+
+_load_lock = threading.Lock()
+
+
+def get_queue_snapshot(doctor_id: int, day: Optional[date] = None) -> QueueSnapshot:
+    """
+    Snapshot de la file, partagé par tous les lecteurs du médecin.
+
+    Recalculé (une requête + detect_drift) seulement si le bus a publié un
+    changement depuis le dernier calcul ou si le drift a vieilli.
+    """
+    day = day or date.today()
+    key = (doctor_id, day)
+    version = queue_events.version(doctor_id, day)
+
+    snapshot = _cached(key, version)
+    if snapshot is not None:
+        return snapshot
+
+    with _load_lock:
+        # Un autre lecteur a pu recalculer pendant l'attente du verrou
+        snapshot = _cached(key, version)
+        if snapshot is not None:
+            return snapshot
+
+        snapshot = QueueSnapshot.load(doctor_id, day, version)
+        queue_events.backend.set_snapshot(key, version, snapshot, DRIFT_REFRESH_SECONDS)
+        return snapshot
+
+
+def _cached(key, version: int) -> Optional[QueueSnapshot]:
+    entry = queue_events.backend.get_snapshot(key)
+    if entry is None:
+        return None
+    cached_version, snapshot = entry
+    if cached_version != version or clock.time() - snapshot.computed_at >= DRIFT_REFRESH_SECONDS:
+        return None
+    return snapshot
@@ -0,0 +1,256 @@
+"""
+TBIB - Agrégats du tableau de bord ministère
+
+Trois tables d'agrégats, mises à jour à chaque écriture par des événements
+SQLAlchemy (un UPDATE compteur = compteur ± 1 sur la ligne concernée) :
+
+- rollup_doctors_by_city : médecins par ville (création, suppression,
+  changement de ville d'un DoctorProfile)
+- rollup_daily_appointments : RDV par jour et spécialité (un médecin qui
+  change de spécialité emporte ses RDV déjà comptés)
+- rollup_daily_epidemiology : cas EpidemiologyData par jour, pathologie,
+  tranche d'âge, sexe et wilaya
+
+Le tableau de bord lit quelques petites lignes au lieu de compter les tables
+sources ; les tendances semaine sur semaine viennent de l'agrégat
+épidémiologique. `flask rollups-rebuild` recalcule tout depuis les sources.
+"""
+
+from datetime import date, datetime, timedelta
+from typing import Dict, List, Optional, Tuple
+
+import click
+from sqlalchemy import Date, case, cast, delete, event, func, insert, inspect, select, update
+
+from extensions import db
+from models import (Appointment, DoctorProfile, EpidemiologyData, RollupDailyAppointments,
+                    RollupDailyEpidemiology, RollupDoctorsByCity)
+from utils.table_events import insert_missing, keep_previous_values, previous_value
+
+# Seuil sous lequel une ville est considérée sous-couverte
+UNDERSERVED_THRESHOLD = 2
+
+# Variation hebdomadaire (en %) affichée "Stable"
+STABLE_PERCENT = 2
+
+# ========================================
+# COMPTEURS
+# ========================================
+
+def _bump(connection, model, keys: Dict, column: str, delta: int):
+    """compteur += delta sur la ligne `keys`, créée à zéro si besoin (sans écraser un concurrent)."""
+    table = model.__table__
+    where = [table.c[name] == value for name, value in keys.items()]
+    statement = update(table).where(*where).values({column: table.c[column] + delta})
+    if connection.execute(statement).rowcount:
+        return
+
+    insert_missing(connection, table, dict(keys, **{column: 0}), list(keys))
+    connection.execute(statement)
+
+
+# L'ancienne valeur est connue même si l'attribut était expiré
+keep_previous_values(DoctorProfile.city, DoctorProfile.specialty, Appointment.doctor_id, Appointment.appointment_date)
+
+
+# ----- Médecins par ville -----
+
+@event.listens_for(DoctorProfile, 'after_insert')
+def _doctor_inserted(mapper, connection, profile):
+    _bump(connection, RollupDoctorsByCity, {'city': profile.city}, 'doctor_count', 1)
+
+
+@event.listens_for(DoctorProfile, 'after_delete')
+def _doctor_deleted(mapper, connection, profile):
+    _bump(connection, RollupDoctorsByCity, {'city': previous_value(inspect(profile), 'city')}, 'doctor_count', -1)
+
+
+@event.listens_for(DoctorProfile, 'after_update')
+def _doctor_updated(mapper, connection, profile):
+    state = inspect(profile)
+    if state.attrs.city.history.has_changes():
+        _bump(connection, RollupDoctorsByCity, {'city': previous_value(state, 'city')}, 'doctor_count', -1)
+        _bump(connection, RollupDoctorsByCity, {'city': profile.city}, 'doctor_count', 1)
+    if state.attrs.specialty.history.has_changes():
+        _move_specialty(connection, profile.id, previous_value(state, 'specialty') or '', profile.specialty or '')
+
+
+# ----- RDV par jour et spécialité -----
+
+def _specialty(connection, doctor_id: int) -> str:
+    return connection.execute(
+        select(DoctorProfile.specialty).where(DoctorProfile.id == doctor_id)
+    ).scalar() or ''
+
+
+def _bump_appointments(connection, doctor_id: int, day: Optional[date], delta: int):
+    if day is None:
+        return  # Comme rebuild_rollups : un RDV sans date n'est compté nulle part
+    keys = {'day': day, 'specialty': _specialty(connection, doctor_id)}
+    _bump(connection, RollupDailyAppointments, keys, 'appointment_count', delta)
+
+
+def _move_specialty(connection, doctor_id: int, previous: str, current: str):
+    """Déplace les RDV du médecin, jour par jour, de l'ancienne ligne de spécialité vers la nouvelle."""
+    if previous == current:
+        return
+    days = connection.execute(
+        select(Appointment.appointment_date, func.count(Appointment.id)).where(
+            Appointment.doctor_id == doctor_id, Appointment.appointment_date.isnot(None)
+        ).group_by(Appointment.appointment_date)
+    ).all()
+    for day, count in days:
+        _bump(connection, RollupDailyAppointments, {'day': day, 'specialty': previous}, 'appointment_count', -count)
+        _bump(connection, RollupDailyAppointments, {'day': day, 'specialty': current}, 'appointment_count', count)
+
+
+@event.listens_for(Appointment, 'after_insert')
+def _appointment_inserted(mapper, connection, appointment):
+    _bump_appointments(connection, appointment.doctor_id, appointment.appointment_date, 1)
+
+
+@event.listens_for(Appointment, 'after_delete')
+def _appointment_deleted(mapper, connection, appointment):
+    state = inspect(appointment)
+    _bump_appointments(connection, previous_value(state, 'doctor_id'), previous_value(state, 'appointment_date'), -1)
+
+
+@event.listens_for(Appointment, 'after_update')
+def _appointment_updated(mapper, connection, appointment):
+    # RDV déplacé (autre jour ou autre médecin) : changer de ligne d'agrégat
+    state = inspect(appointment)
+    if not (state.attrs.doctor_id.history.has_changes() or state.attrs.appointment_date.history.has_changes()):
+        return
+    _bump_appointments(connection, previous_value(state, 'doctor_id'), previous_value(state, 'appointment_date'), -1)
+    _bump_appointments(connection, appointment.doctor_id, appointment.appointment_date, 1)
+
+
+# ----- Épidémiologie -----
+
+def _epidemiology_keys(record: EpidemiologyData) -> Dict:
+    return {
+        'day': (record.timestamp or datetime.utcnow()).date(),
+        'pathology_tag': record.pathology_tag,
+        'age_group': record.age_group,
+        'gender': record.gender,
+        'wilaya': record.wilaya,
+    }
+
+
+@event.listens_for(EpidemiologyData, 'after_insert')
+def _epidemiology_inserted(mapper, connection, record):
+    _bump(connection, RollupDailyEpidemiology, _epidemiology_keys(record), 'case_count', 1)
+
+
+@event.listens_for(EpidemiologyData, 'after_delete')
+def _epidemiology_deleted(mapper, connection, record):
+    _bump(connection, RollupDailyEpidemiology, _epidemiology_keys(record), 'case_count', -1)
+
+
+# ========================================
+# RECONSTRUCTION
+# ========================================
+
+def _day(column, dialect: str):
+    # SQLite : CAST(... AS DATE) rend un nombre ; date() rend 'AAAA-MM-JJ'
+    if dialect == 'sqlite':
+        return func.date(column)
+    return cast(column, Date)
+
+
+def rebuild_rollups() -> Dict[str, int]:
+    """Recalcule les trois agrégats depuis les tables sources. Ne commit pas."""
+    executor = db.session
+    dialect = db.session.get_bind().dialect.name
+    doctors = RollupDoctorsByCity.__table__
+    appointments = RollupDailyAppointments.__table__
+    epidemiology = RollupDailyEpidemiology.__table__
+    for table in (doctors, appointments, epidemiology):
+        executor.execute(delete(table))
+
+    executor.execute(insert(doctors).from_select(['city', 'doctor_count'], select(
+        DoctorProfile.city, func.count(DoctorProfile.id)
+    ).group_by(DoctorProfile.city)))
+
+    specialty = func.coalesce(DoctorProfile.specialty, '')
+    executor.execute(insert(appointments).from_select(['day', 'specialty', 'appointment_count'], select(
+        Appointment.appointment_date, specialty, func.count(Appointment.id)
+    ).join(DoctorProfile, DoctorProfile.id == Appointment.doctor_id).where(
+        Appointment.appointment_date.isnot(None)
+    ).group_by(Appointment.appointment_date, specialty)))
+
+    day = _day(EpidemiologyData.timestamp, dialect)
+    dimensions = (EpidemiologyData.pathology_tag, EpidemiologyData.age_group,
+                  EpidemiologyData.gender, EpidemiologyData.wilaya)
+    executor.execute(insert(epidemiology).from_select(
+        ['day', 'pathology_tag', 'age_group', 'gender', 'wilaya', 'case_count'],
+        select(day, *dimensions, func.count(EpidemiologyData.id)).where(
+            EpidemiologyData.timestamp.isnot(None)
+        ).group_by(day, *dimensions)
+    ))
+
+    return {
+        table.name: executor.execute(select(func.count()).select_from(table)).scalar()
+        for table in (doctors, appointments, epidemiology)
+    }
+
+
+def init_app(app):
+    @app.cli.command('rollups-rebuild')
+    def rollups_rebuild_command():
+        """Recalcule les agrégats du tableau de bord ministère."""
+        counts = rebuild_rollups()
+        db.session.commit()
+        click.echo(', '.join(f"{name}: {count}" for name, count in counts.items()))
+
+
+# ========================================
+# LECTURE (TABLEAU DE BORD)
+# ========================================
+
+def doctors_per_city() -> List[Tuple[str, int]]:
+    """[(ville, médecins)] du plus au moins couvert."""
+    rollup = RollupDoctorsByCity
+    return db.session.query(rollup.city, rollup.doctor_count).filter(
+        rollup.doctor_count > 0
+    ).order_by(rollup.doctor_count.desc(), rollup.city).all()
+
+
+def _window_sums(model, column, dimension, today: date):
+    """{valeur de dimension: (7 derniers jours, 7 jours précédents)} en une requête."""
+    count = getattr(model, column)
+    current_start = today - timedelta(days=6)
+    previous_start = today - timedelta(days=13)
+    rows = db.session.query(
+        dimension,
+        func.sum(case((model.day >= current_start, count), else_=0)),
+        func.sum(case((model.day < current_start, count), else_=0)),
+    ).filter(model.day >= previous_start, model.day <= today).group_by(dimension).all()
+    return {key: (int(current or 0), int(previous or 0)) for key, current, previous in rows}
+
+
+def format_trend(current: int, previous: int) -> str:
+    """'+12%', '-3%', 'Stable' ou 'Nouveau' (aucun cas la semaine précédente)."""
+    if previous == 0:
+        return 'Nouveau' if current else 'Stable'
+    percent = round((current - previous) * 100 / previous)
+    if abs(percent) < STABLE_PERCENT:
+        return 'Stable'
+    return f"{percent:+d}%"
+
+
+def health_trends(today: Optional[date] = None, limit: int = 8) -> Dict[str, str]:
+    """Tendance semaine sur semaine par pathologie, les plus fréquentes d'abord."""
+    sums = _window_sums(RollupDailyEpidemiology, 'case_count', RollupDailyEpidemiology.pathology_tag,
+                        today or date.today())
+    ranked = sorted(sums.items(), key=lambda item: (-item[1][0], item[0]))[:limit]
+    return {pathology: format_trend(current, previous) for pathology, (current, previous) in ranked}
+
+
+def appointments_per_specialty(today: Optional[date] = None) -> List[Tuple[str, int, str]]:
+    """[(spécialité, RDV des 7 derniers jours, tendance)] du plus au moins demandé."""
+    sums = _window_sums(RollupDailyAppointments, 'appointment_count', RollupDailyAppointments.specialty,
+                        today or date.today())
+    rows = [(specialty, current, format_trend(current, previous))
+            for specialty, (current, previous) in sums.items() if current or previous]
+    return sorted(rows, key=lambda row: (-row[1], row[0]))
@@ -0,0 +1,78 @@
+"""
+TBIB - Clés de signature HMAC (E-Wassfa)
+
+Trousseau de clés versionnées pour la rotation : chaque ordonnance garde le
+key_id de la clé qui l'a signée, les nouvelles signatures utilisent la clé
+active. Configuration :
+
+    EWASSFA_SIGNING_KEYS="k1:secret1,k2:secret2"
+    EWASSFA_ACTIVE_KEY_ID=k2   (par défaut : la dernière clé listée)
+
+Sans trousseau configuré, une seule clé DEFAULT_KEY_ID dérivée de SECRET_KEY.
+
+Un objet hmac est préparé une fois par secret (clé déjà hachée dans les états
+interne/externe) ; chaque signature ou vérification part d'un copy().
+"""
+
+import hashlib
+import hmac
+import threading
+from typing import Dict, Optional
+
+from flask import current_app
+
+DEFAULT_KEY_ID = 'k0'
+
+
+class UnknownSigningKey(KeyError):
+    """key_id absent du trousseau (clé retirée ou ordonnance falsifiée)."""
+
+
+def parse_keys(value: Optional[str]) -> Dict[str, str]:
+    """"k1:secret1,k2:secret2" -> {'k1': 'secret1', 'k2': 'secret2'} (ordre conservé)."""
+    keys = {}
+    for item in (value or '').split(','):
+        key_id, _, secret = item.strip().partition(':')
+        if key_id and secret:
+            keys[key_id] = secret
+    return keys
+
+
+_prepared: Dict[str, 'hmac.HMAC'] = {}
+_lock = threading.Lock()
+
+
+def _mac_for_secret(secret: str) -> 'hmac.HMAC':
+    prepared = _prepared.get(secret)
+    if prepared is None:
+        with _lock:
+            prepared = _prepared.setdefault(secret, hmac.new(secret.encode(), digestmod=hashlib.sha256))
+    return prepared.copy()
+
+
+def signing_keys() -> Dict[str, str]:
+    return current_app.config.get('EWASSFA_SIGNING_KEYS') or {DEFAULT_KEY_ID: current_app.config['SECRET_KEY']}
+
+
+def active_key_id() -> str:
+    keys = signing_keys()
+    key_id = current_app.config.get('EWASSFA_ACTIVE_KEY_ID')
+    return key_id if key_id in keys else list(keys)[-1]
+
+
+def mac(key_id: str) -> 'hmac.HMAC':
+    """
+    HMAC-SHA256 prêt à recevoir le message, pour la clé `key_id`.
+
+    Raises:
+        UnknownSigningKey: si la clé n'est pas (ou plus) dans le trousseau
+    """
+    secret = signing_keys().get(key_id)
+    if secret is None:
+        raise UnknownSigningKey(key_id)
+    return _mac_for_secret(secret)
+
+
+def legacy_mac() -> 'hmac.HMAC':
+    """HMAC des signatures antérieures au trousseau (SECRET_KEY, sans key_id)."""
+    return _mac_for_secret(current_app.config['SECRET_KEY'])
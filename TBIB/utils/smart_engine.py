@@ -10,10 +10,30 @@ Auteur: TBIB Development Team
 Version: 1.0.0
 """
 
+import heapq
+import threading
+import time
 from datetime import datetime, date, timedelta
 from typing import List, Dict, Optional, Tuple
+from sqlalchemy.orm import joinedload
 from extensions import db
 from models import Appointment, User, DoctorProfile
+from utils.queue_events import queue_events, CHECK_IN, NO_SHOW, COMPRESSION, STATUS_CHANGE
+from utils.query_options import appointment_options
+from utils.queue_counter import next_queue_number
+
+
+# Statuts suivis par les compteurs de la file
+QUEUE_STATUSES = ('confirmed', 'waiting', 'checked_in', 'in_progress',
+                  'completed', 'cancelled', 'no_show', 'suspected_missing')
+
+# Statuts présents dans la file ordonnée
+QUEUED_STATUSES = ('waiting', 'checked_in')
+
+# Sans backend partagé (QUEUE_CACHE_URL), la version de la file est propre au
+# processus : les écritures d'une autre instance ne la changent pas. L'état en
+# mémoire est alors relu au plus tard après ce délai.
+LOCAL_STATE_MAX_AGE_SECONDS = 15
 
 
 class QueueOptimizer:
@@ -56,48 +76,21 @@ class QueueOptimizer:
         
         Formule: Score = (UrgencyLevel * 100) - (RetardMinutes * 2) + BonusArrivée
         
+        Reconstruit l'état de la file depuis la base puis n'écrit que les
+        numéros de queue qui ont réellement changé.
+        
         Args:
             doctor_id: ID du profil médecin
             
         Returns:
             Liste ordonnée des RDV avec leur score de priorité
         """
-        today = date.today()
-        
-        # Récupérer tous les patients en attente pour aujourd'hui
-        waiting_appointments = Appointment.query.filter(
-            Appointment.doctor_id == doctor_id,
-            Appointment.appointment_date == today,
-            Appointment.status.in_(['waiting', 'checked_in'])
-        ).all()
-        
-        # Calculer le score de priorité pour chaque RDV
-        scored_appointments = []
-        for appt in waiting_appointments:
-            priority_score = self._calculate_priority_score(appt)
-            scored_appointments.append({
-                'appointment': appt,
-                'appointment_id': appt.id,
-                'patient_id': appt.patient_id,
-                'patient_name': appt.patient.name if appt.patient else 'Inconnu',
-                'priority_score': priority_score,
-                'urgency_level': appt.urgency_level or 1,
-                'is_shadow_slot': appt.is_shadow_slot,
-                'scheduled_time': appt.appointment_time,
-                'arrival_time': appt.arrival_time,
-                'status': appt.status
-            })
-        
-        # Trier par score décroissant (score le plus haut = priorité maximale)
-        scored_appointments.sort(key=lambda x: x['priority_score'], reverse=True)
-        
-        # Mettre à jour les numéros de queue
-        for idx, item in enumerate(scored_appointments, start=1):
-            item['appointment'].queue_number = idx
-        
-        db.session.commit()
+        state = get_queue_state(doctor_id, fresh=True)
+        if state.sync_queue_numbers():
+            db.session.commit()
+            queue_events.publish(STATUS_CHANGE, doctor_id)
         
-        return scored_appointments
+        return state.ordered()
     
     def _calculate_priority_score(self, appointment: Appointment) -> float:
         """
@@ -328,13 +321,13 @@ class QueueOptimizer:
                 for shadow_appt in shadow_present:
                     shadow_appt.booking_type = 'ticket'
                     # Donner un numéro de queue au shadow
-                    max_queue = db.session.query(db.func.max(Appointment.queue_number)).filter(
-                        Appointment.doctor_id == appointment.doctor_id,
-                        Appointment.appointment_date == appointment.appointment_date
-                    ).scalar() or 0
-                    shadow_appt.queue_number = max_queue + 1
+                    shadow_appt.queue_number = next_queue_number(
+                        appointment.doctor_id, appointment.appointment_date
+                    )
                 
                 db.session.commit()
+                for shadow_appt in shadow_present:
+                    notify_queue_change(shadow_appt)
                 
                 return {
                     'status': 'normal_priority',
@@ -478,6 +471,8 @@ class QueueOptimizer:
                         })
         
         db.session.commit()
+        if compressed_count:
+            queue_events.publish(COMPRESSION, doctor_id, today)
         
         return {
             'status': 'ok',
@@ -496,6 +491,30 @@ class QueueOptimizer:
         
         Met à jour le statut en 'suspected_missing' et retourne la liste.
         
+        Args:
+            doctor_id: ID du profil médecin
+            
+        Returns:
+            Liste des RDV suspectés comme no-shows
+        """
+        suspected_missing = self.find_no_shows(doctor_id)
+        
+        if suspected_missing:
+            overdue = Appointment.query.filter(
+                Appointment.id.in_([ns['appointment_id'] for ns in suspected_missing])
+            ).all()
+            for appt in overdue:
+                appt.status = 'suspected_missing'
+            db.session.commit()
+            for appt in overdue:
+                notify_queue_change(appt, NO_SHOW)
+        
+        return suspected_missing
+    
+    def find_no_shows(self, doctor_id: int) -> List[Dict]:
+        """
+        Variante en lecture seule de detect_no_shows : aucun statut n'est modifié.
+        
         Args:
             doctor_id: ID du profil médecin
             
@@ -504,10 +523,11 @@ class QueueOptimizer:
         """
         now = datetime.now()
         today = date.today()
-        threshold = now - timedelta(minutes=self.NO_SHOW_THRESHOLD_MINUTES)
         
         # Trouver les RDV confirmés sans check-in dont l'heure est dépassée de 15+ min
-        overdue_appointments = Appointment.query.filter(
+        overdue_appointments = Appointment.query.options(
+            joinedload(Appointment.patient)
+        ).filter(
             Appointment.doctor_id == doctor_id,
             Appointment.appointment_date == today,
             Appointment.status == 'confirmed',
@@ -522,9 +542,6 @@ class QueueOptimizer:
             
             # Si l'heure du RDV + 15 min est dépassée
             if appointment_dt + timedelta(minutes=self.NO_SHOW_THRESHOLD_MINUTES) < now:
-                # Marquer comme suspected_missing
-                appt.status = 'suspected_missing'
-                
                 suspected_missing.append({
                     'appointment_id': appt.id,
                     'patient_id': appt.patient_id,
@@ -535,9 +552,6 @@ class QueueOptimizer:
                     'action_suggested': 'Appeler le patient ou passer au suivant'
                 })
         
-        if suspected_missing:
-            db.session.commit()
-        
         return suspected_missing
     
     def confirm_no_show(self, appointment_id: int) -> Dict:
@@ -564,6 +578,7 @@ class QueueOptimizer:
             new_score = None
         
         db.session.commit()
+        notify_queue_change(appointment, NO_SHOW)
         
         return {
             'status': 'ok',
@@ -580,37 +595,36 @@ class QueueOptimizer:
         """
         Retourne l'état complet de la file d'attente d'un médecin.
         
+        Lecture seule : compteurs et ordre viennent de l'état incrémental
+        (QueueState), drift et no-shows du snapshot partagé de la file ;
+        aucun statut ni numéro de queue n'est écrit.
+        
         Args:
             doctor_id: ID du profil médecin
             
         Returns:
             Dict avec toutes les métriques de la file
         """
-        today = date.today()
+        from utils.queue_snapshot import get_queue_snapshot
+        
         now = datetime.now()
+        state = get_queue_state(doctor_id)
+        snapshot = get_queue_snapshot(doctor_id)
         
         # Statistiques par statut
-        status_counts = {}
-        for status in ['confirmed', 'waiting', 'checked_in', 'in_progress', 
-                       'completed', 'cancelled', 'no_show', 'suspected_missing']:
-            count = Appointment.query.filter(
-                Appointment.doctor_id == doctor_id,
-                Appointment.appointment_date == today,
-                Appointment.status == status
-            ).count()
-            status_counts[status] = count
+        status_counts = {status: state.counts.get(status, 0) for status in QUEUE_STATUSES}
         
         # File d'attente ordonnée
-        ordered_queue = self.reorder_queue(doctor_id)
+        ordered_queue = state.ordered()
         
         # Détection de drift
-        drift_info = self.detect_drift(doctor_id)
+        drift_info = snapshot.drift
         
         # No-shows suspectés
-        no_shows = self.detect_no_shows(doctor_id)
+        no_shows = snapshot.suspected_no_shows(now, self.NO_SHOW_THRESHOLD_MINUTES)
         
         # Temps d'attente estimé (20 min par patient en attente)
-        waiting_count = status_counts.get('waiting', 0) + status_counts.get('checked_in', 0)
+        waiting_count = state.waiting_count
         estimated_wait = waiting_count * 20  # minutes
         
         return {
@@ -687,6 +701,259 @@ class QueueOptimizer:
         return alerts
 
 
+# === ÉTAT INCRÉMENTAL DE LA FILE ===
+
+class QueueState:
+    """
+    État en mémoire de la file d'un médecin pour une journée.
+    
+    Construit une fois depuis la base (deux requêtes), puis tenu à jour
+    événement par événement : check-in, fin de consultation, no-show, walk-in.
+    
+    - Tas de priorité (score décroissant) avec suppression paresseuse : O(log n)
+    - Compteurs par statut : O(1)
+    - Numéros de queue écrits uniquement quand l'ordre change
+    """
+    
+    def __init__(self, doctor_id: int, day: date, optimizer: Optional['QueueOptimizer'] = None):
+        self.doctor_id = doctor_id
+        self.day = day
+        self.optimizer = optimizer or QueueOptimizer()
+        self.version = queue_events.version(doctor_id, day)
+        self.loaded_at = time.monotonic()
+        # Threads du worker (gthread) : événements et lectures sur le même état
+        self._lock = threading.RLock()
+        
+        self.counts: Dict[str, int] = {status: 0 for status in QUEUE_STATUSES}
+        self._statuses: Dict[int, str] = {}
+        
+        # Tas de (-score, appointment_id) ; une entrée n'est valide que si
+        # elle correspond encore à _keys[appointment_id]
+        self._heap: List[Tuple[float, int]] = []
+        self._keys: Dict[int, Tuple[float, int]] = {}
+        self._items: Dict[int, Dict] = {}
+        
+        # Numéros de queue tels qu'écrits en base
+        self._queue_numbers: Dict[int, Optional[int]] = {}
+    
+    @classmethod
+    def load(cls, doctor_id: int, day: date, optimizer: Optional['QueueOptimizer'] = None) -> 'QueueState':
+        """Construit l'état depuis la base : statuts du jour puis RDV en file."""
+        state = cls(doctor_id, day, optimizer)
+        
+        rows = db.session.query(Appointment.id, Appointment.status).filter(
+            Appointment.doctor_id == doctor_id,
+            Appointment.appointment_date == day
+        ).all()
+        for appointment_id, status in rows:
+            state._statuses[appointment_id] = status
+            state.counts[status] = state.counts.get(status, 0) + 1
+        
+        queued = Appointment.query.options(
+            *appointment_options('queue')
+        ).filter(
+            Appointment.doctor_id == doctor_id,
+            Appointment.appointment_date == day,
+            Appointment.status.in_(QUEUED_STATUSES)
+        ).all()
+        for appt in queued:
+            state._queue_numbers[appt.id] = appt.queue_number
+            state._push(appt)
+        
+        return state
+    
+    # ========================================
+    # TAS DE PRIORITÉ
+    # ========================================
+    
+    def _push(self, appointment: Appointment):
+        score = self.optimizer._calculate_priority_score(appointment)
+        key = (-score, appointment.id)
+        self._keys[appointment.id] = key
+        self._items[appointment.id] = {
+            'appointment_id': appointment.id,
+            'patient_id': appointment.patient_id,
+            'patient_name': appointment.patient.name if appointment.patient else 'Inconnu',
+            'priority_score': score,
+            'urgency_level': appointment.urgency_level or 1,
+            'is_shadow_slot': appointment.is_shadow_slot,
+            'scheduled_time': appointment.appointment_time,
+            'arrival_time': appointment.arrival_time,
+            'status': appointment.status
+        }
+        heapq.heappush(self._heap, key)
+    
+    def _discard(self, appointment_id: int):
+        if self._keys.pop(appointment_id, None) is None:
+            return
+        self._items.pop(appointment_id, None)
+        # Compactage quand les entrées mortes dominent le tas
+        if len(self._heap) > 2 * len(self._keys) + 16:
+            self._heap = list(self._keys.values())
+            heapq.heapify(self._heap)
+    
+    def _prune(self):
+        while self._heap and self._keys.get(self._heap[0][1]) != self._heap[0]:
+            heapq.heappop(self._heap)
+    
+    # ========================================
+    # ÉVÉNEMENTS
+    # ========================================
+    
+    def apply(self, appointment: Appointment):
+        """
+        Répercute le nouvel état d'un RDV du jour (check-in, fin, no-show, walk-in).
+        
+        Le statut précédent est celui connu de l'état, pas celui de la base.
+        """
+        if appointment.doctor_id != self.doctor_id or appointment.appointment_date != self.day:
+            return
+        with self._lock:
+            self._apply(appointment)
+    
+    def _apply(self, appointment: Appointment):
+        old_status = self._statuses.get(appointment.id)
+        new_status = appointment.status
+        if old_status is not None:
+            self.counts[old_status] = self.counts.get(old_status, 0) - 1
+        self.counts[new_status] = self.counts.get(new_status, 0) + 1
+        self._statuses[appointment.id] = new_status
+        
+        self._discard(appointment.id)
+        if new_status in QUEUED_STATUSES:
+            self._queue_numbers[appointment.id] = appointment.queue_number
+            self._push(appointment)
+        else:
+            self._queue_numbers.pop(appointment.id, None)
+    
+    # ========================================
+    # LECTURES (aucune écriture en base)
+    # ========================================
+    
+    def peek(self) -> Optional[Dict]:
+        """Patient prioritaire, sans trier toute la file."""
+        with self._lock:
+            self._prune()
+            if not self._heap:
+                return None
+            return self._items[self._heap[0][1]]
+    
+    def ordered(self) -> List[Dict]:
+        """File complète, du score le plus haut au plus bas."""
+        with self._lock:
+            return [self._items[appointment_id] for _, appointment_id in sorted(self._keys.values())]
+    
+    @property
+    def waiting_count(self) -> int:
+        return self.counts.get('waiting', 0) + self.counts.get('checked_in', 0)
+    
+    # ========================================
+    # PERSISTANCE
+    # ========================================
+    
+    def sync_queue_numbers(self) -> bool:
+        """
+        Aligne les numéros de queue en base sur l'ordre courant.
+        
+        Seuls les RDV dont la position a changé sont modifiés ; le commit
+        reste à la charge de l'appelant.
+        
+        Returns:
+            True si au moins un numéro a été modifié
+        """
+        with self._lock:
+            wanted = {
+                item['appointment_id']: position
+                for position, item in enumerate(self.ordered(), start=1)
+            }
+            changed = [
+                appointment_id for appointment_id, position in wanted.items()
+                if self._queue_numbers.get(appointment_id) != position
+            ]
+            if not changed:
+                return False
+            
+            for appt in Appointment.query.filter(Appointment.id.in_(changed)).all():
+                appt.queue_number = wanted[appt.id]
+                self._queue_numbers[appt.id] = wanted[appt.id]
+            return True
+
+
+# États chargés par ce processus, par (doctor_id, jour)
+_queue_states: Dict[Tuple[int, date], QueueState] = {}
+_queue_states_lock = threading.Lock()
+
+
+def _is_current(state: QueueState) -> bool:
+    if state.version != queue_events.version(state.doctor_id, state.day):
+        return False
+    if queue_events.shared:
+        return True
+    return time.monotonic() - state.loaded_at < LOCAL_STATE_MAX_AGE_SECONDS
+
+
+
+def get_queue_state(doctor_id: int, day: Optional[date] = None, fresh: bool = False) -> QueueState:
+    """
+    Retourne l'état de la file du jour, chargé depuis la base au premier accès.
+    
+    Rechargé aussi si la file a changé ailleurs (autre worker via le backend
+    partagé du bus d'événements ; sans backend partagé, après
+    LOCAL_STATE_MAX_AGE_SECONDS). `fresh=True` relit la base : à utiliser
+    avant d'écrire des numéros de queue calculés depuis l'état.
+    """
+    day = day or date.today()
+    key = (doctor_id, day)
+    with _queue_states_lock:
+        state = _queue_states.get(key)
+    if state is not None and not fresh and _is_current(state):
+        return state
+    
+    # Chargement hors verrou (requêtes SQL) ; le dernier chargé remplace l'autre
+    state = QueueState.load(doctor_id, day)
+    with _queue_states_lock:
+        # Les états des jours passés ne servent plus
+        for stale in [k for k in _queue_states if k[1] < date.today()]:
+            del _queue_states[stale]
+        _queue_states[key] = state
+    return state
+
+
+def invalidate_queue_state(doctor_id: int, day: Optional[date] = None):
+    """Oublie l'état en mémoire : il sera relu depuis la base au prochain accès."""
+    with _queue_states_lock:
+        _queue_states.pop((doctor_id, day or date.today()), None)
+
+
+def notify_queue_change(appointment: Appointment, event_type: str = STATUS_CHANGE):
+    """
+    Publie le changement d'un RDV sur le bus d'événements de la file.
+    
+    À appeler après le commit (check-in, fin, no-show, walk-in...). L'état
+    SmartFlow chargé est mis à jour en O(log n), les snapshots sont invalidés.
+    """
+    queue_events.publish(event_type, appointment.doctor_id, appointment.appointment_date, appointment)
+
+
+@queue_events.subscribe
+def _on_queue_event(event_type, doctor_id, day, appointment, version):
+    with _queue_states_lock:
+        state = _queue_states.get((doctor_id, day))
+    if state is None:
+        return
+    if appointment is None:
+        # Changement de masse (décalage, compression) : relecture complète
+        invalidate_queue_state(doctor_id, day)
+        return
+    with state._lock:
+        if version != state.version + 1:
+            # Événements manqués (publiés par un autre worker) : l'état n'est plus à jour
+            invalidate_queue_state(doctor_id, day)
+            return
+        state._apply(appointment)
+        state.version = version
+
+
 # === FONCTIONS UTILITAIRES EXPORTÉES ===
 
 def create_queue_optimizer() -> QueueOptimizer:
@@ -718,6 +985,7 @@ def book_with_shadow_check(patient_id: int, doctor_id: int, **kwargs) -> Tuple[A
     
     db.session.add(appointment)
     db.session.commit()
+    notify_queue_change(appointment)
     
     return appointment, is_shadow
 
@@ -762,10 +1030,14 @@ def process_checkin(appointment_id: int) -> Dict:
     # Résoudre les conflits shadow si nécessaire
     shadow_resolution = optimizer.handle_shadow_resolution(appointment_id)
     
-    db.session.commit()
+    # Numéros de queue écrits depuis la base relue (check-ins d'autres instances compris),
+    # seulement pour les RDV dont la position change
+    state = get_queue_state(appointment.doctor_id, appointment.appointment_date, fresh=True)
+    state.apply(appointment)
+    state.sync_queue_numbers()
     
-    # Réordonner la file
-    optimizer.reorder_queue(appointment.doctor_id)
+    db.session.commit()
+    notify_queue_change(appointment, CHECK_IN)
     
     return {
         'status': 'ok',
@@ -0,0 +1,149 @@
+"""
+TBIB - Profil de démarrage
+
+Avec TBIB_PROFILE_STARTUP=1, create_app() mesure :
+- le temps de chaque premier import de module (inclusif, et propre = hors
+  sous-modules importés au passage), dès le haut de app.py ;
+- le temps de chaque étape d'initialisation (extensions, utils.*, blueprints).
+
+Le rapport est écrit sur stderr à la fin de create_app() et gardé dans
+app.extensions['startup_profile'] :
+
+    TBIB_PROFILE_STARTUP=1 flask routes > /dev/null
+
+Sans la variable, le profil est inerte : aucun crochet d'import, step() ne
+mesure rien.
+"""
+
+import builtins
+import os
+import sys
+import threading
+import time
+from contextlib import contextmanager
+from importlib.util import resolve_name
+from typing import Dict, List, Optional
+
+ENV_FLAG = 'TBIB_PROFILE_STARTUP'
+REPORT_LIMIT = 20
+
+
+def _enabled_from_env() -> bool:
+    return os.environ.get(ENV_FLAG, '').lower() in ('1', 'true', 't')
+
+
+class StartupProfile:
+    def __init__(self, enabled: Optional[bool] = None):
+        self.enabled = _enabled_from_env() if enabled is None else enabled
+        self.imports: Dict[str, Dict[str, float]] = {}
+        self.steps: List[Dict[str, float]] = []
+        self._started: Optional[float] = None
+        self._original_import = None
+        self._thread: Optional[int] = None
+        # Temps des imports enfants, un compteur par import en cours
+        self._children: List[float] = []
+
+    # ========================================
+    # CROCHET D'IMPORT
+    # ========================================
+
+    def start(self):
+        """Pose le crochet d'import (idempotent) ; sans effet si le profil est désactivé."""
+        if not self.enabled:
+            return
+        if self._started is None:
+            self._started = time.perf_counter()
+        if self._original_import is None:
+            self._original_import = builtins.__import__
+            self._thread = threading.get_ident()
+            builtins.__import__ = self._import
+
+    def stop(self):
+        if self._original_import is not None:
+            builtins.__import__ = self._original_import
+            self._original_import = None
+
+    def _import(self, name, globals=None, locals=None, fromlist=(), level=0):
+        original = self._original_import
+        if threading.get_ident() != self._thread:
+            return original(name, globals, locals, fromlist, level)
+        try:
+            module_name = resolve_name('.' * level + name, (globals or {}).get('__package__')) if level else name
+        except (ImportError, ValueError):
+            module_name = name
+        if module_name not in sys.modules:
+            targets = [module_name]
+        else:
+            # `from utils import rollups` : le paquet est déjà là, le sous-module peut-être pas
+            package = sys.modules[module_name]
+            targets = [f"{module_name}.{item}" for item in fromlist or ()
+                       if item != '*' and not hasattr(package, item)]
+        targets = [target for target in targets if target not in sys.modules and target not in self.imports]
+        if not targets:
+            return original(name, globals, locals, fromlist, level)
+
+        self._children.append(0.0)
+        started = time.perf_counter()
+        try:
+            return original(name, globals, locals, fromlist, level)
+        finally:
+            elapsed = time.perf_counter() - started
+            children = self._children.pop()
+            if self._children:
+                self._children[-1] += elapsed
+            # Un module introuvable (dépendance optionnelle absente) n'est pas compté
+            loaded = [target for target in targets if target in sys.modules]
+            if loaded:
+                self.imports[', '.join(loaded)] = {'inclusive': elapsed, 'self': elapsed - children}
+
+    # ========================================
+    # ÉTAPES D'INITIALISATION
+    # ========================================
+
+    @contextmanager
+    def step(self, name: str):
+        if not self.enabled:
+            yield
+            return
+        started = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.steps.append({'name': name, 'seconds': time.perf_counter() - started})
+
+    # ========================================
+    # RAPPORT
+    # ========================================
+
+    def finish(self, app) -> Optional[dict]:
+        """Retire le crochet, range le rapport dans l'application et l'écrit sur stderr."""
+        if not self.enabled:
+            return None
+        self.stop()
+        report = {
+            'total': time.perf_counter() - (self._started or time.perf_counter()),
+            'steps': list(self.steps),
+            'imports': sorted(({'module': module, **timings} for module, timings in self.imports.items()),
+                              key=lambda entry: entry['self'], reverse=True),
+        }
+        app.extensions['startup_profile'] = report
+        print(format_report(report), file=sys.stderr)
+
+        # Une autre application (tests, workers) repart d'un profil vierge
+        self.steps = []
+        self.imports = {}
+        self._started = None
+        return report
+
+
+def format_report(report: dict, limit: int = REPORT_LIMIT) -> str:
+    lines = [f"Démarrage TBIB : {report['total'] * 1000:.1f} ms", "Étapes :"]
+    for entry in report['steps']:
+        lines.append(f"  {entry['seconds'] * 1000:8.1f} ms  {entry['name']}")
+    lines.append(f"Imports ({len(report['imports'])} modules, {limit} plus coûteux en temps propre) :")
+    for entry in report['imports'][:limit]:
+        lines.append(f"  {entry['self'] * 1000:8.1f} ms  (inclusif {entry['inclusive'] * 1000:7.1f} ms)  {entry['module']}")
+    return '\n'.join(lines)
+
+
+startup_profile = StartupProfile()
@@ -0,0 +1,60 @@
+"""
+TBIB - Outils communs des tables tenues à jour par événements SQLAlchemy
+
+Les agrégats (utils/rollups) et la liste des patients (utils/patient_roster)
+sont écrits depuis les événements after_insert / after_update / after_delete,
+sur la connexion du flush :
+
+- insert_missing() crée une ligne si elle n'existe pas, sans écraser celle
+  qu'une transaction concurrente vient de créer ;
+- keep_previous_values() et previous_value() donnent l'ancienne valeur d'un
+  attribut modifié, même s'il était expiré (objet modifié après un commit).
+"""
+
+from typing import Dict, Sequence
+
+from sqlalchemy import event, insert
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.exc import IntegrityError
+
+# Dialectes avec INSERT ... ON CONFLICT DO NOTHING
+_UPSERT_DIALECTS = {
+    'postgresql': pg_insert,
+    'sqlite': sqlite_insert,
+}
+
+
+def insert_missing(connection, table, values: Dict, index_elements: Sequence[str]):
+    """INSERT de `values`, ignoré si la clé unique `index_elements` existe déjà."""
+    dialect = connection.dialect.name
+    if dialect in _UPSERT_DIALECTS:
+        connection.execute(_UPSERT_DIALECTS[dialect](table).values(**values).on_conflict_do_nothing(
+            index_elements=list(index_elements)))
+        return
+
+    try:
+        with connection.begin_nested():
+            connection.execute(insert(table).values(**values))
+    except IntegrityError:
+        pass  # Créée entre-temps par une autre transaction
+
+
+def _keep_previous_value(target, value, oldvalue, initiator):
+    pass
+
+
+def keep_previous_values(*attributes):
+    """
+    active_history sur ces attributs : l'ancienne valeur est chargée avant
+    d'être remplacée, sinon l'événement after_update ne la connaît pas.
+    """
+    for attribute in attributes:
+        if not event.contains(attribute, 'set', _keep_previous_value):
+            event.listen(attribute, 'set', _keep_previous_value, active_history=True)
+
+
+def previous_value(state, field: str):
+    """Valeur de `field` avant le flush en cours (la valeur actuelle si inchangée)."""
+    history = state.attrs[field].history
+    return history.deleted[0] if history.deleted else getattr(state.object, field)